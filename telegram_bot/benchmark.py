@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк калькулятора премий: режим 'float' против целочисленного 'kopeck'
+Запуск: python benchmark.py [--rows 100000] [--scalar-rows 5000]
+        python benchmark.py --cold-start 20   (холодный старт: чтение и компиляция тарифа)
+        python benchmark.py --import-time 20  (импорт ядра без токена, .env и telegram)
+"""
+
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from calculator_v2 import PremiumCalculator, OPERATION_IDS, KPI_IDS, compile_tariff_timeline
+from premium_config import POSITIONS_CONFIG, DEFAULT_TARIFF_FILE
+from tariff_store import read_tariff_file
+
+def make_dataset(rows: int, seed: int = 42) -> dict:
+    """Случайный набор сотрудников в столбцовом виде"""
+    rng = random.Random(seed)
+    positions = [rng.choice(list(POSITIONS_CONFIG)) for _ in range(rows)]
+    quantities = np.zeros((rows, len(OPERATION_IDS)))
+    kpi_values = np.zeros((rows, len(KPI_IDS)))
+    
+    for i, position in enumerate(positions):
+        position_config = POSITIONS_CONFIG[position]
+        for j, op_id in enumerate(OPERATION_IDS):
+            if op_id in position_config['operations'] and rng.random() < 0.5:
+                quantities[i, j] = rng.choice([1, 5, 20, 75, 120, 250, 1500.5])
+        for j, kpi_id in enumerate(KPI_IDS):
+            if kpi_id in position_config['kpi']:
+                kpi_values[i, j] = rng.choice([75, 85, 92, 100, 110])
+    
+    return {
+        'positions': positions,
+        'base_salary': np.full(rows, 45000.0),
+        'position_rate': np.array([rng.choice([0.5, 1.0]) for _ in range(rows)]),
+        'quantities': quantities,
+        'kpi_values': kpi_values,
+        'team_coefficients': {
+            'service': np.array([rng.choice([85, 92, 97]) for _ in range(rows)], dtype=float),
+            'speed_reception': np.full(rows, 1.5),
+            'speed_delivery': np.full(rows, 0.5),
+            'efficiency': np.array([rng.choice([90, 105]) for _ in range(rows)], dtype=float)
+        }
+    }
+
+def bench_scalar(calculator: PremiumCalculator, data: dict, rows: int) -> float:
+    """Построчный calculate_premium, строк в секунду"""
+    requests = []
+    for i in range(rows):
+        position = data['positions'][i]
+        position_config = POSITIONS_CONFIG[position]
+        operations = {
+            op_id: data['quantities'][i, j]
+            for j, op_id in enumerate(OPERATION_IDS) if data['quantities'][i, j] > 0
+        }
+        kpi_values = {
+            kpi_id: data['kpi_values'][i, j]
+            for j, kpi_id in enumerate(KPI_IDS) if kpi_id in position_config['kpi']
+        }
+        team_coefficients = {
+            coeff_id: data['team_coefficients'][coeff_id][i]
+            for coeff_id in position_config['teamCoefficients']
+        }
+        requests.append((
+            position, data['base_salary'][i], data['position_rate'][i],
+            operations, kpi_values, team_coefficients
+        ))
+    
+    start = time.perf_counter()
+    for request in requests:
+        calculator.calculate_premium(*request)
+    return rows / (time.perf_counter() - start)
+
+def bench_batch(calculator: PremiumCalculator, data: dict, repeat: int = 3) -> float:
+    """calculate_premium_batch, строк в секунду (лучший из повторов)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        calculator.calculate_premium_batch(**data)
+        best = min(best, time.perf_counter() - start)
+    return len(data['positions']) / best
+
+def bench_cold_start(runs: int) -> None:
+    """Холодный старт: из чего складывается готовность тарифа в новом процессе"""
+    for name, build in (
+        ('чтение файла', lambda: read_tariff_file(DEFAULT_TARIFF_FILE)),
+        ('компиляция', compile_tariff_timeline)
+    ):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            build()
+            samples.append(time.perf_counter() - start)
+        print(f"  тариф, {name:<14}: {statistics.median(samples) * 1000:>8.3f} мс")
+    
+    # Новый процесс: интерпретатор, numpy, импорт калькулятора (тариф не читается)
+    # и первое обращение к тарифу (запуски чередуются)
+    variants = (
+        ('интерпретатор', 'pass'),
+        ('numpy', 'import numpy'),
+        ('калькулятор', 'import calculator_v2'),
+        ('с тарифом', 'import calculator_v2; calculator_v2.tariff_timeline()')
+    )
+    samples = {name: [] for name, _ in variants}
+    for _ in range(runs):
+        for name, code in variants:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], check=True)
+            samples[name].append(time.perf_counter() - start)
+    for name, _ in variants:
+        print(f"  процесс, {name:<13}: {statistics.median(samples[name]) * 1000:>8.1f} мс")
+
+# Импорт ядра в чистом процессе: numpy отдельно, затем calculator_v2 (окружение бота и тарифы не загружаются)
+_IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import numpy
+numpy_done = time.perf_counter()
+import calculator_v2
+core_done = time.perf_counter()
+loaded = [name for name in ('dotenv', 'telegram', 'config_v2') if name in sys.modules]
+if calculator_v2._ACTIVE_TIMELINE is not None:
+    loaded.append('tariffs.json')
+print(numpy_done - start, core_done - numpy_done, ','.join(loaded))
+"""
+
+# Предел импорта ядра сверх numpy, мс
+IMPORT_BUDGET_MS = 50.0
+
+def bench_import(runs: int) -> bool:
+    """Время импорта calculator_v2 без TELEGRAM_BOT_TOKEN; False - ядро тянет окружение бота или медленно"""
+    env = {name: value for name, value in os.environ.items() if name != 'TELEGRAM_BOT_TOKEN'}
+    numpy_samples, core_samples = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', _IMPORT_PROBE], env=env, check=True, capture_output=True, text=True
+        ).stdout.split()
+        numpy_samples.append(float(output[0]))
+        core_samples.append(float(output[1]))
+        if len(output) > 2:
+            print(f"❌ Импорт ядра загружает {output[2]}")
+            return False
+    
+    core_ms = statistics.median(core_samples) * 1000
+    print(f"  numpy        : {statistics.median(numpy_samples) * 1000:>8.1f} мс")
+    print(f"  calculator_v2: {core_ms:>8.1f} мс (без numpy, предел {IMPORT_BUDGET_MS:.0f} мс)")
+    return core_ms <= IMPORT_BUDGET_MS
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк режимов денежной арифметики")
+    parser.add_argument('--rows', type=int, default=100000, help="строк для пакетного расчета")
+    parser.add_argument('--scalar-rows', type=int, default=5000, help="строк для построчного расчета")
+    parser.add_argument('--cold-start', type=int, metavar='RUNS', help="замерить холодный старт (RUNS повторов)")
+    parser.add_argument('--import-time', type=int, metavar='RUNS', help="замерить импорт ядра (RUNS повторов)")
+    args = parser.parse_args()
+    
+    if args.import_time:
+        print(f"📦 Импорт ядра, медиана {args.import_time} повторов")
+        return 0 if bench_import(args.import_time) else 1
+    
+    if args.cold_start:
+        print(f"🚀 Холодный старт, медиана {args.cold_start} повторов")
+        bench_cold_start(args.cold_start)
+        return
+    
+    data = make_dataset(args.rows)
+    print(f"📊 Строк: пакет {args.rows}, построчно {min(args.scalar_rows, args.rows)}")
+    
+    results = {}
+    for mode in ('float', 'kopeck'):
+        calculator = PremiumCalculator(money_mode=mode)
+        results[mode] = (
+            bench_scalar(calculator, data, min(args.scalar_rows, args.rows)),
+            bench_batch(calculator, data)
+        )
+        print(f"  {mode:<7} построчно: {results[mode][0]:>12,.0f} строк/с   пакет: {results[mode][1]:>12,.0f} строк/с")
+    
+    scalar_cost = results['float'][0] / results['kopeck'][0]
+    batch_cost = results['float'][1] / results['kopeck'][1]
+    print(f"⏱️ Стоимость режима 'kopeck': построчно ×{scalar_cost:.2f}, пакет ×{batch_cost:.2f}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,7 +21,7 @@ from config_v2 import (
     KPI_CONFIG, TEAM_COEFFICIENTS_CONFIG, POSITION_RATES,
     UserState
 )
-from calculator_v2 import PremiumCalculator, format_money, format_percent
+from calculator_v2 import PremiumCalculator, active_tariff, format_money, format_percent
 
 # Настройка логирования
 logging.basicConfig(
@@ -75,10 +75,11 @@ class PremiumBot:
         """Команда /operations - список всех операций"""
         text = "📊 <b>Все операции в системе:</b>\n\n"
         
+        tariff = active_tariff()
         for op_id, op_config in OPERATIONS_CONFIG.items():
             emoji = op_config.get('emoji', '📊')
             name = op_config['name']
-            rate = op_config['rate']
+            rate = tariff.operations[op_id].display_rate
             text += f"{emoji} <b>{op_id}.</b> {name}\n    {rate}_\n\n"
         
         # Разделяем на части если слишком длинное
@@ -137,7 +138,7 @@ class PremiumBot:
         """Обработка выбора должности"""
         query = update.callback_query
         await query.answer()
-        
+                 
                  user_id = update.effective_user.id
          position = query.data.replace("pos_", "")
         
@@ -199,7 +200,7 @@ class PremiumBot:
             )
             
             return ENTERING_RATE
-            
+        
         except ValueError:
             await update.message.reply_text(
                 "❌ Некорректный размер оклада. "
@@ -273,7 +274,7 @@ class PremiumBot:
             )
             
             return ENTERING_OPERATIONS
-            
+        
         except (ValueError, IndexError) as e:
             await update.message.reply_text(
                 f"❌ Ошибка: {str(e)}\n"
@@ -404,7 +405,7 @@ class PremiumBot:
             )
             
             return ENTERING_KPI
-            
+        
         except (ValueError, IndexError) as e:
             await update.message.reply_text(
                 f"❌ Ошибка: {str(e)}\n"
@@ -451,7 +452,7 @@ class PremiumBot:
             )
             
             return ENTERING_COEFFICIENTS
-            
+        
         except (ValueError, IndexError) as e:
             await update.message.reply_text(
                 f"❌ Ошибка: {str(e)}\n"
@@ -548,7 +549,7 @@ class PremiumBot:
             )
             
             return SHOWING_RESULTS
-            
+        
         except Exception as e:
             logger.error(f"Ошибка расчета для пользователя {user_id}: {e}")
             await update.message.reply_text(
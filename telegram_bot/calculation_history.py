@@ -0,0 +1,206 @@
+"""
+История расчетов премий в SQLite (WAL)
+Запись идет пачками из асинхронной очереди в отдельном потоке - цикл событий бота
+не ждет диска. Индексы (user_id, month) и (position, month) делают выборки
+"мои последние расчеты" и статистику по должности одним проходом по диапазону индекса.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from calculator_v2 import CalculationRequest, CalculationResult, active_tariff
+from premium_archive import check_month
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calculations (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    month TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    position TEXT NOT NULL,
+    base_salary REAL NOT NULL,
+    position_rate REAL NOT NULL,
+    inputs TEXT NOT NULL,
+    total_premium REAL NOT NULL,
+    operation_bonus REAL NOT NULL,
+    kpi_bonus REAL NOT NULL,
+    real_salary REAL NOT NULL,
+    config_version TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calculations_user_month ON calculations (user_id, month);
+CREATE INDEX IF NOT EXISTS calculations_position_month ON calculations (position, month);
+"""
+
+INSERT = """
+INSERT INTO calculations (
+    user_id, month, created_at, position, base_salary, position_rate, inputs,
+    total_premium, operation_bonus, kpi_bonus, real_salary, config_version
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 1.0  # секунды ожидания добора пачки
+
+# Строка таблицы calculations без id
+HistoryRow = Tuple[int, str, float, str, float, float, str, float, float, float, float, str]
+
+def connect(path: str) -> sqlite3.Connection:
+    """Соединение с базой истории: WAL, схема и индексы"""
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+def history_row(
+    user_id: int,
+    request: CalculationRequest,
+    result: CalculationResult,
+    month: str,
+    created_at: Optional[float] = None,
+    config_version: Optional[str] = None
+) -> HistoryRow:
+    """Строка истории: входные данные запроса (JSON) и итоги расчета
+    
+    month ("ГГГГ-ММ") - расчетный период, его передает вызывающий код: расчет за прошлый
+    месяц, сделанный в начале следующего, относится к прошлому месяцу, а не к дате записи.
+    config_version - версия тарифа, по которой считали (по умолчанию - текущая).
+    """
+    check_month(month)
+    created_at = time.time() if created_at is None else created_at
+    inputs = {
+        'operations': {str(op_id): quantity for op_id, quantity in request.operations.items()},
+        'kpi_values': dict(request.kpi_values),
+        'team_coefficients': dict(request.team_coefficients),
+        'subordinates_bonus': request.subordinates_bonus,
+        'pvz_work_schedule': request.pvz_work_schedule,
+        'pvz_rating': request.pvz_rating
+    }
+    return (
+        user_id, month, created_at,
+        request.position, request.base_salary, request.position_rate,
+        json.dumps(inputs, ensure_ascii=False, separators=(',', ':')),
+        result.total_premium, result.operation_bonus, result.kpi_bonus, result.real_salary,
+        config_version or active_tariff().version
+    )
+
+class CalculationHistory:
+    """История расчетов: record() только кладет строку в очередь, запись - фоновой задачей"""
+    
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        # Все обращения к соединению - из одного потока
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+        self._connection: Optional[sqlite3.Connection] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self) -> None:
+        """Открыть базу и запустить фоновую запись (вызывать внутри цикла событий)"""
+        loop = asyncio.get_running_loop()
+        self._connection = await loop.run_in_executor(self._executor, connect, self.path)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._writer())
+    
+    async def stop(self) -> None:
+        """Дописать очередь и закрыть базу"""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+            self._queue = None
+        if self._connection is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
+    
+    def record(
+        self,
+        user_id: int,
+        request: CalculationRequest,
+        result: CalculationResult,
+        month: str,
+        config_version: Optional[str] = None
+    ) -> None:
+        """Поставить расчет в очередь записи (не блокирует); month - расчетный период, config_version - тариф расчета"""
+        if self._queue is None:
+            logger.warning("История расчетов не запущена, расчет не сохранен")
+            return
+        self._queue.put_nowait(history_row(user_id, request, result, month, config_version=config_version))
+    
+    async def _writer(self) -> None:
+        """Фоновая задача: собирает пачку из очереди и пишет ее одной транзакцией"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is None:
+                break
+            
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            
+            try:
+                await loop.run_in_executor(self._executor, self._write_batch, batch)
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи истории расчетов ({len(batch)} строк): {e}")
+    
+    def _write_batch(self, batch: List[HistoryRow]) -> None:
+        """Пачка строк одной транзакцией (поток истории)"""
+        with self._connection:
+            self._connection.executemany(INSERT, batch)
+    
+    async def _query(self, sql: str, parameters: Tuple) -> List[Dict[str, Any]]:
+        def query():
+            cursor = self._connection.execute(sql, parameters)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return await asyncio.get_running_loop().run_in_executor(self._executor, query)
+    
+    async def last_results(self, user_id: int, limit: int = 5) -> List[Dict[str, Any]]:
+        """Последние расчеты пользователя (проход по индексу (user_id, month) с конца)"""
+        return await self._query(
+            "SELECT month, created_at, position, total_premium, operation_bonus, kpi_bonus, real_salary "
+            "FROM calculations WHERE user_id = ? ORDER BY month DESC, id DESC LIMIT ?",
+            (user_id, limit)
+        )
+    
+    async def position_stats(
+        self,
+        position: str,
+        month_from: Optional[str] = None,
+        month_to: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Число расчетов, средняя, минимальная и максимальная премия по должности за месяцы"""
+        rows = await self._query(
+            "SELECT COUNT(*) AS count, AVG(total_premium) AS average, "
+            "MIN(total_premium) AS minimum, MAX(total_premium) AS maximum "
+            "FROM calculations WHERE position = ? AND month BETWEEN ? AND ?",
+            (position, month_from or '', month_to or '9999-12')
+        )
+        return rows[0]
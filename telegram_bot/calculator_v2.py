@@ -3,31 +3,818 @@
 Синхронизирован с HTML калькулятором премий ОПС
 """
 
-from typing import Dict, List, Tuple, Optional
+import copy
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Tuple, Optional, Sequence, Mapping, NamedTuple, FrozenSet
 from dataclasses import dataclass
-from config_v2 import OPERATIONS_CONFIG, POSITIONS_CONFIG, KPI_CONFIG, KPI_WEIGHTS
+from datetime import date, datetime
+import numpy as np
+from premium_config import OPERATIONS_CONFIG, POSITIONS_CONFIG, KPI_CONFIG, DEFAULT_TARIFF_FILE
+from tariff_store import TARIFF_SECTIONS, read_tariff_file
 
-@dataclass
+# Порядок столбцов для пакетного расчета (матрица количеств операций, КПИ)
+OPERATION_IDS: Tuple[int, ...] = tuple(sorted(OPERATIONS_CONFIG))
+KPI_IDS: Tuple[str, ...] = tuple(KPI_CONFIG)
+
+@dataclass(frozen=True, eq=False)
+class StepTable:
+    """Скомпилированная ступенчатая шкала: значение >= порога → коэффициент"""
+    thresholds: Tuple[float, ...]
+    values: Tuple[float, ...]  # values[i] действует от thresholds[i-1] до thresholds[i]
+    zero_value: Optional[float]
+    thresholds_array: np.ndarray
+    values_array: np.ndarray
+    
+    def lookup(self, value: float) -> float:
+        """Коэффициент для одного значения (бинарный поиск)"""
+        if self.zero_value is not None and value == 0:
+            return self.zero_value
+        return self.values[bisect_right(self.thresholds, value)]
+    
+    def lookup_array(self, value: np.ndarray) -> np.ndarray:
+        """Коэффициенты для массива значений за один проход"""
+        value = np.asarray(value, dtype=float)
+        result = self.values_array[np.searchsorted(self.thresholds_array, value, side='right')]
+        if self.zero_value is not None:
+            result = np.where(value == 0, self.zero_value, result)
+        return result
+
+def compile_step_table(spec: Dict) -> StepTable:
+    """Компиляция шкалы из тарифа (kpi_thresholds, team_coefficient_thresholds)"""
+    steps = sorted((float(threshold), float(coeff)) for threshold, coeff in spec['steps'])
+    thresholds = tuple(threshold for threshold, _ in steps)
+    if len(set(thresholds)) != len(thresholds):
+        raise ValueError(f"Повторяющиеся пороги в шкале: {thresholds}")
+    
+    values = (float(spec.get('default', 0.0)),) + tuple(coeff for _, coeff in steps)
+    zero_value = spec.get('zero')
+    
+    thresholds_array = np.array(thresholds, dtype=float)
+    values_array = np.array(values, dtype=float)
+    thresholds_array.flags.writeable = False
+    values_array.flags.writeable = False
+    
+    return StepTable(
+        thresholds=thresholds,
+        values=values,
+        zero_value=None if zero_value is None else float(zero_value),
+        thresholds_array=thresholds_array,
+        values_array=values_array
+    )
+
+def compile_pvz_wb_tariff(config: Dict) -> np.ndarray:
+    """Куб тарифа ПВЗ WB: [диапазон количества, режим работы, диапазон рейтинга] → WB1 + WB2"""
+    wb1 = np.array(config['wb1'], dtype=float)
+    wb2 = np.array(config['wb2'], dtype=float)
+    bands = len(config['quantity_bands']) + 1
+    if wb1.shape != (bands, len(config['schedules'])):
+        raise ValueError(f"Таблица WB1 должна иметь размер ({bands}, {len(config['schedules'])})")
+    if wb2.shape != (bands, len(config['rating_thresholds']) + 2):
+        raise ValueError(f"Таблица WB2 должна иметь размер ({bands}, {len(config['rating_thresholds']) + 2})")
+    
+    tariff = wb1[:, :, np.newaxis] + wb2[:, np.newaxis, :]
+    tariff.flags.writeable = False
+    return tariff
+
+# Целочисленный режим: деньги в копейках, коэффициенты и доли в базисных пунктах (1/10000)
+MONEY_MODES = ('float', 'kopeck')
+BASIS_POINTS = 10000
+KPI_SHARE_BP = 2000                         # базовая сумма КПИ = 20% от оклада
+KPI_FALLBACK_SALARY_KOPECKS = 150000 * 100  # база КПИ, если оклад или ставка не заданы
+
+def to_kopecks(amount: float) -> int:
+    """Рубли → копейки (округление половины вверх); для количеств - сотые доли единицы
+    
+    Произведение сначала округляется до 1e-6: 1.005 * 100 = 100.49999999999999 в float,
+    без этого шага 1.005 ₽ превратились бы в 100 копеек вместо 101.
+    """
+    return int(math.floor(round(amount * 100, 6) + 0.5))
+
+def to_basis_points(value: float) -> int:
+    """Коэффициент → базисные пункты (1.5 → 15000), половина вверх как в to_kopecks"""
+    return int(math.floor(round(value * BASIS_POINTS, 6) + 0.5))
+
+def to_kopecks_array(amount: np.ndarray) -> np.ndarray:
+    """Векторный аналог to_kopecks"""
+    return np.floor(np.round(np.asarray(amount, dtype=float) * 100, 6) + 0.5).astype(np.int64)
+
+def to_basis_points_array(value: np.ndarray) -> np.ndarray:
+    """Векторный аналог to_basis_points"""
+    return np.floor(np.round(np.asarray(value, dtype=float) * BASIS_POINTS, 6) + 0.5).astype(np.int64)
+
+def round_div(numerator, denominator):
+    """Целочисленное деление с округлением половины вверх (int и массивы int64)"""
+    return (2 * numerator + denominator) // (2 * denominator)
+
+def from_kopecks(amount: int) -> float:
+    """Копейки → рубли (для вывода)"""
+    return amount / 100
+
+def _kopeck_salary(base_salary: float, position_rate: float) -> int:
+    """Реальный оклад (оклад × ставка) в копейках"""
+    return round_div(to_kopecks(base_salary) * to_basis_points(position_rate), BASIS_POINTS)
+
+def _operation_kopeck_rate(op_config: Dict) -> Tuple[int, int]:
+    """Тариф операции как дробь: бонус_коп = количество_сотых × множитель / делитель"""
+    if op_config['type'] == 'fixed':
+        return to_kopecks(op_config['value']), 100             # копеек за единицу
+    if op_config['type'] == 'percent':
+        return to_basis_points(op_config['value']), BASIS_POINTS  # доля от суммы в копейках
+    return 0, 1
+
+# Исходные данные действующего тарифа: читаются из файла тарифов при первом обращении
+# (tariff_timeline) или задаются install_tariffs
+_TARIFF_SOURCES: Optional[Dict[str, Any]] = None
+_TARIFF_VERSIONS: List[Dict[str, Any]] = []
+
+def base_tariff_sources() -> Dict[str, Any]:
+    """Исходные данные действующего тарифа (без версий)"""
+    tariff_timeline()
+    return _TARIFF_SOURCES
+
+def tariff_versions() -> List[Dict[str, Any]]:
+    """Версии действующего тарифа с датами вступления в силу"""
+    tariff_timeline()
+    return _TARIFF_VERSIONS
+
+def tariff_sources(data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Исходные данные тарифа и версии из проверенных данных файла (tariff_store.parse_tariff_data)
+    
+    Описания операций (название, эмодзи) берутся из OPERATIONS_CONFIG и копируются:
+    справочник premium_config не меняется.
+    """
+    operations = data['operations']
+    if set(operations) != set(OPERATION_IDS):
+        raise ValueError(f"Тарифы должны задавать операции {list(OPERATION_IDS)}, заданы {sorted(operations)}")
+    
+    sources = {section: data[section] for section in TARIFF_SECTIONS}
+    sources['operations'] = {
+        op_id: {**OPERATIONS_CONFIG[op_id], **op_tariff} for op_id, op_tariff in sorted(operations.items())
+    }
+    return sources, data.get('versions', [])
+
+def apply_tariff_version(sources: Dict[str, Any], version: Dict[str, Any]) -> Dict[str, Any]:
+    """Наложить версию тарифа: поля операций, веса КПИ должностей и PVZ WB - по ключам,
+    шкалы - целиком"""
+    unknown = set(version) - set(TARIFF_SECTIONS) - {'effective_from'}
+    if unknown:
+        raise ValueError(f"Неизвестные разделы версии тарифа: {', '.join(sorted(unknown))}")
+    
+    result = dict(sources)
+    operations = version.get('operations', {})
+    if operations:
+        missing = set(operations) - set(sources['operations'])
+        if missing:
+            raise ValueError(f"Версия тарифа {version.get('effective_from')}: нет операций {sorted(missing)}")
+        result['operations'] = {
+            op_id: {**op_config, **operations.get(op_id, {})} for op_id, op_config in sources['operations'].items()
+        }
+    if version.get('kpi_weights'):
+        result['kpi_weights'] = {**sources['kpi_weights'], **version['kpi_weights']}
+    for section in ('kpi_thresholds', 'team_coefficient_thresholds'):
+        if version.get(section):
+            result[section] = {**sources[section], **version[section]}
+    if version.get('pvz_wb'):
+        result['pvz_wb'] = {**sources['pvz_wb'], **version['pvz_wb']}
+    return result
+
+def compute_config_version(sources: Optional[Dict[str, Any]] = None) -> str:
+    """Отпечаток тарифной конфигурации (для ключей кэша результатов)"""
+    sources = sources or base_tariff_sources()
+    payload = json.dumps(
+        [sources['operations'], POSITIONS_CONFIG, sources['kpi_weights'], sources['kpi_thresholds'],
+         sources['team_coefficient_thresholds'], sources['pvz_wb']],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def compute_timeline_version(
+    sources: Optional[Dict[str, Any]] = None,
+    versions: Optional[List[Dict[str, Any]]] = None
+) -> str:
+    """Отпечаток конфигурации вместе с версиями тарифов"""
+    versions = _TARIFF_VERSIONS if versions is None else versions
+    payload = json.dumps(versions, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{compute_config_version(sources)}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
+
+class CompiledOperation(NamedTuple):
+    """Операция в скомпилированном виде"""
+    op_id: int
+    rate: Optional[float]   # тариф за единицу (доля для процентных); None - ПВЗ WB по кубу тарифа
+    slot: int               # коэффициент: 0 - без, 1 - обслуживание, 2 - скорость приема, 3 - скорость доставки
+    kopeck_multiplier: int
+    kopeck_divisor: int
+    display_rate: str = ''  # ставка для показа ("50₽/шт")
+    operation_type: int = 1
+
+@dataclass(frozen=True, eq=False)
+class CompiledPosition:
+    """Скомпилированный расчет операций одной должности"""
+    position: str
+    operations: Tuple[CompiledOperation, ...]
+    operation_ids: FrozenSet[int]
+
+@dataclass(frozen=True, eq=False)
+class CompiledTariff:
+    """Тарифная конфигурация, подготовленная для горячего пути расчета"""
+    version: str
+    kpi_tables: Dict[str, StepTable]
+    team_tables: Dict[str, StepTable]
+    pvz_wb_tariff: np.ndarray
+    pvz_wb_rows: Tuple
+    pvz_quantity_bands: Tuple[int, ...]
+    pvz_rating_thresholds: Tuple[float, ...]
+    pvz_schedule_index: Dict[str, int]
+    operations: Dict[int, CompiledOperation]
+    positions: Dict[str, CompiledPosition]
+    kpi_weights: Dict[str, Dict[str, float]]
+
+def compile_operation(op_id: int, op_config: Dict) -> CompiledOperation:
+    """Компиляция операции: тариф и слот коэффициента вместо разбора type/operationType"""
+    operation_type = op_config.get('operationType', 1)
+    
+    if op_id == 13:  # Обеспечение ПВЗ WB
+        rate = None
+    elif op_config['type'] in ('fixed', 'percent'):
+        rate = float(op_config['value'])
+    else:
+        rate = 0.0
+    
+    return CompiledOperation(
+        op_id, rate, operation_type - 1 if operation_type in (2, 3, 4) else 0,
+        *_operation_kopeck_rate(op_config), op_config.get('rate', ''), operation_type
+    )
+
+def compile_tariff(sources: Optional[Dict[str, Any]] = None) -> CompiledTariff:
+    """Компиляция конфигурации (по умолчанию - текущей): шкалы, куб ПВЗ WB и расчетчики должностей"""
+    sources = sources or base_tariff_sources()
+    pvz_wb_config = sources['pvz_wb']
+    operations = {
+        op_id: compile_operation(op_id, op_config) for op_id, op_config in sources['operations'].items()
+    }
+    
+    positions = {}
+    for position, position_config in POSITIONS_CONFIG.items():
+        position_operations = tuple(
+            operations[op_id] for op_id in dict.fromkeys(position_config.get('operations', []))
+            if op_id in operations
+        )
+        positions[position] = CompiledPosition(
+            position, position_operations, frozenset(op.op_id for op in position_operations)
+        )
+    
+    pvz_wb_tariff = compile_pvz_wb_tariff(pvz_wb_config)
+    
+    return CompiledTariff(
+        version=compute_config_version(sources),
+        kpi_tables={kpi_id: compile_step_table(spec) for kpi_id, spec in sources['kpi_thresholds'].items()},
+        team_tables={
+            coeff_id: compile_step_table(spec)
+            for coeff_id, spec in sources['team_coefficient_thresholds'].items()
+        },
+        pvz_wb_tariff=pvz_wb_tariff,
+        pvz_wb_rows=tuple(tuple(tuple(row) for row in plane) for plane in pvz_wb_tariff.tolist()),
+        pvz_quantity_bands=tuple(pvz_wb_config['quantity_bands']),
+        pvz_rating_thresholds=tuple(pvz_wb_config['rating_thresholds']),
+        pvz_schedule_index={name: i for i, name in enumerate(pvz_wb_config['schedules'])},
+        operations=operations,
+        positions=positions,
+        kpi_weights={position: dict(weights) for position, weights in sources['kpi_weights'].items()}
+    )
+
+def tariff_date(value) -> str:
+    """Дата для поиска версии тарифа: ISO "ГГГГ-ММ-ДД"
+    
+    Принимает date/datetime, "ГГГГ-ММ-ДД", "ДД.ММ.ГГГГ" и месяц "ГГГГ-ММ"
+    (месяц считается по тарифам, действующим на его первое число).
+    """
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    
+    text = str(value).strip()
+    try:
+        if len(text) == 7:
+            return datetime.strptime(text, '%Y-%m').date().isoformat()
+        if '.' in text:
+            return datetime.strptime(text, '%d.%m.%Y').date().isoformat()
+        return datetime.strptime(text, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        raise ValueError(f"Не удалось разобрать дату тарифа: {value!r}") from None
+
+@dataclass(frozen=True, eq=False)
+class TariffTimeline:
+    """Интервальный индекс версий тарифа: tariffs[0] действует до starts[0],
+    tariffs[i] - с starts[i - 1] до starts[i]"""
+    version: str
+    starts: Tuple[str, ...]
+    tariffs: Tuple[CompiledTariff, ...]
+    
+    def index(self, when) -> int:
+        """Номер версии, действующей на дату (бинарный поиск)"""
+        return bisect_right(self.starts, tariff_date(when))
+    
+    def at(self, when) -> CompiledTariff:
+        """Тариф, действующий на дату"""
+        return self.tariffs[self.index(when)]
+    
+    def index_array(self, dates: Sequence) -> np.ndarray:
+        """Номера версий для столбца дат; пустая дата - -1 (тариф калькулятора)
+        
+        Даты разбираются один раз на уникальное значение (в блоке их - единицы месяцев).
+        """
+        unique_dates, inverse = np.unique(np.asarray(dates, dtype=str), return_inverse=True)
+        unique_index = np.array(
+            [self.index(value) if value else -1 for value in unique_dates.tolist()], dtype=np.int64
+        )
+        return unique_index[inverse].reshape(-1)
+
+def compile_tariff_timeline(
+    base: Optional[CompiledTariff] = None,
+    sources: Optional[Dict[str, Any]] = None,
+    versions: Optional[List[Dict[str, Any]]] = None
+) -> TariffTimeline:
+    """Компиляция версий тарифа (по умолчанию - действующих; каждая версия - один раз)"""
+    sources = sources or base_tariff_sources()
+    versions = _TARIFF_VERSIONS if versions is None else versions
+    base = base or compile_tariff(sources)
+    starts, tariffs = [], [base]
+    version_sources = sources
+    
+    for version in versions:
+        start = tariff_date(version['effective_from'])
+        if starts and start <= starts[-1]:
+            raise ValueError(f"Версии тарифа должны идти по возрастанию дат: {start} после {starts[-1]}")
+        version_sources = apply_tariff_version(version_sources, version)
+        starts.append(start)
+        tariffs.append(compile_tariff(version_sources))
+    
+    return TariffTimeline(compute_timeline_version(sources, versions), tuple(starts), tuple(tariffs))
+
+# Реестр тарифа: одна ссылка на скомпилированные версии, подмена - одним присваиванием.
+# Расчет закрепляет тариф в начале (PremiumCalculator.with_tariff) и доходит до конца на нем.
+# Тариф готовится при первом обращении: импорт модуля не читает файл тарифов и не компилирует.
+_TARIFF_LOCK = threading.Lock()
+_ACTIVE_TIMELINE: Optional[TariffTimeline] = None
+
+def active_tariff() -> CompiledTariff:
+    """Текущая скомпилированная конфигурация"""
+    return tariff_timeline().tariffs[0]
+
+def tariff_timeline() -> TariffTimeline:
+    """Скомпилированные версии тарифа по датам (при первом обращении - из файла тарифов по умолчанию)"""
+    global _TARIFF_SOURCES, _TARIFF_VERSIONS, _ACTIVE_TIMELINE
+    timeline = _ACTIVE_TIMELINE
+    if timeline is None:
+        with _TARIFF_LOCK:
+            if _ACTIVE_TIMELINE is None:
+                sources, versions = tariff_sources(read_tariff_file(DEFAULT_TARIFF_FILE))
+                _ACTIVE_TIMELINE = compile_tariff_timeline(None, sources, versions)
+                _TARIFF_SOURCES, _TARIFF_VERSIONS = sources, versions
+            timeline = _ACTIVE_TIMELINE
+    return timeline
+
+def refresh_compiled_tariff() -> CompiledTariff:
+    """Перекомпилировать конфигурацию и версии тарифа, если их отпечаток изменился"""
+    global _ACTIVE_TIMELINE
+    tariff_timeline()
+    with _TARIFF_LOCK:
+        if compute_timeline_version() != _ACTIVE_TIMELINE.version:
+            _ACTIVE_TIMELINE = compile_tariff_timeline()
+        return _ACTIVE_TIMELINE.tariffs[0]
+
+def install_tariffs(data: Dict[str, Any]) -> TariffTimeline:
+    """Установить тарифы из проверенных данных файла (tariff_store.parse_tariff_data)
+    
+    Компиляция идет до подмены: при ошибке (ValueError) остается прежний тариф.
+    """
+    global _TARIFF_SOURCES, _TARIFF_VERSIONS, _ACTIVE_TIMELINE
+    
+    sources, versions = tariff_sources(data)
+    timeline = compile_tariff_timeline(None, sources, versions)
+    
+    with _TARIFF_LOCK:
+        _TARIFF_SOURCES, _TARIFF_VERSIONS = sources, versions
+        _ACTIVE_TIMELINE = timeline
+    return timeline
+
+def configure_tariffs(tariff_file: Optional[str] = None) -> TariffTimeline:
+    """Настройки тарифа от приложения: файл тарифов (по умолчанию - tariffs.json)
+    
+    Модуль сам окружение не читает - бот берет значения из config_v2, пакетный расчет - из аргументов.
+    """
+    if tariff_file and os.path.abspath(tariff_file) != DEFAULT_TARIFF_FILE:
+        return install_tariffs(read_tariff_file(tariff_file))
+    return tariff_timeline()
+
+def _select_operations(
+    tariff: CompiledTariff,
+    operations: Dict[int, float],
+    position: Optional[str]
+) -> List[Tuple[CompiledOperation, float]]:
+    """Заполненные операции с их скомпилированным тарифом, в порядке ввода
+    
+    Порядок ввода сохраняется: от него зависят порядок строк детализации и последние
+    разряды суммы. Если все операции входят в набор должности, проверка наличия
+    в тарифе не нужна; иначе (или для неизвестной должности) операции вне тарифа пропускаются.
+    """
+    compiled_position = tariff.positions.get(position)
+    if compiled_position is not None and compiled_position.operation_ids.issuperset(operations):
+        return [
+            (tariff.operations[op_id], quantity) for op_id, quantity in operations.items()
+            if quantity > 0
+        ]
+    return [
+        (tariff.operations[op_id], quantity) for op_id, quantity in operations.items()
+        if quantity > 0 and op_id in tariff.operations
+    ]
+
+@dataclass(frozen=True, slots=True)
 class CalculationResult:
-    """Результат расчета премии"""
+    """Результат расчета премии (неизменяемый, может разделяться через кэш)
+    
+    Детализация хранится компактно - параллельными кортежами по операциям и показателям КПИ.
+    Словари operation_details / kpi_details строятся только при обращении (для вывода).
+    """
     total_premium: float
     operation_bonus: float
     kpi_bonus: float
     base_salary: float
     position_rate: float
     real_salary: float
-    operation_details: List[Dict]
-    kpi_details: List[Dict]
-    warnings: List[str]
+    warnings: Tuple[str, ...]
     position_name: str
+    
+    # Детализация операций
+    operation_ids: Tuple[int, ...] = ()
+    operation_tariffs: Tuple[CompiledOperation, ...] = ()  # тариф, по которому посчитаны операции
+    operation_quantities: Tuple[float, ...] = ()
+    operation_base_bonuses: Tuple[float, ...] = ()
+    operation_coefficients: Tuple[float, ...] = ()
+    operation_final_bonuses: Tuple[float, ...] = ()
+    efficiency_value: float = 0.0
+    efficiency_coeff: float = 0.0
+    efficiency_bonus: float = 0.0
+    subordinates_bonus: float = 0.0
+    
+    # Детализация КПИ
+    kpi_ids: Tuple[str, ...] = ()
+    kpi_percents: Tuple[float, ...] = ()
+    kpi_weights: Tuple[float, ...] = ()
+    kpi_coefficients: Tuple[float, ...] = ()
+    kpi_bonuses: Tuple[float, ...] = ()
+    base_kpi_amount: float = 0.0
+    kpi_real_salary: float = 0.0
+    
+    # True - денежные поля в целых копейках (режим 'kopeck')
+    in_kopecks: bool = False
+    
+    @property
+    def operation_details(self) -> List[Dict]:
+        """Строки детализации операций (как раньше - список новых словарей при каждом обращении)"""
+        tariffs = self.operation_tariffs or tuple(
+            active_tariff().operations[op_id] for op_id in self.operation_ids
+        )
+        details = _operation_detail_rows(
+            tariffs, self.operation_quantities, self.operation_base_bonuses,
+            self.operation_coefficients, self.operation_final_bonuses,
+            self.efficiency_value, self.efficiency_coeff, self.efficiency_bonus
+        )
+        
+        if self.subordinates_bonus > 0:
+            if self.in_kopecks:
+                rate = format_money(from_kopecks(self.subordinates_bonus))
+            else:
+                rate = f'{self.subordinates_bonus}₽'
+            details.append({
+                'name': 'Бонус за подчиненных',
+                'quantity': 1,
+                'rate': rate,
+                'base_bonus': self.subordinates_bonus,
+                'coefficient': 1.0,
+                'final_bonus': self.subordinates_bonus,
+                'operation_type': 'management',
+                'emoji': '👥'
+            })
+        
+        return details
+    
+    @property
+    def kpi_details(self) -> List[Dict]:
+        """Строки детализации КПИ (как раньше - список новых словарей при каждом обращении)"""
+        return _kpi_detail_rows(
+            self.kpi_ids, self.kpi_percents, self.kpi_weights, self.kpi_coefficients, self.kpi_bonuses,
+            self.base_kpi_amount, self.base_salary, self.position_rate, self.kpi_real_salary
+        )
+
+@dataclass(frozen=True, slots=True)
+class CalculationRequest:
+    """Неизменяемый запрос на расчет премии: все входные данные, включая параметры ПВЗ WB
+    
+    Словари копируются и оборачиваются в MappingProxyType, поэтому запрос можно
+    передавать между потоками и процессами без риска изменения данных.
+    """
+    position: str
+    base_salary: float
+    position_rate: float
+    operations: Mapping[int, float]
+    kpi_values: Mapping[str, float]
+    team_coefficients: Mapping[str, float]
+    subordinates_bonus: float = 0.0
+    pvz_work_schedule: str = "режим1"
+    pvz_rating: float = 5.0
+    
+    def __post_init__(self):
+        for name in ('operations', 'kpi_values', 'team_coefficients'):
+            object.__setattr__(self, name, MappingProxyType(dict(getattr(self, name) or {})))
+    
+    def __reduce__(self):
+        # MappingProxyType не сериализуется pickle - передаем обычные словари
+        return (CalculationRequest, (
+            self.position, self.base_salary, self.position_rate, dict(self.operations),
+            dict(self.kpi_values), dict(self.team_coefficients), self.subordinates_bonus,
+            self.pvz_work_schedule, self.pvz_rating
+        ))
+    
+    def fingerprint(self, config_version: Optional[str] = None, money_mode: str = 'float') -> str:
+        """Ключ кэша результатов для запроса"""
+        return calculation_fingerprint(
+            self.position, self.base_salary, self.position_rate, self.operations, self.kpi_values,
+            self.team_coefficients, self.pvz_work_schedule, self.pvz_rating, self.subordinates_bonus,
+            config_version=config_version, money_mode=money_mode
+        )
+
+class _OperationsBreakdown(NamedTuple):
+    """Компактная детализация бонуса за операции"""
+    total: float
+    ids: Tuple[int, ...]
+    quantities: Tuple[float, ...]
+    base_bonuses: Tuple[float, ...]
+    coefficients: Tuple[float, ...]
+    final_bonuses: Tuple[float, ...]
+    efficiency_value: float
+    efficiency_coeff: float
+    efficiency_bonus: float
+    tariffs: Tuple[CompiledOperation, ...]
+
+class _KpiBreakdown(NamedTuple):
+    """Компактная детализация КПИ бонуса"""
+    total: float
+    ids: Tuple[str, ...]
+    percents: Tuple[float, ...]
+    weights: Tuple[float, ...]
+    coefficients: Tuple[float, ...]
+    bonuses: Tuple[float, ...]
+    base_kpi_amount: float
+    real_salary: float
+    warnings: Tuple[str, ...]
+
+def _operation_detail_rows(
+    tariffs, quantities, base_bonuses, coefficients, final_bonuses,
+    efficiency_value, efficiency_coeff, efficiency_bonus
+) -> List[Dict]:
+    """Построить словари детализации операций из компактного представления
+    
+    Ставка и тип операции - из тарифа расчета (tariffs), название и эмодзи - из OPERATIONS_CONFIG.
+    """
+    details = []
+    for op, quantity, base_bonus, coefficient, final_bonus in zip(
+        tariffs, quantities, base_bonuses, coefficients, final_bonuses
+    ):
+        op_config = OPERATIONS_CONFIG[op.op_id]
+        details.append({
+            'name': op_config['name'],
+            'quantity': quantity,
+            'rate': op.display_rate,
+            'base_bonus': base_bonus,
+            'coefficient': coefficient,
+            'final_bonus': final_bonus,
+            'operation_type': op.operation_type,
+            'emoji': op_config.get('emoji', '📊')
+        })
+    
+    if efficiency_coeff > 0:
+        details.append({
+            'name': 'Коэффициент эффективности ОПС',
+            'quantity': efficiency_value,
+            'rate': f'{efficiency_coeff*100:.0f}% от операций',
+            'base_bonus': 0,
+            'coefficient': 1.0,
+            'final_bonus': efficiency_bonus,
+            'operation_type': 'efficiency',
+            'emoji': '📈'
+        })
+    
+    return details
+
+def _kpi_detail_rows(
+    ids, percents, weights, coefficients, bonuses,
+    base_kpi_amount, base_salary, position_rate, real_salary
+) -> List[Dict]:
+    """Построить словари детализации КПИ из компактного представления"""
+    details = []
+    for kpi_id, percent, weight, coefficient, bonus in zip(ids, percents, weights, coefficients, bonuses):
+        kpi_config = KPI_CONFIG.get(kpi_id, {'name': kpi_id, 'emoji': '📊'})
+        details.append({
+            'name': kpi_config['name'],
+            'percent': percent,
+            'weight': weight,
+            'coefficient': coefficient,
+            'bonus': bonus,
+            'base_kpi_amount': base_kpi_amount,
+            'base_salary': base_salary,
+            'position_rate': position_rate,
+            'real_salary': real_salary,
+            'emoji': kpi_config.get('emoji', '📊')
+        })
+    return details
+
+def calculation_fingerprint(
+    position: str,
+    base_salary: float,
+    position_rate: float,
+    operations: Dict[int, float],
+    kpi_values: Dict[str, float],
+    team_coefficients: Dict[str, float],
+    pvz_work_schedule: str,
+    pvz_rating: float,
+    subordinates_bonus: float,
+    config_version: Optional[str] = None,
+    money_mode: str = 'float'
+) -> str:
+    """Канонический хэш входных данных расчета
+    
+    Операции с нулевым количеством не влияют на результат и не входят в ключ,
+    параметры ПВЗ WB учитываются только при заполненной операции #13.
+    """
+    has_pvz = operations.get(13, 0) > 0
+    canonical = (
+        config_version or active_tariff().version,
+        money_mode,
+        position,
+        float(base_salary),
+        float(position_rate),
+        tuple(sorted((int(op_id), float(q)) for op_id, q in operations.items() if q > 0)),
+        tuple(sorted((kpi_id, float(v)) for kpi_id, v in kpi_values.items())),
+        tuple(sorted((coeff_id, float(v)) for coeff_id, v in team_coefficients.items())),
+        (pvz_work_schedule, float(pvz_rating)) if has_pvz else None,
+        float(subordinates_bonus)
+    )
+    return hashlib.sha256(repr(canonical).encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """Ограниченный LRU кэш результатов расчета с вытеснением по времени жизни"""
+    
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        if max_size <= 0:
+            raise ValueError("Размер кэша должен быть больше 0")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: "OrderedDict[str, Tuple[float, CalculationResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[CalculationResult]:
+        """Получить результат из кэша (None при промахе или истекшем сроке)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            expires_at, result = entry
+            if expires_at < self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+    
+    def put(self, key: str, result: CalculationResult) -> None:
+        """Сохранить результат, вытеснив самые давние записи при переполнении"""
+        expires_at = self.clock() + self.ttl if self.ttl is not None else float('inf')
+        with self._lock:
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self) -> None:
+        """Очистить кэш (счетчики сохраняются)"""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для подбора размера кэша"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+@dataclass
+class BatchCalculationResult:
+    """Результат пакетного расчета премий (по строке на сотрудника)"""
+    total_premium: np.ndarray
+    operation_bonus: np.ndarray
+    kpi_bonus: np.ndarray
+    real_salary: np.ndarray
+    operation_bonuses: np.ndarray  # (n, len(OPERATION_IDS)) - итоговый бонус по операциям
+    efficiency_bonus: np.ndarray
+    kpi_bonuses: np.ndarray        # (n, len(KPI_IDS)) - бонус по показателям КПИ
+    kpi_blocked: np.ndarray        # КПИ не выплачивается (выручка < 80%)
+
+class _BatchInputs(NamedTuple):
+    """Приведенные входные столбцы пакетного расчета"""
+    n: int
+    base_salary: np.ndarray
+    position_rate: np.ndarray
+    quantities: np.ndarray
+    kpi_values: np.ndarray
+    has_kpi: np.ndarray
+    weights: np.ndarray
+    service: np.ndarray
+    speed_reception: np.ndarray
+    speed_delivery: np.ndarray
+    efficiency: np.ndarray
+    subordinates_bonus: np.ndarray
+    pvz_work_schedule: Sequence[str]
+    pvz_rating: np.ndarray
+    positions: np.ndarray
+    
+    def take(self, rows: np.ndarray) -> '_BatchInputs':
+        """Подмножество строк"""
+        return _BatchInputs(len(rows), *(
+            [value[i] for i in rows] if isinstance(value, list) else np.asarray(value)[rows]
+            for value in self[1:]
+        ))
 
 class PremiumCalculator:
     """Калькулятор премий v2.4"""
     
-    def __init__(self):
+    def __init__(self, cache_size: int = 0, cache_ttl: Optional[float] = None, money_mode: str = 'float'):
+        if money_mode not in MONEY_MODES:
+            raise ValueError(f"Неизвестный режим денежной арифметики: {money_mode}")
+        
+        # 'float' - рубли в float, 'kopeck' - все суммы целыми копейками с явным округлением
+        self.money_mode = money_mode
+        
         # Параметры для ПВЗ WB (устанавливаются через set_pvz_params)
         self._pvz_work_schedule = "режим1"
         self._pvz_rating = 5.0
+        
+        # Кэш результатов calculate_premium (выключен при cache_size = 0)
+        self.cache = ResultCache(cache_size, cache_ttl) if cache_size > 0 else None
+        
+        # Расчетчики должностей пересобираются, если конфигурация изменилась
+        refresh_compiled_tariff()
+        
+        # Тариф, закрепленный за калькулятором (with_tariff / for_date); None - текущий
+        self._tariff: Optional[CompiledTariff] = None
+    
+    @property
+    def tariff(self) -> CompiledTariff:
+        """Скомпилированная конфигурация, по которой идет расчет"""
+        return self._tariff or active_tariff()
+    
+    def with_tariff(self, tariff: CompiledTariff) -> 'PremiumCalculator':
+        """Калькулятор с тем же кэшем и режимом, считающий по заданному тарифу"""
+        calculator = copy.copy(self)
+        calculator._tariff = tariff
+        return calculator
+    
+    def for_date(self, when) -> 'PremiumCalculator':
+        """Калькулятор по тарифу, действующему на дату (версии - раздел versions файла тарифов)"""
+        return self.with_tariff(tariff_timeline().at(when))
     
     def set_pvz_params(self, work_schedule: str = "режим1", rating: float = 5.0):
         """Установить параметры для расчета ПВЗ WB"""
@@ -35,129 +822,99 @@ class PremiumCalculator:
         self._pvz_rating = rating
     
     def calculate_kpi_coefficient(self, percent: float, kpi_type: str) -> float:
-        """Расчет коэффициента КПИ (синхронизация с HTML)"""
-        if kpi_type == 'revenue':
-            if percent >= 110: return 1.0
-            elif percent >= 105: return 0.8
-            elif percent >= 100: return 0.6
-            elif percent >= 95: return 0.4
-            elif percent >= 90: return 0.2
-            elif percent >= 85: return 0.1
-            elif percent >= 80: return 0.05
-            else: return 0.0
-        
-        elif kpi_type == 'csi':
-            if percent >= 95: return 1.0
-            elif percent >= 90: return 0.6
-            elif percent >= 85: return 0.2
-            else: return 0.0
-        
-        elif kpi_type in ['online_rpo', 'co1_co2']:
-            if percent >= 110: return 1.0
-            elif percent >= 105: return 0.8
-            elif percent >= 100: return 0.6
-            elif percent >= 95: return 0.4
-            elif percent >= 90: return 0.2
-            elif percent >= 85: return 0.1
-            else: return 0.0
-        
-        return 0.0
+        """Расчет коэффициента КПИ по шкале kpi_thresholds тарифа"""
+        table = self.tariff.kpi_tables.get(kpi_type)
+        if table is None:
+            return 0.0
+        return table.lookup(percent)
     
     def calculate_team_coefficient(self, value: float, coeff_type: str) -> float:
-        """Расчет командных коэффициентов (синхронизация с HTML)"""
-        if coeff_type == 'service':
-            if value >= 95: return 1.2
-            elif value >= 90: return 1.1
-            elif value >= 80: return 1.0
-            else: return 1.0
-        
-        elif coeff_type == 'speed_reception':
-            # Норма: < 4 мин = выполнено (1.5), > 4 мин = не выполнено (0.5)
-            if value == 0: return 1.0  # Если не указано время, базовый коэффициент
-            if value < 4: return 1.5   # Меньше 4 минут - выполнено
-            return 0.5                 # Больше 4 минут - не выполнено
-        
-        elif coeff_type == 'speed_delivery':
-            # Норма: < 1:30 мин (1.5 мин) = выполнено (1.5), > 1:30 мин = не выполнено (0.5)
-            if value == 0: return 1.0  # Если не указано время, базовый коэффициент
-            if value < 1.5: return 1.5 # Меньше 1:30 минут - выполнено
-            return 0.5                 # Больше 1:30 минут - не выполнено
-        
-        elif coeff_type == 'efficiency':
-            if value >= 100: return 0.3  # 30% бонус к итоговой премии
-            else: return 0.0
-        
-        return 1.0
+        """Расчет командных коэффициентов по шкале team_coefficient_thresholds тарифа"""
+        table = self.tariff.team_tables.get(coeff_type)
+        if table is None:
+            return 1.0
+        return table.lookup(value)
+    
+    def calculate_kpi_coefficient_array(self, percent: np.ndarray, kpi_type: str) -> np.ndarray:
+        """Векторный расчет коэффициента КПИ (аналог calculate_kpi_coefficient)"""
+        table = self.tariff.kpi_tables.get(kpi_type)
+        if table is None:
+            return np.zeros_like(np.asarray(percent, dtype=float))
+        return table.lookup_array(percent)
+    
+    def calculate_team_coefficient_array(self, value: np.ndarray, coeff_type: str) -> np.ndarray:
+        """Векторный расчет командных коэффициентов (аналог calculate_team_coefficient)"""
+        table = self.tariff.team_tables.get(coeff_type)
+        if table is None:
+            return np.ones_like(np.asarray(value, dtype=float))
+        return table.lookup_array(value)
     
     def calculate_pvz_wb_bonus(self, quantity: int, work_schedule: str = "режим1", rating: float = 5.0) -> float:
-        """Расчет бонуса за обеспечение ПВЗ WB (операция #13) согласно новой таблице"""
+        """Расчет бонуса за обеспечение ПВЗ WB (операция #13) по кубу тарифа"""
         if quantity <= 0:
             return 0.0
         
-        # Определяем диапазон количества заказов
-        if quantity <= 50:
-            range_index = 0
-        elif quantity <= 100:
-            range_index = 1
-        elif quantity <= 166:
-            range_index = 2
-        else:  # 167 и более
-            range_index = 3
-        
-        # WB1 - Суммы по плановым режимам
-        wb1_amounts = [
-            [0, 1000, 2000, 3000],      # 50 и менее
-            [1000, 2000, 3000, 3000],   # 51-100
-            [2000, 3000, 3000, 3000],   # 101-166
-            [3000, 3000, 3000, 3000]    # 167 и более
-        ]
+        tariff = self.tariff
+        range_index = bisect_left(tariff.pvz_quantity_bands, quantity)
+        schedule_index = tariff.pvz_schedule_index.get(work_schedule, 0)
+        rating_index = 1 + bisect_right(tariff.pvz_rating_thresholds, rating) if rating > 0 else 0
         
-        # WB2 - Суммы по рейтингу ПВЗ
-        wb2_amounts = [
-            [0, 1500, 3000, 4500],      # 50 и менее
-            [1500, 3000, 4500, 4500],   # 51-100
-            [3000, 4500, 4500, 4500],   # 101-166
-            [4500, 4500, 4500, 4500]    # 167 и более
-        ]
-        
-        # Определяем режим работы для WB1
-        schedule_index = 0  # По умолчанию несоответствие режимам
-        
-        if work_schedule == "режим1":  # 7 дней в неделю, по 11 часов
-            schedule_index = 1
-        elif work_schedule == "режим2":  # не менее 5 дней, по 6 часов, до 20:00
-            schedule_index = 2
-        elif work_schedule == "полный":  # соответствие обоим режимам
-            schedule_index = 3
-        
-        # Расчет WB1 (по плановым режимам)
-        wb1_bonus = wb1_amounts[range_index][schedule_index]
-        
-        # Расчет WB2 (по рейтингу)
-        wb2_bonus = 0
-        rating_index = 0  # По умолчанию рейтинг < 4.9
+        return tariff.pvz_wb_rows[range_index][schedule_index][rating_index]
+    
+    def calculate_pvz_wb_bonus_array(
+        self,
+        quantity: np.ndarray,
+        work_schedule: Sequence[str],
+        rating: np.ndarray
+    ) -> np.ndarray:
+        """Векторный расчет бонуса ПВЗ WB: одна выборка из куба тарифа для всех строк"""
+        tariff = self.tariff
+        quantity = np.trunc(np.asarray(quantity, dtype=float))
+        rating = np.asarray(rating, dtype=float)
         
-        if rating >= 5.0:
-            rating_index = 3  # Рейтинг = 5.0
-        elif rating >= 4.9:
-            rating_index = 2  # 4.9 ≤ Рейтинг < 5.0
-        elif rating > 0:
-            rating_index = 1  # Рейтинг отсутствовал
+        range_index = np.searchsorted(tariff.pvz_quantity_bands, quantity, side='left')
+        rating_index = np.where(
+            rating > 0, 1 + np.searchsorted(tariff.pvz_rating_thresholds, rating, side='right'), 0
+        )
         
-        wb2_bonus = wb2_amounts[range_index][rating_index]
+        # Режимы работы переводим в индексы через уникальные значения
+        schedules, inverse = np.unique(np.asarray(work_schedule, dtype=str), return_inverse=True)
+        schedule_index = np.array(
+            [tariff.pvz_schedule_index.get(name, 0) for name in schedules], dtype=np.intp
+        )[inverse.reshape(-1)].reshape(np.shape(work_schedule))
         
-        # Общая премия = WB1 + WB2
-        return float(wb1_bonus + wb2_bonus)
+        bonus = tariff.pvz_wb_tariff[range_index, schedule_index, rating_index]
+        return np.where(quantity > 0, bonus, 0.0)
     
     def calculate_operations_bonus(
         self, 
         operations: Dict[int, float], 
         position_config: Dict,
-        team_coefficients: Dict[str, float]
+        team_coefficients: Dict[str, float],
+        position: Optional[str] = None
     ) -> Tuple[float, List[Dict]]:
-        """Расчет бонуса за операции"""
+        """Расчет бонуса за операции (с position - по скомпилированному расчетчику должности)"""
+        breakdown = self._price_operations(
+            operations, team_coefficients, self._pvz_work_schedule, self._pvz_rating, position
+        )
+        details = _operation_detail_rows(
+            breakdown.tariffs, breakdown.quantities, breakdown.base_bonuses, breakdown.coefficients,
+            breakdown.final_bonuses, breakdown.efficiency_value, breakdown.efficiency_coeff,
+            breakdown.efficiency_bonus
+        )
+        return breakdown.total, details
+    
+    def _price_operations(
+        self,
+        operations: Dict[int, float],
+        team_coefficients: Dict[str, float],
+        pvz_work_schedule: str,
+        pvz_rating: float,
+        position: Optional[str] = None
+    ) -> _OperationsBreakdown:
+        """Расчет бонуса за операции с компактной детализацией"""
         total_bonus = 0.0
-        details = []
+        ids, tariffs, quantities, base_bonuses, coefficients, final_bonuses = [], [], [], [], [], []
         
         # Рассчитываем коэффициенты
         service_coeff = self.calculate_team_coefficient(
@@ -168,73 +925,40 @@ class PremiumCalculator:
         speed_reception_coeff = team_coefficients.get('speed_reception', 1.0)
         speed_delivery_coeff = team_coefficients.get('speed_delivery', 1.0)
         
-        efficiency_coeff = self.calculate_team_coefficient(
-            team_coefficients.get('efficiency', 0), 'efficiency'
-        )
+        # Коэффициенты по слотам CompiledOperation.slot (тип 1 - без коэффициентов)
+        slot_coefficients = (1.0, service_coeff, speed_reception_coeff, speed_delivery_coeff)
         
-        for op_id, quantity in operations.items():
-            if quantity <= 0 or op_id not in OPERATIONS_CONFIG:
-                continue
-                
-            op_config = OPERATIONS_CONFIG[op_id]
-            base_bonus = 0.0
-            applied_coeff = 1.0
-            
-            # Специальная обработка для ПВЗ WB
-            if op_id == 13:  # Обеспечение ПВЗ WB
-                # Используем переданные параметры режима работы и рейтинга
-                work_schedule = getattr(self, '_pvz_work_schedule', "режим1")
-                rating = getattr(self, '_pvz_rating', 5.0)
-                base_bonus = self.calculate_pvz_wb_bonus(int(quantity), work_schedule, rating)
+        efficiency_value = team_coefficients.get('efficiency', 0)
+        efficiency_coeff = self.calculate_team_coefficient(efficiency_value, 'efficiency')
+        
+        for op, quantity in _select_operations(self.tariff, operations, position):
+            if op.rate is None:  # Обеспечение ПВЗ WB
+                base_bonus = self.calculate_pvz_wb_bonus(int(quantity), pvz_work_schedule, pvz_rating)
             else:
-                # Обычные операции
-                if op_config['type'] == 'fixed':
-                    base_bonus = quantity * op_config['value']
-                elif op_config['type'] == 'percent':
-                    base_bonus = quantity * op_config['value']
-            
-            # Применяем коэффициенты по типу операции
-            operation_type = op_config.get('operationType', 1)
-            
-            if operation_type == 2:  # Тип 2: с коэффициентом обслуживания
-                applied_coeff = service_coeff
-            elif operation_type == 3:  # Тип 3: с коэффициентом скорости приема
-                applied_coeff = speed_reception_coeff
-            elif operation_type == 4:  # Тип 4: с коэффициентом скорости доставки
-                applied_coeff = speed_delivery_coeff
-            # Тип 1: без коэффициентов (applied_coeff = 1.0)
+                base_bonus = quantity * op.rate
             
+            applied_coeff = slot_coefficients[op.slot]
             final_bonus = base_bonus * applied_coeff
             total_bonus += final_bonus
             
-            details.append({
-                'name': op_config['name'],
-                'quantity': quantity,
-                'rate': op_config['rate'],
-                'base_bonus': base_bonus,
-                'coefficient': applied_coeff,
-                'final_bonus': final_bonus,
-                'operation_type': operation_type,
-                'emoji': op_config.get('emoji', '📊')
-            })
+            ids.append(op.op_id)
+            tariffs.append(op)
+            quantities.append(quantity)
+            base_bonuses.append(base_bonus)
+            coefficients.append(applied_coeff)
+            final_bonuses.append(final_bonus)
         
         # Применяем коэффициент эффективности к итоговому бонусу
+        efficiency_bonus = 0.0
         if efficiency_coeff > 0:
             efficiency_bonus = total_bonus * efficiency_coeff
             total_bonus += efficiency_bonus
-            
-            details.append({
-                'name': 'Коэффициент эффективности ОПС',
-                'quantity': team_coefficients.get('efficiency', 0),
-                'rate': f'{efficiency_coeff*100:.0f}% от операций',
-                'base_bonus': 0,
-                'coefficient': 1.0,
-                'final_bonus': efficiency_bonus,
-                'operation_type': 'efficiency',
-                'emoji': '📈'
-            })
         
-        return total_bonus, details
+        return _OperationsBreakdown(
+            total_bonus, tuple(ids), tuple(quantities), tuple(base_bonuses),
+            tuple(coefficients), tuple(final_bonuses),
+            efficiency_value, efficiency_coeff, efficiency_bonus, tuple(tariffs)
+        )
     
     def calculate_kpi_bonus(
         self, 
@@ -242,14 +966,26 @@ class PremiumCalculator:
         base_salary: float,
         position_rate: float,
         position: str
-    ) -> Tuple[float, List[Dict]]:
+    ) -> Tuple[float, List[Dict], List[str]]:
         """Расчет КПИ бонуса: 20% от оклада с распределением по весам показателей"""
+        breakdown = self._price_kpi(kpi_values, base_salary, position_rate, position)
+        details = _kpi_detail_rows(
+            breakdown.ids, breakdown.percents, breakdown.weights, breakdown.coefficients,
+            breakdown.bonuses, breakdown.base_kpi_amount, base_salary, position_rate,
+            breakdown.real_salary
+        )
+        return breakdown.total, details, list(breakdown.warnings)
+    
+    def _price_kpi(
+        self, 
+        kpi_values: Dict[str, float],
+        base_salary: float,
+        position_rate: float,
+        position: str
+    ) -> _KpiBreakdown:
+        """Расчет КПИ бонуса с компактной детализацией"""
         if not kpi_values:
-            return 0.0, [], []
-        
-        total_bonus = 0.0
-        details = []
-        warnings = []
+            return _KpiBreakdown(0.0, (), (), (), (), (), 0.0, 0.0, ())
         
         # Реальный размер оклада = оклад × ставка
         # FALLBACK: если оклад или ставка не заданы, используем фиксированную базу 150000₽
@@ -264,17 +1000,18 @@ class PremiumCalculator:
         # Проверяем критическое правило для выручки
         revenue_percent = kpi_values.get('revenue', 0)
         if revenue_percent < 80:
-            warnings.append(
-                f"⚠️ Выручка {revenue_percent}% < 80% - КПИ не выплачивается!"
-            )
-            return 0.0, [], warnings
+            warning = f"⚠️ Выручка {revenue_percent}% < 80% - КПИ не выплачивается!"
+            return _KpiBreakdown(0.0, (), (), (), (), (), base_kpi_amount, real_salary, (warning,))
         
         # Получаем веса для данной должности
-        position_weights = KPI_WEIGHTS.get(position, {})
+        position_weights = self.tariff.kpi_weights.get(position, {})
         
         if not position_weights:
-            warnings.append(f"⚠️ Не найдены веса КПИ для должности: {position}")
-            return 0.0, [], warnings
+            warning = f"⚠️ Не найдены веса КПИ для должности: {position}"
+            return _KpiBreakdown(0.0, (), (), (), (), (), base_kpi_amount, real_salary, (warning,))
+        
+        total_bonus = 0.0
+        ids, percents, weights, coefficients, bonuses = [], [], [], [], []
         
         # Рассчитываем КПИ по каждому показателю
         for kpi_id, percent in kpi_values.items():
@@ -286,22 +1023,125 @@ class PremiumCalculator:
                 kpi_bonus = base_kpi_amount * weight * coefficient
                 total_bonus += kpi_bonus
                 
-                kpi_config = KPI_CONFIG.get(kpi_id, {'name': kpi_id, 'emoji': '📊'})
+                ids.append(kpi_id)
+                percents.append(percent)
+                weights.append(weight)
+                coefficients.append(coefficient)
+                bonuses.append(kpi_bonus)
+        
+        return _KpiBreakdown(
+            total_bonus, tuple(ids), tuple(percents), tuple(weights), tuple(coefficients),
+            tuple(bonuses), base_kpi_amount, real_salary, ()
+        )
+    
+    def _price_operations_kopecks(
+        self,
+        operations: Dict[int, float],
+        team_coefficients: Dict[str, float],
+        pvz_work_schedule: str,
+        pvz_rating: float,
+        position: Optional[str] = None
+    ) -> _OperationsBreakdown:
+        """Расчет бонуса за операции в целых копейках
+        
+        Точки округления (половина вверх): базовый бонус операции, бонус с коэффициентом,
+        бонус эффективности. Коэффициенты переводятся в базисные пункты.
+        """
+        total_bonus = 0
+        ids, tariffs, quantities, base_bonuses, coefficients, final_bonuses = [], [], [], [], [], []
+        
+        slot_bp = (
+            BASIS_POINTS,
+            to_basis_points(self.calculate_team_coefficient(team_coefficients.get('service', 0), 'service')),
+            to_basis_points(team_coefficients.get('speed_reception', 1.0)),
+            to_basis_points(team_coefficients.get('speed_delivery', 1.0))
+        )
+        
+        efficiency_value = team_coefficients.get('efficiency', 0)
+        efficiency_coeff = self.calculate_team_coefficient(efficiency_value, 'efficiency')
+        
+        for op, quantity in _select_operations(self.tariff, operations, position):
+            if op.rate is None:  # Обеспечение ПВЗ WB
+                base_bonus = to_kopecks(self.calculate_pvz_wb_bonus(int(quantity), pvz_work_schedule, pvz_rating))
+            else:
+                base_bonus = round_div(to_kopecks(quantity) * op.kopeck_multiplier, op.kopeck_divisor)
+            
+            coefficient_bp = slot_bp[op.slot]
+            final_bonus = round_div(base_bonus * coefficient_bp, BASIS_POINTS)
+            total_bonus += final_bonus
+            
+            ids.append(op.op_id)
+            tariffs.append(op)
+            quantities.append(quantity)
+            base_bonuses.append(base_bonus)
+            coefficients.append(coefficient_bp / BASIS_POINTS)
+            final_bonuses.append(final_bonus)
+        
+        efficiency_bonus = 0
+        if efficiency_coeff > 0:
+            efficiency_bonus = round_div(total_bonus * to_basis_points(efficiency_coeff), BASIS_POINTS)
+            total_bonus += efficiency_bonus
+        
+        return _OperationsBreakdown(
+            total_bonus, tuple(ids), tuple(quantities), tuple(base_bonuses),
+            tuple(coefficients), tuple(final_bonuses),
+            efficiency_value, efficiency_coeff, efficiency_bonus, tuple(tariffs)
+        )
+    
+    def _price_kpi_kopecks(
+        self,
+        kpi_values: Dict[str, float],
+        base_salary: float,
+        position_rate: float,
+        position: str
+    ) -> _KpiBreakdown:
+        """Расчет КПИ бонуса в целых копейках (правила те же, что в _price_kpi)"""
+        if not kpi_values:
+            return _KpiBreakdown(0, (), (), (), (), (), 0, 0, ())
+        
+        if base_salary > 0 and position_rate > 0:
+            real_salary = _kopeck_salary(base_salary, position_rate)
+        else:
+            real_salary = KPI_FALLBACK_SALARY_KOPECKS
+        
+        base_kpi_amount = round_div(real_salary * KPI_SHARE_BP, BASIS_POINTS)
+        
+        revenue_percent = kpi_values.get('revenue', 0)
+        if revenue_percent < 80:
+            warning = f"⚠️ Выручка {revenue_percent}% < 80% - КПИ не выплачивается!"
+            return _KpiBreakdown(0, (), (), (), (), (), base_kpi_amount, real_salary, (warning,))
+        
+        position_weights = self.tariff.kpi_weights.get(position, {})
+        
+        if not position_weights:
+            warning = f"⚠️ Не найдены веса КПИ для должности: {position}"
+            return _KpiBreakdown(0, (), (), (), (), (), base_kpi_amount, real_salary, (warning,))
+        
+        total_bonus = 0
+        ids, percents, weights, coefficients, bonuses = [], [], [], [], []
+        
+        for kpi_id, percent in kpi_values.items():
+            if percent > 0 and kpi_id in position_weights:
+                coefficient = self.calculate_kpi_coefficient(percent, kpi_id)
+                weight = position_weights[kpi_id]
+                
+                # Одно округление на показатель: база × вес × коэффициент
+                kpi_bonus = round_div(
+                    base_kpi_amount * to_basis_points(weight) * to_basis_points(coefficient),
+                    BASIS_POINTS * BASIS_POINTS
+                )
+                total_bonus += kpi_bonus
                 
-                details.append({
-                    'name': kpi_config['name'],
-                    'percent': percent,
-                    'weight': weight,
-                    'coefficient': coefficient,
-                    'bonus': kpi_bonus,
-                    'base_kpi_amount': base_kpi_amount,
-                    'base_salary': base_salary,
-                    'position_rate': position_rate,
-                    'real_salary': real_salary,
-                    'emoji': kpi_config.get('emoji', '📊')
-                })
+                ids.append(kpi_id)
+                percents.append(percent)
+                weights.append(weight)
+                coefficients.append(coefficient)
+                bonuses.append(kpi_bonus)
         
-        return total_bonus, details, warnings
+        return _KpiBreakdown(
+            total_bonus, tuple(ids), tuple(percents), tuple(weights), tuple(coefficients),
+            tuple(bonuses), base_kpi_amount, real_salary, ()
+        )
     
     def calculate_premium(
         self,
@@ -313,60 +1153,545 @@ class PremiumCalculator:
         team_coefficients: Dict[str, float],
         subordinates_bonus: float = 0.0
     ) -> CalculationResult:
-        """Основная функция расчета премии"""
+        """Основная функция расчета премии (параметры ПВЗ WB - из set_pvz_params)"""
+        return self.calculate(CalculationRequest(
+            position=position,
+            base_salary=base_salary,
+            position_rate=position_rate,
+            operations=operations,
+            kpi_values=kpi_values,
+            team_coefficients=team_coefficients,
+            subordinates_bonus=subordinates_bonus,
+            pvz_work_schedule=self._pvz_work_schedule,
+            pvz_rating=self._pvz_rating
+        ))
+    
+    def calculate(self, request: CalculationRequest) -> CalculationResult:
+        """Расчет премии по запросу; состояние калькулятора не используется (потокобезопасно)"""
+        if self._tariff is None:
+            # Тариф закрепляется на весь расчет: перезагрузка тарифов его не затрагивает
+            return self.with_tariff(active_tariff()).calculate(request)
+        
+        position = request.position
+        base_salary = request.base_salary
+        position_rate = request.position_rate
+        subordinates_bonus = request.subordinates_bonus
+        
+        cache_key = None
+        if self.cache is not None:
+            cache_key = request.fingerprint(self.tariff.version, self.money_mode)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
         
         # Получаем конфигурацию должности
         position_config = POSITIONS_CONFIG.get(position, {})
         if not position_config:
             raise ValueError(f"Неизвестная должность: {position}")
         
-        warnings = []
+        in_kopecks = self.money_mode == 'kopeck'
+        price_operations = self._price_operations_kopecks if in_kopecks else self._price_operations
+        price_kpi = self._price_kpi_kopecks if in_kopecks else self._price_kpi
         
         # Расчет операционного бонуса
-        operation_bonus, operation_details = self.calculate_operations_bonus(
-            operations, position_config, team_coefficients
+        operations_breakdown = price_operations(
+            request.operations, request.team_coefficients, request.pvz_work_schedule, request.pvz_rating, position
         )
+        operation_bonus = operations_breakdown.total
         
         # Расчет КПИ бонуса (только для должностей с КПИ)
-        kpi_bonus = 0.0
-        kpi_details = []
-        
+        kpi_breakdown = _KpiBreakdown(0, (), (), (), (), (), 0, 0, ())
         if position_config.get('kpi'):
-            kpi_bonus, kpi_details, kpi_warnings = self.calculate_kpi_bonus(
-                kpi_values, base_salary, position_rate, position
-            )
-            warnings.extend(kpi_warnings)
+            kpi_breakdown = price_kpi(request.kpi_values, base_salary, position_rate, position)
+        kpi_bonus = kpi_breakdown.total
         
         # Добавляем бонус за подчиненных (для управленческого НОПС)
+        if in_kopecks:
+            subordinates_bonus = to_kopecks(subordinates_bonus) if subordinates_bonus > 0 else 0
         if subordinates_bonus > 0:
             operation_bonus += subordinates_bonus
-            operation_details.append({
-                'name': 'Бонус за подчиненных',
-                'quantity': 1,
-                'rate': f'{subordinates_bonus}₽',
-                'base_bonus': subordinates_bonus,
-                'coefficient': 1.0,
-                'final_bonus': subordinates_bonus,
-                'operation_type': 'management',
-                'emoji': '👥'
-            })
         
         # Общая премия
         total_premium = operation_bonus + kpi_bonus
-        real_salary = base_salary * position_rate if base_salary > 0 and position_rate > 0 else 0
+        if base_salary > 0 and position_rate > 0:
+            real_salary = _kopeck_salary(base_salary, position_rate) if in_kopecks else base_salary * position_rate
+        else:
+            real_salary = 0
         
-        return CalculationResult(
+        result = CalculationResult(
             total_premium=total_premium,
             operation_bonus=operation_bonus,
             kpi_bonus=kpi_bonus,
             base_salary=base_salary,
             position_rate=position_rate,
             real_salary=real_salary,
-            operation_details=operation_details,
-            kpi_details=kpi_details,
-            warnings=warnings,
-            position_name=position_config.get('name', position)
+            warnings=kpi_breakdown.warnings,
+            position_name=position_config.get('name', position),
+            operation_ids=operations_breakdown.ids,
+            operation_tariffs=operations_breakdown.tariffs,
+            operation_quantities=operations_breakdown.quantities,
+            operation_base_bonuses=operations_breakdown.base_bonuses,
+            operation_coefficients=operations_breakdown.coefficients,
+            operation_final_bonuses=operations_breakdown.final_bonuses,
+            efficiency_value=operations_breakdown.efficiency_value,
+            efficiency_coeff=operations_breakdown.efficiency_coeff,
+            efficiency_bonus=operations_breakdown.efficiency_bonus,
+            subordinates_bonus=subordinates_bonus if subordinates_bonus > 0 else 0.0,
+            in_kopecks=in_kopecks,
+            kpi_ids=kpi_breakdown.ids,
+            kpi_percents=kpi_breakdown.percents,
+            kpi_weights=kpi_breakdown.weights,
+            kpi_coefficients=kpi_breakdown.coefficients,
+            kpi_bonuses=kpi_breakdown.bonuses,
+            base_kpi_amount=kpi_breakdown.base_kpi_amount,
+            kpi_real_salary=kpi_breakdown.real_salary
+        )
+        
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        
+        return result
+    
+    def calculate_premium_batch(
+        self,
+        positions: Sequence[str],
+        base_salary: np.ndarray,
+        position_rate: np.ndarray,
+        quantities: np.ndarray,
+        kpi_values: Optional[np.ndarray] = None,
+        team_coefficients: Optional[Dict[str, np.ndarray]] = None,
+        subordinates_bonus: Optional[np.ndarray] = None,
+        pvz_work_schedule: Optional[Sequence[str]] = None,
+        pvz_rating: Optional[np.ndarray] = None,
+        dates: Optional[Sequence] = None
+    ) -> BatchCalculationResult:
+        """Пакетный расчет премий для массива сотрудников (столбцовые входные данные)
+        
+        quantities - матрица (n, len(OPERATION_IDS)), kpi_values - матрица (n, len(KPI_IDS))
+        с процентами выполнения. Операции суммируются в порядке столбцов OPERATION_IDS:
+        результаты побитово совпадают с calculate_premium, если словарь операций задан
+        в этом порядке, при другом порядке float-суммы могут расходиться в последних разрядах.
+        В режиме 'kopeck' (целые копейки int64) совпадение точное при любом порядке.
+        dates - дата или месяц строки: строка считается по версии тарифа, действующей
+        на эту дату (пустая - по тарифу калькулятора).
+        """
+        # Версии тарифа закрепляются на весь пакет: перезагрузка тарифов его не затрагивает
+        timeline = tariff_timeline()
+        pinned = self if self._tariff is not None else self.with_tariff(timeline.tariffs[0])
+        batch = pinned._prepare_batch(
+            positions, base_salary, position_rate, quantities, kpi_values,
+            team_coefficients, subordinates_bonus, pvz_work_schedule, pvz_rating
+        )
+        
+        if dates is None or len(timeline.tariffs) == 1:
+            return pinned._price(batch)
+        
+        # Строки группируются по версии тарифа: таблицы версии используются для всей группы
+        version_index = timeline.index_array(dates)
+        if len(version_index) != batch.n:
+            raise ValueError(f"Столбец дат должен иметь длину {batch.n}, получено {len(version_index)}")
+        
+        groups = np.unique(version_index)
+        if len(groups) == 1:
+            calculator = pinned if groups[0] < 0 else self.with_tariff(timeline.tariffs[groups[0]])
+            return calculator._price(calculator._with_weights(batch))
+        
+        merged = None
+        for group in groups.tolist():
+            rows = np.flatnonzero(version_index == group)
+            calculator = pinned if group < 0 else self.with_tariff(timeline.tariffs[group])
+            result = calculator._price(calculator._with_weights(batch.take(rows)))
+            if merged is None:
+                merged = BatchCalculationResult(**{
+                    name: np.zeros((batch.n,) + value.shape[1:], dtype=value.dtype)
+                    for name, value in vars(result).items()
+                })
+            for name, value in vars(result).items():
+                getattr(merged, name)[rows] = value
+        return merged
+    
+    def _price(self, batch: _BatchInputs) -> BatchCalculationResult:
+        """Расчет подготовленного пакета в режиме калькулятора"""
+        if self.money_mode == 'kopeck':
+            return self._price_batch_kopecks(batch)
+        return self._price_batch(batch)
+    
+    def _with_weights(self, batch: _BatchInputs) -> _BatchInputs:
+        """Веса КПИ пакета по тарифу калькулятора"""
+        return batch._replace(weights=self._kpi_weight_matrix(batch.positions))
+    
+    def _kpi_weight_matrix(self, positions: np.ndarray) -> np.ndarray:
+        """Матрица весов КПИ (n, len(KPI_IDS)) по должностям строк"""
+        unique_positions, position_index = np.unique(positions, return_inverse=True)
+        kpi_weights = self.tariff.kpi_weights
+        weights = np.array([
+            [kpi_weights.get(position, {}).get(kpi_id, 0.0) for kpi_id in KPI_IDS]
+            for position in unique_positions.tolist()
+        ]).reshape(len(unique_positions), len(KPI_IDS))
+        return weights[position_index.reshape(-1)]
+    
+    def _prepare_batch(
+        self,
+        positions: Sequence[str],
+        base_salary: np.ndarray,
+        position_rate: np.ndarray,
+        quantities: np.ndarray,
+        kpi_values: Optional[np.ndarray],
+        team_coefficients: Optional[Dict[str, np.ndarray]],
+        subordinates_bonus: Optional[np.ndarray],
+        pvz_work_schedule: Optional[Sequence[str]],
+        pvz_rating: Optional[np.ndarray]
+    ) -> _BatchInputs:
+        """Проверка и приведение входных столбцов пакетного расчета"""
+        positions = np.asarray(positions, dtype=str)
+        n = len(positions)
+        
+        def column(values, default: float) -> np.ndarray:
+            if values is None:
+                values = default
+            return np.broadcast_to(np.asarray(values, dtype=float), (n,))
+        
+        quantities = np.asarray(quantities, dtype=float)
+        if quantities.shape != (n, len(OPERATION_IDS)):
+            raise ValueError(
+                f"Матрица операций должна иметь размер ({n}, {len(OPERATION_IDS)}), получено {quantities.shape}"
+            )
+        
+        if kpi_values is None:
+            kpi_values = np.zeros((n, len(KPI_IDS)))
+        kpi_values = np.asarray(kpi_values, dtype=float)
+        if kpi_values.shape != (n, len(KPI_IDS)):
+            raise ValueError(
+                f"Матрица КПИ должна иметь размер ({n}, {len(KPI_IDS)}), получено {kpi_values.shape}"
+            )
+        
+        team_coefficients = team_coefficients or {}
+        
+        # Параметры должностей: наличие КПИ и веса показателей
+        unique_positions, position_index = np.unique(positions, return_inverse=True)
+        has_kpi = np.zeros(len(unique_positions), dtype=bool)
+        weights = np.zeros((len(unique_positions), len(KPI_IDS)))
+        kpi_weights = self.tariff.kpi_weights
+        
+        for i, position in enumerate(unique_positions):
+            position_config = POSITIONS_CONFIG.get(position, {})
+            if not position_config:
+                raise ValueError(f"Неизвестная должность: {position}")
+            has_kpi[i] = bool(position_config.get('kpi'))
+            for j, kpi_id in enumerate(KPI_IDS):
+                weights[i, j] = kpi_weights.get(position, {}).get(kpi_id, 0.0)
+        
+        if pvz_work_schedule is None:
+            pvz_work_schedule = [self._pvz_work_schedule] * n
+        
+        return _BatchInputs(
+            n=n,
+            base_salary=column(base_salary, 0.0),
+            position_rate=column(position_rate, 0.0),
+            quantities=quantities,
+            kpi_values=kpi_values,
+            has_kpi=has_kpi[position_index],
+            weights=weights[position_index],
+            service=column(team_coefficients.get('service'), 0.0),
+            speed_reception=column(team_coefficients.get('speed_reception'), 1.0),
+            speed_delivery=column(team_coefficients.get('speed_delivery'), 1.0),
+            efficiency=column(team_coefficients.get('efficiency'), 0.0),
+            subordinates_bonus=column(subordinates_bonus, 0.0),
+            pvz_work_schedule=pvz_work_schedule,
+            pvz_rating=column(pvz_rating, self._pvz_rating),
+            positions=positions
+        )
+    
+    def _kpi_gate(self, batch: _BatchInputs) -> Tuple[np.ndarray, np.ndarray]:
+        """Маски КПИ: заблокирован правилом выручки < 80% / выплачивается"""
+        if 'revenue' in KPI_IDS:
+            kpi_blocked = batch.has_kpi & (batch.kpi_values[:, KPI_IDS.index('revenue')] < 80)
+        else:
+            kpi_blocked = np.zeros(batch.n, dtype=bool)
+        return kpi_blocked, batch.has_kpi & ~kpi_blocked
+    
+    def _price_batch(self, batch: _BatchInputs) -> BatchCalculationResult:
+        """Пакетный расчет в рублях (float64)"""
+        n = batch.n
+        tariff = self.tariff
+        
+        # Коэффициенты по слотам CompiledOperation.slot (0 - без коэффициента)
+        slot_coefficients = (
+            np.ones(n),
+            self.calculate_team_coefficient_array(batch.service, 'service'),
+            batch.speed_reception,
+            batch.speed_delivery
+        )
+        efficiency_coeff = self.calculate_team_coefficient_array(batch.efficiency, 'efficiency')
+        
+        # Бонус за операции (суммирование в порядке OPERATION_IDS, как в скалярном расчете)
+        operation_bonuses = np.zeros((n, len(OPERATION_IDS)))
+        operation_bonus = np.zeros(n)
+        
+        for j, op_id in enumerate(OPERATION_IDS):
+            op = tariff.operations[op_id]
+            quantity = batch.quantities[:, j]
+            active = quantity > 0
+            if not active.any():
+                continue
+            
+            if op.rate is None:  # Обеспечение ПВЗ WB
+                base_bonus = self.calculate_pvz_wb_bonus_array(quantity, batch.pvz_work_schedule, batch.pvz_rating)
+            else:
+                base_bonus = quantity * op.rate
+            
+            final_bonus = np.where(active, base_bonus * slot_coefficients[op.slot], 0.0)
+            operation_bonuses[:, j] = final_bonus
+            operation_bonus = operation_bonus + final_bonus
+        
+        # Коэффициент эффективности применяется к итоговому бонусу за операции
+        efficiency_bonus = operation_bonus * efficiency_coeff
+        operation_bonus = operation_bonus + efficiency_bonus
+        
+        # Бонус за подчиненных (для управленческого НОПС)
+        subordinates_bonus = batch.subordinates_bonus
+        operation_bonus = np.where(subordinates_bonus > 0, operation_bonus + subordinates_bonus, operation_bonus)
+        
+        # КПИ бонус: 20% от реального оклада, распределенные по весам показателей
+        salary_known = (batch.base_salary > 0) & (batch.position_rate > 0)
+        kpi_real_salary = np.where(salary_known, batch.base_salary * batch.position_rate, 150000.0)
+        base_kpi_amount = kpi_real_salary * 0.20
+        kpi_blocked, kpi_allowed = self._kpi_gate(batch)
+        
+        kpi_bonuses = np.zeros((n, len(KPI_IDS)))
+        kpi_bonus = np.zeros(n)
+        
+        for j, kpi_id in enumerate(KPI_IDS):
+            percent = batch.kpi_values[:, j]
+            active = kpi_allowed & (percent > 0)
+            coefficient = self.calculate_kpi_coefficient_array(percent, kpi_id)
+            bonus = np.where(active, base_kpi_amount * batch.weights[:, j] * coefficient, 0.0)
+            kpi_bonuses[:, j] = bonus
+            kpi_bonus = kpi_bonus + bonus
+        
+        return BatchCalculationResult(
+            total_premium=operation_bonus + kpi_bonus,
+            operation_bonus=operation_bonus,
+            kpi_bonus=kpi_bonus,
+            real_salary=np.where(salary_known, batch.base_salary * batch.position_rate, 0.0),
+            operation_bonuses=operation_bonuses,
+            efficiency_bonus=efficiency_bonus,
+            kpi_bonuses=kpi_bonuses,
+            kpi_blocked=kpi_blocked
+        )
+    
+    def _price_batch_kopecks(self, batch: _BatchInputs) -> BatchCalculationResult:
+        """Пакетный расчет в целых копейках (int64), точки округления как в скалярном режиме"""
+        n = batch.n
+        tariff = self.tariff
+        
+        # Коэффициенты по слотам в базисных пунктах (1/10000)
+        slot_bp = (
+            np.full(n, BASIS_POINTS, dtype=np.int64),
+            to_basis_points_array(self.calculate_team_coefficient_array(batch.service, 'service')),
+            to_basis_points_array(batch.speed_reception),
+            to_basis_points_array(batch.speed_delivery)
+        )
+        efficiency_bp = to_basis_points_array(self.calculate_team_coefficient_array(batch.efficiency, 'efficiency'))
+        
+        operation_bonuses = np.zeros((n, len(OPERATION_IDS)), dtype=np.int64)
+        operation_bonus = np.zeros(n, dtype=np.int64)
+        
+        for j, op_id in enumerate(OPERATION_IDS):
+            op = tariff.operations[op_id]
+            quantity = batch.quantities[:, j]
+            active = quantity > 0
+            if not active.any():
+                continue
+            
+            if op.rate is None:  # Обеспечение ПВЗ WB
+                base_bonus = to_kopecks_array(
+                    self.calculate_pvz_wb_bonus_array(quantity, batch.pvz_work_schedule, batch.pvz_rating)
+                )
+            else:
+                base_bonus = round_div(to_kopecks_array(quantity) * op.kopeck_multiplier, op.kopeck_divisor)
+            
+            final_bonus = np.where(active, round_div(base_bonus * slot_bp[op.slot], BASIS_POINTS), 0)
+            operation_bonuses[:, j] = final_bonus
+            operation_bonus += final_bonus
+        
+        efficiency_bonus = round_div(operation_bonus * efficiency_bp, BASIS_POINTS)
+        operation_bonus = operation_bonus + efficiency_bonus
+        
+        subordinates_bonus = to_kopecks_array(batch.subordinates_bonus)
+        operation_bonus = np.where(subordinates_bonus > 0, operation_bonus + subordinates_bonus, operation_bonus)
+        
+        salary_known = (batch.base_salary > 0) & (batch.position_rate > 0)
+        real_salary = np.where(
+            salary_known,
+            round_div(to_kopecks_array(batch.base_salary) * to_basis_points_array(batch.position_rate), BASIS_POINTS),
+            0
+        )
+        kpi_real_salary = np.where(salary_known, real_salary, KPI_FALLBACK_SALARY_KOPECKS)
+        base_kpi_amount = round_div(kpi_real_salary * KPI_SHARE_BP, BASIS_POINTS)
+        kpi_blocked, kpi_allowed = self._kpi_gate(batch)
+        
+        kpi_bonuses = np.zeros((n, len(KPI_IDS)), dtype=np.int64)
+        kpi_bonus = np.zeros(n, dtype=np.int64)
+        
+        for j, kpi_id in enumerate(KPI_IDS):
+            percent = batch.kpi_values[:, j]
+            active = kpi_allowed & (percent > 0)
+            coefficient_bp = to_basis_points_array(self.calculate_kpi_coefficient_array(percent, kpi_id))
+            weight_bp = to_basis_points_array(batch.weights[:, j])
+            bonus = np.where(
+                active, round_div(base_kpi_amount * weight_bp * coefficient_bp, BASIS_POINTS * BASIS_POINTS), 0
+            )
+            kpi_bonuses[:, j] = bonus
+            kpi_bonus += bonus
+        
+        return BatchCalculationResult(
+            total_premium=operation_bonus + kpi_bonus,
+            operation_bonus=operation_bonus,
+            kpi_bonus=kpi_bonus,
+            real_salary=real_salary,
+            operation_bonuses=operation_bonuses,
+            efficiency_bonus=efficiency_bonus,
+            kpi_bonuses=kpi_bonuses,
+            kpi_blocked=kpi_blocked
+        )
+
+class PremiumAccumulator:
+    """Инкрементальный расчет премии для пошагового опросника
+    
+    Хранит промежуточные суммы по типам операций и взвешенные коэффициенты КПИ,
+    поэтому изменение одного количества, КПИ или коэффициента стоит O(1).
+    Итоговый результат для показа по-прежнему считает PremiumCalculator.calculate_premium.
+    """
+    
+    def __init__(self, position: str, calculator: Optional[PremiumCalculator] = None):
+        position_config = POSITIONS_CONFIG.get(position, {})
+        if not position_config:
+            raise ValueError(f"Неизвестная должность: {position}")
+        
+        self.position = position
+        self.calculator = calculator or PremiumCalculator()
+        self.base_salary = 0.0
+        self.position_rate = 0.0
+        self.subordinates_bonus = 0.0
+        self.pvz_work_schedule = "режим1"
+        self.pvz_rating = 5.0
+        
+        self._has_kpi = bool(position_config.get('kpi'))
+        self._kpi_weights = self.calculator.tariff.kpi_weights.get(position, {})
+        
+        # Операции: базовый бонус по каждой операции и суммы по слотам коэффициентов
+        self._quantities: Dict[int, float] = {}
+        self._base_bonuses: Dict[int, float] = {}
+        self._slot_subtotals: List[float] = [0.0, 0.0, 0.0, 0.0]
+        
+        # Командные коэффициенты по слотам CompiledOperation.slot и коэффициент эффективности
+        self._slot_coefficients: List[float] = [
+            1.0,
+            self.calculator.calculate_team_coefficient(0, 'service'),
+            1.0,
+            1.0
+        ]
+        self._efficiency_coeff = self.calculator.calculate_team_coefficient(0, 'efficiency')
+        
+        # КПИ: вклад показателя = вес × коэффициент достижения
+        self._kpi_values: Dict[str, float] = {}
+        self._kpi_shares: Dict[str, float] = {}
+        self._kpi_share_sum = 0.0
+    
+    def set_quantity(self, op_id: int, quantity: float) -> None:
+        """Изменить количество операции"""
+        if op_id not in OPERATIONS_CONFIG:
+            return
+        
+        self._quantities[op_id] = quantity
+        self._update_base_bonus(op_id)
+    
+    def set_pvz_params(self, work_schedule: str, rating: float) -> None:
+        """Изменить режим работы и рейтинг ПВЗ WB"""
+        self.pvz_work_schedule = work_schedule
+        self.pvz_rating = rating
+        if 13 in self._quantities:
+            self._update_base_bonus(13)
+    
+    def set_team_coefficient(self, coeff_id: str, value: float) -> None:
+        """Изменить командный коэффициент (значение как в UserState.team_coefficients)"""
+        if coeff_id == 'service':
+            self._slot_coefficients[1] = self.calculator.calculate_team_coefficient(value, 'service')
+        elif coeff_id == 'speed_reception':
+            self._slot_coefficients[2] = value
+        elif coeff_id == 'speed_delivery':
+            self._slot_coefficients[3] = value
+        elif coeff_id == 'efficiency':
+            self._efficiency_coeff = self.calculator.calculate_team_coefficient(value, 'efficiency')
+    
+    def set_kpi(self, kpi_id: str, percent: float) -> None:
+        """Изменить процент выполнения показателя КПИ"""
+        self._kpi_values[kpi_id] = percent
+        
+        share = 0.0
+        if percent > 0 and kpi_id in self._kpi_weights:
+            share = self._kpi_weights[kpi_id] * self.calculator.calculate_kpi_coefficient(percent, kpi_id)
+        
+        self._kpi_share_sum += share - self._kpi_shares.get(kpi_id, 0.0)
+        self._kpi_shares[kpi_id] = share
+    
+    def set_salary(self, base_salary: float, position_rate: float) -> None:
+        """Изменить оклад и ставку"""
+        self.base_salary = base_salary
+        self.position_rate = position_rate
+    
+    def set_subordinates_bonus(self, amount: float) -> None:
+        """Изменить бонус за подчиненных"""
+        self.subordinates_bonus = amount
+    
+    def _update_base_bonus(self, op_id: int) -> None:
+        """Пересчитать базовый бонус одной операции и сумму ее слота коэффициента"""
+        op = self.calculator.tariff.operations[op_id]
+        quantity = self._quantities.get(op_id, 0)
+        
+        base_bonus = 0.0
+        if quantity > 0:
+            if op.rate is None:  # Обеспечение ПВЗ WB
+                base_bonus = self.calculator.calculate_pvz_wb_bonus(
+                    int(quantity), self.pvz_work_schedule, self.pvz_rating
+                )
+            else:
+                base_bonus = quantity * op.rate
+        
+        self._slot_subtotals[op.slot] += base_bonus - self._base_bonuses.get(op_id, 0.0)
+        self._base_bonuses[op_id] = base_bonus
+    
+    @property
+    def operation_bonus(self) -> float:
+        """Текущий бонус за операции (с коэффициентами и бонусом за подчиненных)"""
+        total = sum(
+            subtotal * coefficient
+            for subtotal, coefficient in zip(self._slot_subtotals, self._slot_coefficients)
         )
+        total += total * self._efficiency_coeff
+        if self.subordinates_bonus > 0:
+            total += self.subordinates_bonus
+        return total
+    
+    @property
+    def kpi_bonus(self) -> float:
+        """Текущий КПИ бонус"""
+        if not self._has_kpi or not self._kpi_values:
+            return 0.0
+        if self._kpi_values.get('revenue', 0) < 80:
+            return 0.0
+        
+        if self.base_salary > 0 and self.position_rate > 0:
+            real_salary = self.base_salary * self.position_rate
+        else:
+            real_salary = 150000.0
+        return real_salary * 0.20 * self._kpi_share_sum
+    
+    @property
+    def total_premium(self) -> float:
+        """Текущая итоговая премия"""
+        return self.operation_bonus + self.kpi_bonus
 
 def format_money(amount: float) -> str:
     """Форматирование денежной суммы"""
@@ -1,20 +1,35 @@
 import os
+import argparse
 import logging
 import asyncio
-from typing import Dict
+import functools
+import secrets
+from datetime import date
+from urllib.parse import urlsplit
+from typing import Dict, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler, MessageHandler,
+    AIORateLimiter, Application, CommandHandler, CallbackQueryHandler, MessageHandler,
     ContextTypes, ConversationHandler, filters
 )
 from telegram.constants import ParseMode
 
 from config_v2 import (
     TOKEN, MESSAGES, POSITIONS_CONFIG, OPERATIONS_CONFIG, 
-    KPI_CONFIG, KPI_WEIGHTS, TEAM_COEFFICIENTS_CONFIG, POSITION_RATES,
+    KPI_CONFIG, TEAM_COEFFICIENTS_CONFIG, POSITION_RATES,
+    HISTORY_DB_PATH, TARIFF_FILE, TARIFF_RELOAD_INTERVAL,
+    SESSION_DB_PATH, SESSION_FLUSH_INTERVAL, SESSION_IDLE_TTL, SESSION_MAX_COUNT, SESSION_SWEEP_INTERVAL,
+    UPDATE_CONCURRENCY, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, TELEGRAM_API_URL,
     UserState
 )
-from calculator_v2 import PremiumCalculator, format_money, format_percent
+from calculator_v2 import (
+    PremiumCalculator, PremiumAccumulator, CalculationRequest, CompiledOperation, format_money, format_percent,
+    configure_tariffs, install_tariffs
+)
+from calculation_history import CalculationHistory
+from session_store import SessionStates, SqlitePersistence
+from update_processor import PerUserUpdateProcessor
+from tariff_store import TariffFileWatcher, file_digest
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,8 +43,25 @@ logger = logging.getLogger(__name__)
  ASKING_OPERATIONS, ASKING_OPERATION_QUANTITY, ASKING_PVZ_SCHEDULE, ASKING_PVZ_RATING,
 ASKING_KPI, ASKING_COEFFICIENTS, ENTERING_COEFFICIENTS, SHOWING_RESULTS) = range(11)
 
-# Глобальное хранилище состояний пользователей
-user_states: Dict[int, UserState] = {}
+# Состояния пользователей: user_data приложения, сохраняемые в SQLite (session_store);
+# брошенные расчеты удаляются по времени бездействия и вытесняются сверх лимита
+user_states = SessionStates(idle_ttl=SESSION_IDLE_TTL, max_sessions=SESSION_MAX_COUNT)
+
+def session_required(callback):
+    """Шаг разговора требует сессию: если она истекла или вытеснена - сообщение и выход из диалога"""
+    @functools.wraps(callback)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user.id in user_states:
+            return await callback(update, context)
+        
+        text = "⌛ Сессия расчета истекла.\n\nНачните заново кнопкой <b>🧮 Рассчитать премию</b>."
+        if update.callback_query is not None:
+            await update.callback_query.answer()
+            await update.callback_query.edit_message_text(text, parse_mode=ParseMode.HTML)
+        else:
+            await update.effective_message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=get_main_menu())
+        return ConversationHandler.END
+    return wrapper
 
 def get_operations_for_position(position_id: str) -> list:
     """Получить список операций доступных для должности"""
@@ -42,6 +74,30 @@ def get_operations_for_position(position_id: str) -> list:
     
     return available_operations
 
+def set_operation_quantity(state: UserState, op_id: int, quantity: float):
+    """Сохранить количество операции и обновить живой итог"""
+    state.operations[op_id] = quantity
+    if state.premium_accumulator is not None:
+        state.premium_accumulator.set_quantity(op_id, quantity)
+
+def set_kpi_value(state: UserState, kpi_id: str, percent: float):
+    """Сохранить процент КПИ и обновить живой итог"""
+    state.kpi[kpi_id] = percent
+    if state.premium_accumulator is not None:
+        state.premium_accumulator.set_kpi(kpi_id, percent)
+
+def set_team_coefficient(state: UserState, coeff_id: str, value: float):
+    """Сохранить командный коэффициент и обновить живой итог"""
+    state.team_coefficients[coeff_id] = value
+    if state.premium_accumulator is not None:
+        state.premium_accumulator.set_team_coefficient(coeff_id, value)
+
+def running_total_text(state: UserState) -> str:
+    """Строка с текущей премией для пошаговых сообщений"""
+    if state.premium_accumulator is None:
+        return ""
+    return f"🧮 Премия на текущий момент: <b>{format_money(state.premium_accumulator.total_premium)}</b>\n\n"
+
 # Главное меню с кнопками
 def get_main_menu():
     """Создает главное меню с кнопками"""
@@ -57,7 +113,76 @@ class CleanPremiumBot:
     """Чистый бот калькулятора премий ОПС с кнопками меню"""
     
     def __init__(self):
-        self.calculator = PremiumCalculator()
+        # Файл тарифов - из окружения бота (config_v2)
+        configure_tariffs(TARIFF_FILE)
+        # Кэш результатов: повторные нажатия "РАССЧИТАТЬ ПРЕМИЮ" и одинаковые профили
+        self.calculator = PremiumCalculator(cache_size=2048, cache_ttl=3600)
+        # История расчетов: запись пачками в фоне, база открывается в post_init
+        self.history = CalculationHistory(HISTORY_DB_PATH)
+        # Файл тарифов: при изменении перечитывается без перезапуска бота
+        self.tariff_watcher = TariffFileWatcher(TARIFF_FILE, install_tariffs, digest=file_digest(TARIFF_FILE))
+    
+    def current_calculator(self, state: Optional[UserState] = None) -> PremiumCalculator:
+        """Калькулятор по тарифу на дату расчета сессии (без нее - на сегодня; общий кэш)"""
+        when = state.calculation_date if state is not None and state.calculation_date else date.today()
+        return self.calculator.for_date(when)
+    
+    def operation_tariff(self, state: UserState, op_id: int) -> CompiledOperation:
+        """Тариф операции, по которому считается расчет пользователя (ставка для показа)"""
+        calculator = (
+            state.premium_accumulator.calculator if state.premium_accumulator is not None
+            else self.current_calculator(state)
+        )
+        return calculator.tariff.operations[op_id]
+    
+    def restore_accumulator(self, state: UserState) -> None:
+        """Собрать накопитель премии для состояния, восстановленного после перезапуска"""
+        if state.position not in POSITIONS_CONFIG:
+            return
+        accumulator = PremiumAccumulator(state.position, self.current_calculator(state))
+        accumulator.set_salary(state.base_salary, state.position_rate)
+        accumulator.set_subordinates_bonus(state.subordinates_bonus)
+        accumulator.set_pvz_params(state.pvz_work_schedule, state.pvz_rating)
+        for op_id, quantity in state.operations.items():
+            accumulator.set_quantity(op_id, quantity)
+        for kpi_id, percent in state.kpi.items():
+            accumulator.set_kpi(kpi_id, percent)
+        for coeff_id, value in state.team_coefficients.items():
+            accumulator.set_team_coefficient(coeff_id, value)
+        state.premium_accumulator = accumulator
+    
+    async def post_init(self, application: Application) -> None:
+        """Запуск фоновых служб бота"""
+        await self.history.start()
+        # Сессии восстановлены из базы при initialize - подключаем их
+        user_states.bind(application)
+        user_states.restore = self.restore_accumulator
+        if application.job_queue is None:
+            logger.warning(
+                "JobQueue недоступна (нужен python-telegram-bot[job-queue]) - "
+                "тарифы не перечитываются, брошенные сессии не удаляются"
+            )
+        else:
+            application.job_queue.run_repeating(
+                self.reload_tariffs, interval=TARIFF_RELOAD_INTERVAL, first=TARIFF_RELOAD_INTERVAL
+            )
+            application.job_queue.run_repeating(
+                self.sweep_sessions, interval=SESSION_SWEEP_INTERVAL, first=SESSION_SWEEP_INTERVAL
+            )
+    
+    async def sweep_sessions(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Периодическое удаление брошенных сессий; показатели сессий и очередей в лог"""
+        user_states.sweep()
+        logger.info(f"Сессии: {user_states.stats()}")
+        logger.info(f"Очереди обновлений: {context.application.update_processor.stats()}")
+    
+    async def reload_tariffs(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Периодическая проверка файла тарифов (чтение и компиляция - в пуле потоков)"""
+        await asyncio.get_running_loop().run_in_executor(None, self.tariff_watcher.check)
+    
+    async def post_shutdown(self, application: Application) -> None:
+        """Остановка фоновых служб: дописываем очередь истории"""
+        await self.history.stop()
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Команда /start с главным меню"""
@@ -93,6 +218,7 @@ class CleanPremiumBot:
             "🤖 Версия: v2.4 (синхронизация с HTML калькулятором)\n\n"
             "💡 <b>Команды:</b>\n"
             "/start - Главное меню\n"
+            "/history - Последние расчеты\n"
             "/cancel - Отменить текущий расчет\n\n"
             "👆 <b>Используйте кнопки меню - это удобнее!</b>"
         )
@@ -104,6 +230,25 @@ class CleanPremiumBot:
         )
         return ConversationHandler.END
     
+    async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Команда /history - последние расчеты пользователя"""
+        results = await self.history.last_results(update.effective_user.id)
+        
+        if not results:
+            text = "📭 У вас пока нет сохраненных расчетов."
+        else:
+            text = "📜 <b>Последние расчеты:</b>\n\n"
+            for row in results:
+                position_name = POSITIONS_CONFIG.get(row['position'], {}).get('name', row['position'])
+                text += f"📅 {row['month']} - {position_name}: <b>{format_money(row['total_premium'])}</b>\n"
+        
+        await update.message.reply_text(
+            text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=get_main_menu()
+        )
+        return ConversationHandler.END
+    
     async def handle_menu_buttons(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Обработка нажатий кнопок меню"""
         text = update.message.text
@@ -211,10 +356,11 @@ class CleanPremiumBot:
         """Команда показа операций с возвратом в меню"""
         text = "📊 <b>Все операции в системе:</b>\n\n"
         
+        tariff = self.current_calculator().tariff
         for op_id, op_config in OPERATIONS_CONFIG.items():
             emoji = op_config.get('emoji', '📊')
             name = op_config['name']
-            rate = op_config['rate']
+            rate = tariff.operations[op_id].display_rate
             text += f"{emoji} <b>{op_id}.</b> {name}\n    <i>{rate}</i>\n\n"
         
         # Разделяем на части если слишком длинное
@@ -311,6 +457,10 @@ class CleanPremiumBot:
             user_states[user_id] = UserState()
         
         user_states[user_id].position = position
+        user_states[user_id].calculation_date = date.today().isoformat()
+        user_states[user_id].premium_accumulator = PremiumAccumulator(
+            position, self.current_calculator(user_states[user_id])
+        )
         position_config = POSITIONS_CONFIG[position]
         
         # Проверяем, нужны ли КПИ показатели
@@ -371,7 +521,7 @@ class CleanPremiumBot:
             )
             
             return ENTERING_RATE
-            
+        
         except ValueError:
             await update.message.reply_text(
                 "❌ Некорректный размер оклада.\n\n"
@@ -396,6 +546,8 @@ class CleanPremiumBot:
         rate = float(query.data.replace("rate_", ""))
         
         user_states[user_id].position_rate = rate
+        if user_states[user_id].premium_accumulator is not None:
+            user_states[user_id].premium_accumulator.set_salary(user_states[user_id].base_salary, rate)
         
         # Рассчитываем реальный оклад
         real_salary = user_states[user_id].base_salary * rate
@@ -426,6 +578,7 @@ class CleanPremiumBot:
         # Получаем текущую операцию
         current_op_id = state.available_operations[state.current_operation_index]
         operation = OPERATIONS_CONFIG[current_op_id]
+        rate = self.operation_tariff(state, current_op_id).display_rate
         
         # Специальные кнопки для ПВЗ WB (операция #13)
         if current_op_id == 13:  # Обеспечение ПВЗ WB
@@ -473,7 +626,7 @@ class CleanPremiumBot:
             text = (
                 f"📊 <b>Операция {progress}:</b>\n\n"
                 f"{operation.get('emoji', '📊')} <b>{operation['name']}</b>\n"
-                f"💰 Ставка: <i>{operation['rate']}</i>\n"
+                f"💰 Ставка: <i>{rate}</i>\n"
                 f"📏 Единица: <i>{operation.get('unit', '')}</i>\n\n"
                 f"📋 <b>Новая система расчета ПВЗ WB:</b>\n"
                 f"💰 <b>WB1</b> - премия по режиму работы:\n"
@@ -487,14 +640,16 @@ class CleanPremiumBot:
                 f"• 101-166: 3000-4500₽\n"
                 f"• 167+: 4500₽\n\n"
                 f"🏆 <b>Итого = WB1 + WB2</b>\n\n"
+                f"{running_total_text(state)}"
                 f"❓ <b>Сколько услуг ПВЗ WB оказано за месяц?</b>"
             )
         else:
             text = (
                 f"📊 <b>Операция {progress}:</b>\n\n"
                 f"{operation.get('emoji', '📊')} <b>{operation['name']}</b>\n"
-                f"💰 Ставка: <i>{operation['rate']}</i>\n"
+                f"💰 Ставка: <i>{rate}</i>\n"
                 f"📏 Единица: <i>{operation.get('unit', '')}</i>\n\n"
+                f"{running_total_text(state)}"
                 f"❓ <b>Сколько выполнили за месяц?</b>"
             )
         
@@ -536,7 +691,7 @@ class CleanPremiumBot:
         
         if value_or_action == "skip":
             # Пропускаем операцию (оставляем 0)
-            state.operations[op_id] = 0
+            set_operation_quantity(state, op_id, 0)
             state.current_operation_index += 1
             return await self.ask_next_operation(update, context)
         
@@ -547,10 +702,10 @@ class CleanPremiumBot:
         else:
             # Быстрый выбор числового значения
             value = float(value_or_action)
-            state.operations[op_id] = value
+            set_operation_quantity(state, op_id, value)
             
             return await self.process_operation_quantity(update, context, value)
-
+    
     async def numeric_keyboard_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Обработчик цифровой клавиатуры"""
         query = update.callback_query
@@ -579,31 +734,31 @@ class CleanPremiumBot:
                     digit = parts[3]
                     if len(state.current_input) < 4:  # Ограничение длины
                         state.current_input += digit
-                    
+                
                 elif action == "backspace":
                     # Удаляем последнюю цифру
                     state.current_input = state.current_input[:-1]
-                    
+                
                 elif action == "qty" and len(parts) >= 4:
                     # Быстрый выбор количества
                     quantity = int(parts[3])
-                    state.operations[op_id] = quantity
+                    set_operation_quantity(state, op_id, quantity)
                     
                     # Переходим к обработке как при обычном вводе
                     return await self.process_operation_quantity(update, context, quantity)
-                    
+                
                 elif action == "confirm":
                     # Подтверждаем ввод
                     try:
                         quantity = int(state.current_input) if state.current_input else 0
                         state.current_input = ""  # Очищаем ввод
-                        state.operations[op_id] = quantity
+                        set_operation_quantity(state, op_id, quantity)
                         
                         return await self.process_operation_quantity(update, context, quantity)
                     except ValueError:
                         await query.edit_message_text("❌ Некорректное число. Попробуйте снова.")
                         return ASKING_OPERATION_QUANTITY
-                        
+                
                 elif action == "text" and parts[3] == "input":
                     # Переключаемся на текстовый ввод
                     current_op_id = state.available_operations[state.current_operation_index]
@@ -644,7 +799,7 @@ class CleanPremiumBot:
                 )
         
         return ASKING_OPERATION_QUANTITY
-
+    
     async def process_operation_quantity(self, update: Update, context: ContextTypes.DEFAULT_TYPE, quantity: int) -> int:
         """Обработка введенного количества операции"""
         user_id = update.effective_user.id
@@ -686,9 +841,6 @@ class CleanPremiumBot:
             # Переходим к следующей операции
             state.current_operation_index += 1
             
-            # Небольшая задержка
-            await asyncio.sleep(0.5)
-            
             return await self.ask_next_operation(update, context)
     
     async def operation_entered(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -711,7 +863,7 @@ class CleanPremiumBot:
             current_op_id = state.available_operations[state.current_operation_index]
             
             # Сохраняем значение
-            state.operations[current_op_id] = quantity
+            set_operation_quantity(state, current_op_id, quantity)
             
             # Специальная обработка для ПВЗ WB
             if current_op_id == 13 and quantity > 0:
@@ -738,11 +890,8 @@ class CleanPremiumBot:
                 # Переходим к следующей операции
                 state.current_operation_index += 1
                 
-                # Небольшая задержка
-                await asyncio.sleep(0.5)
-                
                 return await self.ask_next_operation(update, context)
-            
+        
         except ValueError:
             await update.message.reply_text(
                 f"❌ Некорректное значение.\n\n"
@@ -849,6 +998,7 @@ class CleanPremiumBot:
             f"⭐ <b>КПИ показатель {progress}:</b>\n\n"
             f"{kpi_config.get('emoji', '⭐')} <b>{kpi_config['name']}</b>\n"
             f"📝 {kpi_config.get('description', '')}\n\n"
+            f"{running_total_text(state)}"
             f"❓ <b>Какой процент выполнения?</b>"
         )
         
@@ -891,6 +1041,9 @@ class CleanPremiumBot:
         
         # Проверяем, нужны ли командные коэффициенты
         if position_config.get('teamCoefficients'):
+            # Инициализируем пошаговый опросник коэффициентов
+            user_states[user_id].available_coefficients = position_config['teamCoefficients'].copy()
+            user_states[user_id].current_coefficient_index = 0
             return await self.ask_coefficients_with_buttons(update, context, kpi_text)
         
         else:
@@ -925,11 +1078,6 @@ class CleanPremiumBot:
         position_config = POSITIONS_CONFIG[user_states[user_id].position]
         team_coefficients = position_config.get('teamCoefficients', [])
         
-        # Инициализируем состояние для коэффициентов
-        if not hasattr(user_states[user_id], 'current_coefficient_index'):
-            user_states[user_id].current_coefficient_index = 0
-            user_states[user_id].available_coefficients = team_coefficients
-        
         # Проверяем, есть ли еще коэффициенты
         if user_states[user_id].current_coefficient_index >= len(team_coefficients):
             # Все коэффициенты заданы, переходим к результатам
@@ -938,7 +1086,11 @@ class CleanPremiumBot:
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            text = f"✅ <b>Все коэффициенты заданы!</b>\n\n💡 Нажмите кнопку для расчета премии:"
+            text = (
+                f"✅ <b>Все коэффициенты заданы!</b>\n\n"
+                f"{running_total_text(user_states[user_id])}"
+                f"💡 Нажмите кнопку для расчета премии:"
+            )
             
             if hasattr(update, 'callback_query') and update.callback_query:
                 await update.callback_query.message.reply_text(
@@ -979,9 +1131,10 @@ class CleanPremiumBot:
                 f"⚡ <b>Коэффициент {progress}:</b>\n\n"
                 f"{coeff_config['emoji']} <b>{coeff_config['name']}</b>\n"
                 f"📏 Норма: {speed_text}\n\n"
+                f"{running_total_text(user_states[user_id])}"
                 f"❓ <b>Выберите результат по скорости:</b>"
             )
-            
+        
         elif current_coeff_id == 'service':
             # Обычные кнопки для CSI
             keyboard = [
@@ -1000,9 +1153,10 @@ class CleanPremiumBot:
                 f"⭐ <b>Коэффициент {progress}:</b>\n\n"
                 f"{coeff_config['emoji']} <b>{coeff_config['name']}</b>\n"
                 f"📏 Влияет на операции типа 2\n\n"
+                f"{running_total_text(user_states[user_id])}"
                 f"❓ <b>Укажите количество баллов CSI:</b>"
             )
-            
+        
         elif current_coeff_id == 'efficiency':
             # Кнопки для эффективности
             keyboard = [
@@ -1021,6 +1175,7 @@ class CleanPremiumBot:
                 f"📈 <b>Коэффициент {progress}:</b>\n\n"
                 f"{coeff_config['emoji']} <b>{coeff_config['name']}</b>\n"
                 f"📏 Влияет на итоговую премию\n\n"
+                f"{running_total_text(user_states[user_id])}"
                 f"❓ <b>Укажите процент выполнения плана выручки:</b>"
             )
         
@@ -1063,7 +1218,7 @@ class CleanPremiumBot:
         
         if value_or_action == "skip":
             # Пропускаем коэффициент (оставляем 1.0 - базовый)
-            state.team_coefficients[coeff_id] = 1.0
+            set_team_coefficient(state, coeff_id, 1.0)
             state.current_coefficient_index += 1
             return await self.ask_coefficients_with_buttons(update, context, "")
         
@@ -1085,11 +1240,11 @@ class CleanPremiumBot:
                 if coeff_id in ['speed_reception', 'speed_delivery']:
                     # Для коэффициентов скорости сохраняем прямое значение коэффициента
                     coefficient_value = float(value_or_action)
-                    state.team_coefficients[coeff_id] = coefficient_value
+                    set_team_coefficient(state, coeff_id, coefficient_value)
                 else:
                     # Для остальных сохраняем введенное значение (будет преобразовано в калькуляторе)
                     raw_value = float(value_or_action)
-                    state.team_coefficients[coeff_id] = raw_value
+                    set_team_coefficient(state, coeff_id, raw_value)
                 
                 # Показываем подтверждение
                 coeff_config = TEAM_COEFFICIENTS_CONFIG[coeff_id]
@@ -1114,11 +1269,8 @@ class CleanPremiumBot:
                 # Переходим к следующему коэффициенту
                 state.current_coefficient_index += 1
                 
-                # Небольшая задержка
-                await asyncio.sleep(0.5)
-                
                 return await self.ask_coefficients_with_buttons(update, context, "")
-                
+            
             except ValueError:
                 return ASKING_COEFFICIENTS
     
@@ -1159,7 +1311,7 @@ class CleanPremiumBot:
         if value_or_action == "skip":
             # Пропускаем КПИ (оставляем 0)
             print(f"[DEBUG] Skipping KPI {kpi_id}")
-            state.kpi[kpi_id] = 0
+            set_kpi_value(state, kpi_id, 0)
             state.current_kpi_index += 1
             print(f"[DEBUG] New KPI index: {state.current_kpi_index}")
             return await self.ask_next_kpi(update, context)
@@ -1181,7 +1333,7 @@ class CleanPremiumBot:
             try:
                 value = float(value_or_action)
                 print(f"[DEBUG] Setting KPI {kpi_id} = {value}%")
-                state.kpi[kpi_id] = value
+                set_kpi_value(state, kpi_id, value)
                 
                 # Показываем подтверждение
                 kpi_config = KPI_CONFIG[kpi_id]
@@ -1196,11 +1348,8 @@ class CleanPremiumBot:
                 state.current_kpi_index += 1
                 print(f"[DEBUG] Moving to next KPI, new index: {state.current_kpi_index}")
                 
-                # Небольшая задержка
-                await asyncio.sleep(0.5)
-                
                 return await self.ask_next_kpi(update, context)
-                
+            
             except ValueError:
                 print(f"[ERROR] Invalid value for KPI: {value_or_action}")
                 return ASKING_KPI
@@ -1231,7 +1380,7 @@ class CleanPremiumBot:
             print(f"[DEBUG] Setting KPI {current_kpi_id} = {percent}% (manual input)")
             
             # Сохраняем значение
-            state.kpi[current_kpi_id] = percent
+            set_kpi_value(state, current_kpi_id, percent)
             
             # Показываем подтверждение
             kpi_config = KPI_CONFIG[current_kpi_id]
@@ -1246,11 +1395,8 @@ class CleanPremiumBot:
             state.current_kpi_index += 1
             print(f"[DEBUG] Moving to next KPI, new index: {state.current_kpi_index}")
             
-            # Небольшая задержка
-            await asyncio.sleep(0.5)
-            
             return await self.ask_next_kpi(update, context)
-            
+        
         except ValueError:
             await update.message.reply_text(
                 f"❌ Некорректное значение.\n\n"
@@ -1281,12 +1427,12 @@ class CleanPremiumBot:
                     coefficient_value = 1.5 if value < 4 else 0.5
                 else:  # speed_delivery
                     coefficient_value = 1.5 if value < 1.5 else 0.5
-                state.team_coefficients[current_coeff_id] = coefficient_value
+                set_team_coefficient(state, current_coeff_id, coefficient_value)
             else:
                 # Для остальных сохраняем введенное значение
                 if value < 0 or value > 200:
                     raise ValueError("Значение должно быть от 0 до 200")
-                state.team_coefficients[current_coeff_id] = value
+                set_team_coefficient(state, current_coeff_id, value)
             
             # Показываем подтверждение
             coeff_config = TEAM_COEFFICIENTS_CONFIG[current_coeff_id]
@@ -1305,11 +1451,8 @@ class CleanPremiumBot:
             # Переходим к следующему коэффициенту
             state.current_coefficient_index += 1
             
-            # Небольшая задержка
-            await asyncio.sleep(0.5)
-            
             return await self.ask_coefficients_with_buttons(update, context, "")
-            
+        
         except ValueError as e:
             await update.message.reply_text(
                 f"❌ Ошибка: {str(e)}\n\n"
@@ -1324,19 +1467,27 @@ class CleanPremiumBot:
         state = user_states[user_id]
         
         try:
-            # Устанавливаем параметры ПВЗ WB перед расчетом
-            self.calculator.set_pvz_params(state.pvz_work_schedule, state.pvz_rating)
-            
-            # Выполняем расчет
-            result = self.calculator.calculate_premium(
+            # Выполняем расчет: все входные данные (включая ПВЗ WB) - в запросе,
+            # общий калькулятор не хранит параметры пользователя
+            request = CalculationRequest(
                 position=state.position,
                 base_salary=state.base_salary,
                 position_rate=state.position_rate,
                 operations=state.operations,
                 kpi_values=state.kpi,
                 team_coefficients=state.team_coefficients,
-                subordinates_bonus=state.subordinates_bonus
+                subordinates_bonus=state.subordinates_bonus,
+                pvz_work_schedule=state.pvz_work_schedule,
+                pvz_rating=state.pvz_rating
+            )
+            # Сессия с накопителем досчитывается по тарифу, с которым начата
+            calculator = (
+                state.premium_accumulator.calculator if state.premium_accumulator is not None
+                else self.current_calculator(state)
             )
+            result = calculator.calculate(request)
+            period = (state.calculation_date or date.today().isoformat())[:7]
+            self.history.record(user_id, request, result, period, calculator.tariff.version)
             
             # Формируем результат
             text = f"🎯 <b>РЕЗУЛЬТАТ РАСЧЕТА ПРЕМИИ</b>\n\n"
@@ -1359,10 +1510,11 @@ class CleanPremiumBot:
             
             text += "\n"
             
-            # Детализация операций
-            if result.operation_details:
+            # Детализация операций (словари строятся по требованию - берем один раз)
+            operation_details = result.operation_details
+            if operation_details:
                 text += "📊 <b>Детализация операций:</b>\n"
-                for detail in result.operation_details:
+                for detail in operation_details:
                     emoji = detail.get('emoji', '📊')
                     name = detail['name']
                     quantity = detail['quantity']
@@ -1375,16 +1527,17 @@ class CleanPremiumBot:
                 text += "\n"
             
             # Детализация КПИ
-            if result.kpi_details:
+            kpi_details = result.kpi_details
+            if kpi_details:
                 text += "⭐ <b>Детализация КПИ:</b>\n"
                 
                 # Показываем базовую информацию
-                if result.kpi_details:
-                    first_detail = result.kpi_details[0]
+                if kpi_details:
+                    first_detail = kpi_details[0]
                     if 'base_kpi_amount' in first_detail:
                         text += f"💰 Базовая сумма КПИ (20% от оклада): <b>{format_money(first_detail['base_kpi_amount'])}</b>\n\n"
                 
-                for detail in result.kpi_details:
+                for detail in kpi_details:
                     emoji = detail.get('emoji', '📊')
                     name = detail['name']
                     percent = detail['percent']
@@ -1427,7 +1580,7 @@ class CleanPremiumBot:
                 )
             
             return SHOWING_RESULTS
-            
+        
         except Exception as e:
             logger.error(f"Ошибка при расчете: {e}")
             await update.message.reply_text(
@@ -1530,7 +1683,7 @@ class CleanPremiumBot:
             reply_markup=get_main_menu()
         )
         return ConversationHandler.END
-
+    
     async def ask_pvz_schedule(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Запрос режима работы ПВЗ WB"""
         keyboard = [
@@ -1594,8 +1747,6 @@ class CleanPremiumBot:
                 parse_mode=ParseMode.HTML
             )
             
-            await asyncio.sleep(0.5)
-            
             # Показываем диалог рейтинга
             return await self.show_pvz_rating_dialog(query)
         
@@ -1685,12 +1836,12 @@ class CleanPremiumBot:
         if len(parts) >= 3:
             rating = float(parts[2])
             state.pvz_rating = rating
+            if state.premium_accumulator is not None:
+                state.premium_accumulator.set_pvz_params(state.pvz_work_schedule, state.pvz_rating)
             
             # Рассчитываем финальную премию за ПВЗ WB
-            from calculator_v2 import PremiumCalculator, format_money
-            calculator = PremiumCalculator()
             quantity = int(state.operations[13])
-            pvz_bonus = calculator.calculate_pvz_wb_bonus(quantity, state.pvz_work_schedule, state.pvz_rating)
+            pvz_bonus = self.current_calculator(state).calculate_pvz_wb_bonus(quantity, state.pvz_work_schedule, state.pvz_rating)
             
             # Показываем итоговый расчет ПВЗ WB
             rating_text = {
@@ -1720,11 +1871,10 @@ class CleanPremiumBot:
             # Переходим к следующей операции
             state.current_operation_index += 1
             
-            await asyncio.sleep(1.0)
             return await self.ask_next_operation(update, context)
         
         return ASKING_PVZ_RATING
-
+    
     def create_numeric_keyboard(self, operation_id: int, max_value: int = 50) -> InlineKeyboardMarkup:
         """Создать цифровую клавиатуру для ввода количества"""
         keyboard = []
@@ -1774,14 +1924,14 @@ class CleanPremiumBot:
         ])
         
         return InlineKeyboardMarkup(keyboard)
-
+    
     async def ask_operation_quantity(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Запрос количества для текущей операции с улучшенным UI"""
         user_id = update.effective_user.id
         state = user_states.get(user_id)
         if not state:
             return ConversationHandler.END
-            
+        
         current_op_id = state.available_operations[state.current_operation_index]
         operation = OPERATIONS_CONFIG[current_op_id]
         
@@ -1818,14 +1968,35 @@ class CleanPremiumBot:
         return ASKING_OPERATION_QUANTITY
 
 
-def main():
+def main(argv=None):
     """Запуск бота"""
+    parser = argparse.ArgumentParser(description="Телеграм-бот калькулятора премий ОПС")
+    parser.add_argument(
+        '--webhook', metavar='URL', default=WEBHOOK_URL,
+        help="публичный https-адрес webhook (по умолчанию WEBHOOK_URL; пусто - long polling)"
+    )
+    parser.add_argument('--listen', default=WEBHOOK_LISTEN, help="адрес HTTP-сервера webhook")
+    parser.add_argument('--port', type=int, default=WEBHOOK_PORT, help="порт HTTP-сервера webhook")
+    args = parser.parse_args(argv)
+    
     print(f"Запуск бота с кнопочным меню...")
     print(f"Токен: {TOKEN[:10]}...")
     
     # Создаем приложение
-    application = Application.builder().token(TOKEN).build()
     bot = CleanPremiumBot()
+    builder = Application.builder().token(TOKEN)
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+    application = (
+        builder
+        .persistence(SqlitePersistence(SESSION_DB_PATH, SESSION_FLUSH_INTERVAL))
+        # Лимиты Telegram на отправку: 30 сообщений/с на бота, 20/мин в группу; RetryAfter - повтор
+        .rate_limiter(AIORateLimiter(max_retries=3))
+        .concurrent_updates(PerUserUpdateProcessor(UPDATE_CONCURRENCY))
+        .post_init(bot.post_init)
+        .post_shutdown(bot.post_shutdown)
+        .build()
+    )
     
     # Создаем обработчик разговора
     conv_handler = ConversationHandler(
@@ -1857,13 +2028,23 @@ def main():
             ENTERING_COEFFICIENTS: [MessageHandler(filters.TEXT, bot.coefficient_entered)],
             SHOWING_RESULTS: [CallbackQueryHandler(bot.result_action, pattern="^final_calculate$|^new_calculation$|^reset_result$|^main_menu$|^show_formulas$|^back_to_result$")]
         },
-        fallbacks=[CommandHandler("cancel", bot.cancel)]
+        fallbacks=[CommandHandler("cancel", bot.cancel)],
+        name="premium_calculation",
+        persistent=True,
+        conversation_timeout=SESSION_IDLE_TTL
     )
     
+    # Шаги после выбора должности работают с сессией пользователя
+    for state, handlers in conv_handler.states.items():
+        if state != CHOOSING_POSITION:
+            for handler in handlers:
+                handler.callback = session_required(handler.callback)
+    
     # Добавляем обработчики
     application.add_handler(conv_handler)
     application.add_handler(CommandHandler("start", bot.start))
     application.add_handler(CommandHandler("help", bot.help_command))
+    application.add_handler(CommandHandler("history", bot.history_command))
     application.add_handler(MessageHandler(
         filters.TEXT & filters.Regex("^(📋 Список должностей|📊 Список операций|❓ Справка|🆘 Помощь|🗑️ Очистить расчет)$"), 
         bot.handle_menu_buttons
@@ -1879,7 +2060,19 @@ def main():
     print("   🗑️ Очистить расчет")
     print("\n🛑 Используйте Ctrl+C для остановки.")
     
-    application.run_polling()
+    if args.webhook:
+        # Сервер webhook python-telegram-bot (экстра webhooks) на HTTP за прокси с TLS;
+        # webhook при остановке не снимается - Telegram копит обновления на время перезапуска
+        application.run_webhook(
+            listen=args.listen,
+            port=args.port,
+            url_path=WEBHOOK_PATH or urlsplit(args.webhook).path.lstrip('/'),
+            webhook_url=args.webhook,
+            secret_token=WEBHOOK_SECRET or secrets.token_urlsafe(32),
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Пакетный расчет премий по файлу сотрудников (региональная ведомость)
+Запуск: python payroll.py run employees.csv -j 16 [-o premiums.csv] [--archive archive/]
+        python payroll.py fund archive/ --ops-from 101000 --ops-to 101999 --month-from 2024-01
+        python payroll.py ytd rollups/ ops 101000 --year 2024 --archive archive/
+
+Формат входного CSV (строка = сотрудник-месяц, пустая ячейка = значение по умолчанию):
+    employee_id, month, ops_id     - переносятся в результат как есть (необязательные);
+                                     month ("ГГГГ-ММ") выбирает версию тарифа (TARIFF_VERSIONS)
+    position                       - ключ POSITIONS_CONFIG
+    base_salary, position_rate     - оклад и ставка
+    op_1 ... op_25                 - количества операций OPERATIONS_CONFIG
+    kpi_revenue, kpi_csi, ...      - проценты выполнения KPI_CONFIG
+    service, speed_reception, speed_delivery, efficiency - командные коэффициенты
+    subordinates_bonus, pvz_work_schedule, pvz_rating
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from calculator_v2 import PremiumCalculator, BatchCalculationResult, MONEY_MODES, configure_tariffs, format_money
+from premium_config import POSITIONS_CONFIG
+from premium_archive import ChunkArchiveWriter, MonthPart, PremiumArchive, MONEY_FIELDS
+from premium_rollups import LEVELS, YtdRollups
+from payroll_io import (
+    OUTPUT_COLUMNS, DEFAULT_CHUNK_SIZE, PARQUET_ROW_GROUP_KEYS, CsvResultWriter, ParquetResultWriter,
+    PayrollChunk, calculate_chunk, iter_csv_chunks, iter_xlsx_chunks, load_header_map,
+    merge_parquet_files, read_csv_header
+)
+
+# Итоги по должности: количество, премия, бонус за операции, КПИ бонус
+PositionTotals = Dict[str, List[float]]
+
+SCAN_BLOCK_SIZE = 1 << 20
+
+def plan_shards(path: str, jobs: int) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """Заголовок файла и диапазоны байт для воркеров, выровненные по границам записей
+    
+    Граница ставится только после конца строки с четным числом кавычек от начала данных:
+    перенос строки внутри поля в кавычках не разрывает запись между шардами.
+    """
+    header, data_start = read_csv_header(path)
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        
+        bounds = [data_start]
+        position, quotes = data_start, 0  # quotes - число кавычек в [data_start, position)
+        f.seek(data_start)
+        for i in range(1, jobs):
+            target = data_start + (size - data_start) * i // jobs
+            while position < target:
+                block = f.read(min(SCAN_BLOCK_SIZE, target - position))
+                quotes += block.count(b'"')
+                position += len(block)
+            
+            if position > data_start:
+                # Дочитываем строку до конца (и до конца записи, если внутри кавычек) -
+                # она целиком в предыдущем шарде
+                line = f.readline()
+                quotes += line.count(b'"')
+                position += len(line)
+                while quotes % 2 and line:
+                    line = f.readline()
+                    quotes += line.count(b'"')
+                    position += len(line)
+            bounds.append(min(position, size))
+        bounds.append(size)
+    
+    shards = [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+    return header, shards
+
+def add_position_totals(totals: PositionTotals, positions: List[str], result: BatchCalculationResult) -> None:
+    """Добавить результаты блока к итогам по должностям"""
+    if not positions:
+        return
+    
+    unique_positions, index = np.unique(np.asarray(positions, dtype=str), return_inverse=True)
+    counts = np.bincount(index, minlength=len(unique_positions))
+    sums = [np.bincount(index, weights=values, minlength=len(unique_positions))
+            for values in (result.total_premium, result.operation_bonus, result.kpi_bonus)]
+    
+    for i, position in enumerate(unique_positions.tolist()):
+        merged = totals.setdefault(position, [0, 0.0, 0.0, 0.0])
+        merged[0] += int(counts[i])
+        for j, values in enumerate(sums, start=1):
+            merged[j] += float(values[i])
+
+def _totals_to_rubles(totals: PositionTotals) -> None:
+    """Итоги режима 'kopeck' → рубли"""
+    for values in totals.values():
+        values[1:] = [value / 100 for value in values[1:]]
+
+OUTPUT_FORMATS = ('csv', 'parquet')
+
+class _ShardTask(NamedTuple):
+    """Задание воркеру: диапазон байт входного файла и временный файл результата"""
+    path: str
+    header: List[str]
+    start: int
+    end: int
+    part_path: str
+    money_mode: str
+    chunk_size: int
+    output_format: str
+    row_groups: str
+    archive_root: Optional[str]
+    tariff_file: Optional[str]
+
+def open_result_writer(
+    path: str,
+    output_format: str = 'csv',
+    money_mode: str = 'float',
+    row_groups: str = 'month',
+    write_header: bool = True
+):
+    """Запись результатов в выбранном формате (CSV или Parquet)"""
+    if output_format == 'parquet':
+        return ParquetResultWriter(path, money_mode, row_groups)
+    return CsvResultWriter(path, money_mode, write_header)
+
+def _calculate_stream(
+    chunks: Iterable[PayrollChunk],
+    writer,
+    money_mode: str,
+    archiver: Optional[ChunkArchiveWriter] = None
+) -> Tuple[PositionTotals, List[MonthPart]]:
+    """Расчет потока блоков с дозаписью результатов (и частей архива, если он задан)"""
+    calculator = PremiumCalculator(money_mode=money_mode)
+    totals: PositionTotals = {}
+    
+    with writer:
+        for chunk in chunks:
+            result = calculate_chunk(calculator, chunk)
+            writer.write(chunk, result)
+            if archiver is not None:
+                archiver.write(chunk.keys, chunk.positions, result)
+            add_position_totals(totals, chunk.positions, result)
+    
+    return totals, archiver.close() if archiver is not None else []
+
+def _run_shard(task: _ShardTask) -> Tuple[int, PositionTotals, List[MonthPart]]:
+    """Воркер: потоковый расчет одного шарда блоками с дозаписью во временный файл"""
+    writer = open_result_writer(
+        task.part_path, task.output_format, task.money_mode, task.row_groups, write_header=False
+    )
+    archiver = (
+        ChunkArchiveWriter(PremiumArchive(task.archive_root), task.money_mode, f".part{task.start}")
+        if task.archive_root else None
+    )
+    configure_tariffs(task.tariff_file)
+    chunks = iter_csv_chunks(task.path, task.chunk_size, task.header, task.start, task.end)
+    totals, parts = _calculate_stream(chunks, writer, task.money_mode, archiver)
+    return writer.rows, totals, parts
+
+def run(
+    input_path: str,
+    output_path: str,
+    jobs: int,
+    money_mode: str = 'float',
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    header_map: Optional[Dict[str, str]] = None,
+    sheet: Optional[str] = None,
+    output_format: str = 'csv',
+    row_groups: str = 'month',
+    archive_root: Optional[str] = None,
+    replace_months: bool = False,
+    tariff_file: Optional[str] = None
+) -> Tuple[int, PositionTotals]:
+    """Расчет файла сотрудников; результат - один файл в исходном порядке строк
+    
+    CSV делится на шарды для пула процессов, XLSX читается одним потоком (read_only).
+    С archive_root результаты дополнительно сохраняются в архив по месяцам (premium_archive);
+    уже опубликованные месяцы заменяются только с replace_months.
+    tariff_file - файл тарифов вместо tariffs.json по умолчанию.
+    """
+    configure_tariffs(tariff_file)
+    archive = PremiumArchive(archive_root) if archive_root else None
+    
+    if input_path.lower().endswith(('.xlsx', '.xlsm')):
+        chunks = iter_xlsx_chunks(input_path, chunk_size, header_map, sheet)
+        writer = open_result_writer(output_path, output_format, money_mode, row_groups)
+        archiver = ChunkArchiveWriter(archive, money_mode) if archive else None
+        totals, parts = _calculate_stream(chunks, writer, money_mode, archiver)
+        if archive:
+            try:
+                archive.publish_parts(parts, replace_months)
+            finally:
+                for part in parts:
+                    if os.path.exists(part.path):
+                        os.remove(part.path)
+        if money_mode == 'kopeck':
+            _totals_to_rubles(totals)
+        return writer.rows, totals
+    
+    header, shards = plan_shards(input_path, jobs)
+    missing = {'position'} - set(header)
+    if missing:
+        raise ValueError(f"В файле нет обязательных столбцов: {', '.join(sorted(missing))}")
+    
+    tasks = [
+        _ShardTask(
+            input_path, header, start, end, f"{output_path}.part{i}",
+            money_mode, chunk_size, output_format, row_groups, archive_root, tariff_file
+        )
+        for i, (start, end) in enumerate(shards)
+    ]
+    
+    total_rows = 0
+    totals: PositionTotals = {}
+    parts: List[MonthPart] = []
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(tasks)))) as pool:
+            for rows, shard_totals, shard_parts in pool.map(_run_shard, tasks):
+                total_rows += rows
+                parts.extend(shard_parts)
+                for position, values in shard_totals.items():
+                    merged = totals.setdefault(position, [0, 0.0, 0.0, 0.0])
+                    for i, value in enumerate(values):
+                        merged[i] += value
+        
+        # Склеиваем части в порядке шардов
+        if output_format == 'parquet':
+            if tasks:
+                merge_parquet_files([task.part_path for task in tasks], output_path)
+            else:
+                open_result_writer(output_path, output_format, money_mode, row_groups).close()
+        else:
+            with open(output_path, 'w', newline='', encoding='utf-8') as out:
+                csv.writer(out).writerow(OUTPUT_COLUMNS)
+                for task in tasks:
+                    with open(task.part_path, 'r', newline='', encoding='utf-8') as part:
+                        shutil.copyfileobj(part, out)
+        
+        if archive:
+            archive.publish_parts(parts, replace_months)
+    finally:
+        for path in [task.part_path for task in tasks] + [part.path for part in parts]:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    if money_mode == 'kopeck':
+        _totals_to_rubles(totals)
+    
+    return total_rows, totals
+
+def write_totals(path: str, totals: PositionTotals) -> None:
+    """Итоги по должностям в CSV"""
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow(('position', 'position_name', 'employees', 'total_premium', 'operation_bonus', 'kpi_bonus'))
+        for position, (count, total, operation_bonus, kpi_bonus) in sorted(totals.items()):
+            writer.writerow((
+                position, POSITIONS_CONFIG.get(position, {}).get('name', position), count,
+                f"{total:.2f}", f"{operation_bonus:.2f}", f"{kpi_bonus:.2f}"
+            ))
+
+def fund(args) -> int:
+    """Фонд премий из архива: итог и разбивка по месяцам"""
+    if not os.path.isdir(args.archive):
+        print(f"❌ Нет каталога архива: {args.archive}", file=sys.stderr)
+        return 1
+    
+    archive = PremiumArchive(args.archive)
+    ops_range = (args.ops_from, args.ops_to)
+    months = (args.month_from, args.month_to)
+    
+    start = time.perf_counter()
+    total = archive.sum(args.field, *ops_range, *months)
+    by_month = archive.totals_by_month(*ops_range, *months) if args.field == 'total_premium' else []
+    elapsed = time.perf_counter() - start
+    
+    for month, rows, month_total in by_month:
+        print(f"  {month}: {rows} чел., {format_money(month_total / 100)}")
+    print(f"💰 {args.field}: {format_money(total / 100)} ({elapsed * 1000:.1f} мс)")
+    return 0
+
+def ytd(args) -> int:
+    """Нарастающие итоги ключа за год (новые месяцы архива загружаются приращением)"""
+    rollups = YtdRollups(args.rollups)
+    if args.archive:
+        if not os.path.isdir(args.archive):
+            print(f"❌ Нет каталога архива: {args.archive}", file=sys.stderr)
+            return 1
+        try:
+            loaded = rollups.ingest_archive(PremiumArchive(args.archive))
+        except ValueError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 1
+        if loaded:
+            print(f"📥 Загружены месяцы: {', '.join(loaded)}")
+    
+    totals = rollups.get(args.level, args.key, args.year)
+    if totals is None:
+        print(f"❌ Нет данных по {args.key} за {args.year}", file=sys.stderr)
+        return 1
+    
+    months = rollups.year(args.year).months
+    print(f"📅 {args.year}: месяцев {len(months)} ({', '.join(sorted(months))})")
+    print(f"  Начислений: {totals['count']}")
+    print(f"  Сумма: {format_money(totals['total'] / 100)}, средняя: {format_money(totals['average'] / 100)}")
+    print(f"  Минимум: {format_money(totals['minimum'] / 100)}, максимум: {format_money(totals['maximum'] / 100)}")
+    for op_id, bonus in totals['operations'].items():
+        print(f"  Операция {op_id}: {format_money(bonus / 100)}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный расчет премий ОПС")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    run_parser = subparsers.add_parser('run', help="рассчитать премии по файлу сотрудников")
+    run_parser.add_argument('input', help="CSV или XLSX (выгрузка 1С ЗУП) с сотрудниками")
+    run_parser.add_argument('-o', '--output', help="файл результатов (по умолчанию <input>_premiums.csv/.parquet)")
+    run_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="число процессов")
+    run_parser.add_argument('--money-mode', choices=MONEY_MODES, default='float', help="арифметика денег")
+    run_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="строк в блоке расчета")
+    run_parser.add_argument('--header-map', help="JSON {\"Заголовок XLSX\": \"столбец\"} в дополнение к стандартной карте")
+    run_parser.add_argument('--sheet', help="лист XLSX (по умолчанию активный)")
+    run_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help="формат результатов")
+    run_parser.add_argument('--row-groups', choices=PARQUET_ROW_GROUP_KEYS, default='month',
+                            help="группы строк Parquet: по месяцу или ОПС")
+    run_parser.add_argument('--archive', help="каталог архива премий по месяцам (memmap)")
+    run_parser.add_argument('--replace-months', action='store_true',
+                            help="заменить месяцы, уже опубликованные в архиве")
+    run_parser.add_argument('--tariffs', help="файл тарифов (по умолчанию tariffs.json)")
+    
+    fund_parser = subparsers.add_parser('fund', help="фонд премий из архива по диапазону ОПС и месяцев")
+    fund_parser.add_argument('archive', help="каталог архива")
+    fund_parser.add_argument('--ops-from', type=int, help="первый индекс ОПС")
+    fund_parser.add_argument('--ops-to', type=int, help="последний индекс ОПС")
+    fund_parser.add_argument('--month-from', help="первый месяц (как в столбце month)")
+    fund_parser.add_argument('--month-to', help="последний месяц")
+    fund_parser.add_argument('--field', choices=MONEY_FIELDS, default='total_premium', help="суммируемое поле")
+    
+    ytd_parser = subparsers.add_parser('ytd', help="нарастающие итоги с начала года")
+    ytd_parser.add_argument('rollups', help="каталог нарастающих итогов")
+    ytd_parser.add_argument('level', choices=LEVELS, help="уровень: сотрудник, ОПС или должность")
+    ytd_parser.add_argument('key', help="табельный номер, индекс ОПС или ключ должности")
+    ytd_parser.add_argument('--year', required=True, help="год (первые 4 символа месяца)")
+    ytd_parser.add_argument('--archive', help="сначала загрузить новые месяцы из архива")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'fund':
+        return fund(args)
+    if args.command == 'ytd':
+        return ytd(args)
+    
+    stem = os.path.splitext(args.output or args.input)[0]
+    output_path = args.output or f"{stem}_premiums.{args.format}"
+    totals_path = f"{os.path.splitext(output_path)[0]}_totals.csv"
+    
+    start = time.perf_counter()
+    try:
+        rows, totals = run(
+            args.input, output_path, max(1, args.jobs), args.money_mode, max(1, args.chunk_size),
+            load_header_map(args.header_map), args.sheet, args.format, args.row_groups, args.archive,
+            args.replace_months, args.tariffs
+        )
+    except (OSError, ValueError, ImportError, KeyError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - start
+    
+    write_totals(totals_path, totals)
+    
+    print(f"✅ Рассчитано строк: {rows} за {elapsed:.2f} с ({rows / elapsed if elapsed else 0:,.0f} строк/с, процессов: {args.jobs})")
+    for position, (count, total, _, _) in sorted(totals.items()):
+        print(f"  {POSITIONS_CONFIG.get(position, {}).get('name', position)}: {count} чел., {format_money(total)}")
+    print(f"📄 Результаты: {output_path}")
+    print(f"📊 Итоги по должностям: {totals_path}")
+    if args.archive:
+        print(f"🗄️ Архив: {args.archive}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,432 @@
+"""
+Потоковый ввод-вывод ведомостей для пакетного расчета премий
+Файл читается блоками фиксированного размера в столбцовые массивы, результаты
+дописываются по мере расчета - потребление памяти не зависит от размера файла.
+"""
+
+import csv
+import json
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from calculator_v2 import PremiumCalculator, BatchCalculationResult, OPERATION_IDS, KPI_IDS, to_kopecks_array
+from premium_config import OPERATIONS_CONFIG, POSITIONS_CONFIG, KPI_CONFIG, TEAM_COEFFICIENTS_CONFIG
+
+KEY_COLUMNS = ('employee_id', 'month', 'ops_id')
+OPERATION_COLUMNS = tuple(f"op_{op_id}" for op_id in OPERATION_IDS)
+KPI_COLUMNS = tuple(f"kpi_{kpi_id}" for kpi_id in KPI_IDS)
+TEAM_COLUMNS = {'service': 0.0, 'speed_reception': 1.0, 'speed_delivery': 1.0, 'efficiency': 0.0}
+OUTPUT_COLUMNS = KEY_COLUMNS + ('position', 'total_premium', 'operation_bonus', 'kpi_bonus', 'real_salary')
+
+TEXT_COLUMNS = KEY_COLUMNS + ('position', 'pvz_work_schedule')
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# Заголовки выгрузки 1С ЗУП → столбцы ведомости (названия операций, КПИ и коэффициентов - из конфигурации)
+XLSX_HEADER_MAP: Dict[str, str] = {
+    "Табельный номер": "employee_id",
+    "Сотрудник": "employee_id",
+    "Месяц": "month",
+    "Период": "month",
+    "Индекс ОПС": "ops_id",
+    "ОПС": "ops_id",
+    "Должность": "position",
+    "Оклад": "base_salary",
+    "Ставка": "position_rate",
+    "Бонус за подчиненных": "subordinates_bonus",
+    "Режим работы ПВЗ": "pvz_work_schedule",
+    "Рейтинг ПВЗ": "pvz_rating",
+    **{op_config['name']: f"op_{op_id}" for op_id, op_config in OPERATIONS_CONFIG.items()},
+    **{kpi_config['name']: f"kpi_{kpi_id}" for kpi_id, kpi_config in KPI_CONFIG.items()},
+    **{coeff_config['name']: coeff_id for coeff_id, coeff_config in TEAM_COEFFICIENTS_CONFIG.items()}
+}
+
+class PayrollChunk(NamedTuple):
+    """Блок строк ведомости в столбцовом виде (входные данные calculate_premium_batch)"""
+    keys: Dict[str, Sequence[str]]
+    positions: List[str]
+    base_salary: np.ndarray
+    position_rate: np.ndarray
+    quantities: np.ndarray
+    kpi_values: np.ndarray
+    team_coefficients: Dict[str, np.ndarray]
+    subordinates_bonus: np.ndarray
+    pvz_work_schedule: List[str]
+    pvz_rating: np.ndarray
+    
+    @property
+    def size(self) -> int:
+        return len(self.positions)
+
+def _float_column(values: Sequence, default: float) -> np.ndarray:
+    """Столбец ячеек → float64, пустые ячейки заменяются значением по умолчанию"""
+    return np.fromiter(
+        (float(value) if value not in ('', None) else default for value in values), float, len(values)
+    )
+
+def rows_to_chunk(header: Sequence[str], rows: List[Sequence]) -> PayrollChunk:
+    """Строки ведомости (в порядке header) → столбцовый блок"""
+    n = len(rows)
+    columns = dict(zip(header, zip(*rows))) if n else {}
+    empty = ('',) * n
+    
+    def numeric(name: str, default: float = 0.0) -> np.ndarray:
+        return _float_column(columns.get(name, empty), default)
+    
+    def text(name: str) -> List[str]:
+        return ['' if value is None else str(value).strip() for value in columns.get(name, empty)]
+    
+    return PayrollChunk(
+        keys={name: text(name) for name in KEY_COLUMNS},
+        positions=text('position'),
+        base_salary=numeric('base_salary'),
+        position_rate=numeric('position_rate'),
+        quantities=np.column_stack([numeric(name) for name in OPERATION_COLUMNS]).reshape(n, len(OPERATION_COLUMNS)),
+        kpi_values=np.column_stack([numeric(name) for name in KPI_COLUMNS]).reshape(n, len(KPI_COLUMNS)),
+        team_coefficients={coeff_id: numeric(coeff_id, default) for coeff_id, default in TEAM_COLUMNS.items()},
+        subordinates_bonus=numeric('subordinates_bonus'),
+        pvz_work_schedule=[schedule or "режим1" for schedule in text('pvz_work_schedule')],
+        pvz_rating=numeric('pvz_rating', 5.0)
+    )
+
+def read_csv_header(path: str, delimiter: str = ',') -> Tuple[List[str], int]:
+    """Заголовок CSV и смещение первой строки данных"""
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        data_start = f.tell()
+    header = next(csv.reader([header_line.decode('utf-8-sig')], delimiter=delimiter), [])
+    return [name.strip() for name in header], data_start
+
+def _iter_lines(path: str, start: int, end: Optional[int]) -> Iterator[str]:
+    """Строки файла из диапазона байт [start, end)"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        for line in f:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line.decode('utf-8')
+
+def iter_row_chunks(rows: Iterable[Sequence], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Sequence]]:
+    """Группировка потока строк в списки по chunk_size"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_csv_chunks(
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    header: Optional[Sequence[str]] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    delimiter: str = ','
+) -> Iterator[PayrollChunk]:
+    """Потоковое чтение CSV блоками по chunk_size строк (диапазон байт - для шардов)"""
+    if header is None or start is None:
+        file_header, data_start = read_csv_header(path, delimiter)
+        header = header or file_header
+        start = data_start if start is None else start
+    
+    width = len(header)
+    rows = (
+        row if len(row) == width else (row + [''] * width)[:width]
+        for row in csv.reader(_iter_lines(path, start, end), delimiter=delimiter) if row
+    )
+    for rows_chunk in iter_row_chunks(rows, chunk_size):
+        yield rows_to_chunk(header, rows_chunk)
+
+def _normalize_header(name) -> str:
+    """Заголовок для сравнения: без регистра и лишних пробелов"""
+    return ' '.join(str(name).replace('\xa0', ' ').split()).casefold()
+
+def load_header_map(path: Optional[str] = None) -> Dict[str, str]:
+    """Карта заголовков: XLSX_HEADER_MAP, дополненная JSON-файлом {"Заголовок": "столбец"}"""
+    header_map = dict(XLSX_HEADER_MAP)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            header_map.update(json.load(f))
+    return header_map
+
+def _xlsx_cell(column: str, value):
+    """Значение ячейки XLSX → вид, как в CSV-ведомости"""
+    if value is None:
+        return ''
+    if column in TEXT_COLUMNS:
+        if isinstance(value, date):
+            return value.strftime('%Y-%m') if column == 'month' else value.isoformat()
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value).strip()
+    if isinstance(value, str):
+        # Числа, сохраненные текстом: "1 234,5"
+        return value.replace('\xa0', '').replace(' ', '').replace(',', '.')
+    return value
+
+def iter_xlsx_chunks(
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    header_map: Optional[Dict[str, str]] = None,
+    sheet: Optional[str] = None
+) -> Iterator[PayrollChunk]:
+    """Потоковое чтение XLSX (режим read_only - книга не загружается в память целиком)
+    
+    Первая непустая строка листа - заголовок. Столбцы сопоставляются через header_map
+    (по умолчанию XLSX_HEADER_MAP); стандартные имена столбцов ведомости принимаются как есть.
+    Должность может быть указана ключом или названием из POSITIONS_CONFIG.
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("Для импорта XLSX установите openpyxl: pip install openpyxl") from None
+    
+    canonical = set(TEXT_COLUMNS + OPERATION_COLUMNS + KPI_COLUMNS + tuple(TEAM_COLUMNS)) | {
+        'base_salary', 'position_rate', 'subordinates_bonus', 'pvz_rating'
+    }
+    lookup = {_normalize_header(name): name for name in canonical}
+    lookup.update({_normalize_header(name): column for name, column in (header_map or XLSX_HEADER_MAP).items()})
+    
+    position_keys = {_normalize_header(key): key for key in POSITIONS_CONFIG}
+    position_keys.update({_normalize_header(config['name']): key for key, config in POSITIONS_CONFIG.items()})
+    
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        # Без сброса openpyxl пересчитывает размеры листа полным проходом, если их нет в файле
+        worksheet.reset_dimensions()
+        rows = worksheet.iter_rows(values_only=True)
+        
+        header_cells = next((row for row in rows if any(cell is not None for cell in row)), ())
+        selected = [
+            (i, lookup[_normalize_header(cell)]) for i, cell in enumerate(header_cells)
+            if cell is not None and _normalize_header(cell) in lookup
+        ]
+        header = [column for _, column in selected]
+        if 'position' not in header:
+            raise ValueError(
+                f"В книге {path} не найден столбец должности; заголовки: "
+                f"{', '.join(str(cell) for cell in header_cells if cell is not None)}"
+            )
+        
+        position_index = header.index('position')
+        
+        def convert(row) -> List:
+            values = [_xlsx_cell(column, row[i] if i < len(row) else None) for i, column in selected]
+            position = values[position_index]
+            values[position_index] = position_keys.get(_normalize_header(position), position)
+            return values
+        
+        data_rows = (convert(row) for row in rows if any(cell is not None for cell in row))
+        for rows_chunk in iter_row_chunks(data_rows, chunk_size):
+            yield rows_to_chunk(header, rows_chunk)
+    finally:
+        workbook.close()
+
+def calculate_chunk(calculator: PremiumCalculator, chunk: PayrollChunk) -> BatchCalculationResult:
+    """Пакетный расчет одного блока (строки - по версии тарифа своего месяца)"""
+    return calculator.calculate_premium_batch(
+        chunk.positions, chunk.base_salary, chunk.position_rate, chunk.quantities, chunk.kpi_values,
+        chunk.team_coefficients, chunk.subordinates_bonus, chunk.pvz_work_schedule, chunk.pvz_rating,
+        dates=chunk.keys['month']
+    )
+
+def format_money_column(values: np.ndarray, money_mode: str = 'float') -> List[str]:
+    """Суммы для вывода: рубли с копейками (в режиме 'kopeck' - без перевода через float)"""
+    if money_mode == 'kopeck':
+        return [f"{value // 100}.{value % 100:02d}" for value in values.tolist()]
+    return [f"{value:.2f}" for value in values.tolist()]
+
+class CsvResultWriter:
+    """Построчная запись результатов расчета в CSV по мере обработки блоков"""
+    
+    def __init__(self, path: str, money_mode: str = 'float', write_header: bool = True):
+        self.money_mode = money_mode
+        self.rows = 0
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if write_header:
+            self._writer.writerow(OUTPUT_COLUMNS)
+    
+    def write(self, chunk: PayrollChunk, result: BatchCalculationResult) -> None:
+        """Дописать результаты блока"""
+        self._writer.writerows(zip(
+            *(chunk.keys[name] for name in KEY_COLUMNS),
+            chunk.positions,
+            *(format_money_column(values, self.money_mode) for values in (
+                result.total_premium, result.operation_bonus, result.kpi_bonus, result.real_salary
+            ))
+        ))
+        self.rows += chunk.size
+    
+    def close(self) -> None:
+        self._file.close()
+    
+    def __enter__(self) -> 'CsvResultWriter':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+PARQUET_ROW_GROUP_KEYS = ('month', 'ops_id')
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+def _import_pyarrow():
+    """Ленивый импорт pyarrow (необязательная зависимость)"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Для вывода в Parquet установите pyarrow: pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+def parquet_result_schema(money_mode: str = 'float'):
+    """Схема результатов: типизированные суммы, словарное кодирование категорий, названия в метаданных"""
+    pa, _ = _import_pyarrow()
+    money = pa.int64() if money_mode == 'kopeck' else pa.float64()
+    
+    fields = [
+        pa.field('employee_id', pa.string()),
+        pa.field('month', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('ops_id', pa.dictionary(pa.int32(), pa.string())),
+        pa.field('position', pa.dictionary(pa.int8(), pa.string())),
+        pa.field('total_premium', money),
+        pa.field('operation_bonus', money),
+        pa.field('kpi_bonus', money),
+        pa.field('real_salary', money),
+        pa.field('efficiency_bonus', money),
+        pa.field('subordinates_bonus', money),
+        pa.field('kpi_blocked', pa.bool_())
+    ]
+    fields += [
+        pa.field(f"op_{op_id}_bonus", money, metadata={'name': OPERATIONS_CONFIG[op_id]['name']})
+        for op_id in OPERATION_IDS
+    ]
+    fields += [
+        pa.field(f"kpi_{kpi_id}_bonus", money, metadata={'name': KPI_CONFIG[kpi_id]['name']})
+        for kpi_id in KPI_IDS
+    ]
+    
+    return pa.schema(fields, metadata={
+        'money_unit': 'kopeck' if money_mode == 'kopeck' else 'rub',
+        'positions': json.dumps({key: config['name'] for key, config in POSITIONS_CONFIG.items()}, ensure_ascii=False)
+    })
+
+class ParquetResultWriter:
+    """Запись результатов в Parquet: столбцы по суммам, операциям и КПИ
+    
+    Строки буферизуются по значению row_groups ('month' или 'ops_id'), поэтому каждая
+    группа строк файла относится к одному месяцу или ОПС и отсекается по статистике.
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        money_mode: str = 'float',
+        row_groups: str = 'month',
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE
+    ):
+        if row_groups not in PARQUET_ROW_GROUP_KEYS:
+            raise ValueError(f"Группы строк Parquet: {', '.join(PARQUET_ROW_GROUP_KEYS)}")
+        
+        self._pa, pq = _import_pyarrow()
+        self.money_mode = money_mode
+        self.row_groups = row_groups
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self.schema = parquet_result_schema(money_mode)
+        self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        
+        # Буферы по ключу группы; общий объем ограничен, чтобы память не росла с числом ключей
+        self._buffers: Dict[str, list] = {}
+        self._buffered_rows: Dict[str, int] = {}
+        self._max_buffered_rows = 4 * row_group_size
+    
+    def _dictionary(self, values: Sequence[str], index_type):
+        pa = self._pa
+        dictionary, indices = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices.reshape(-1), type=index_type), pa.array(dictionary.tolist(), type=pa.string())
+        )
+    
+    def _table(self, chunk: PayrollChunk, result: BatchCalculationResult):
+        pa = self._pa
+        columns = [
+            pa.array(chunk.keys['employee_id'], type=pa.string()),
+            self._dictionary(chunk.keys['month'], pa.int32()),
+            self._dictionary(chunk.keys['ops_id'], pa.int32()),
+            self._dictionary(chunk.positions, pa.int8()),
+            result.total_premium, result.operation_bonus, result.kpi_bonus,
+            result.real_salary, result.efficiency_bonus,
+            to_kopecks_array(chunk.subordinates_bonus) if self.money_mode == 'kopeck' else chunk.subordinates_bonus,
+            pa.array(result.kpi_blocked, type=pa.bool_())
+        ]
+        columns += [result.operation_bonuses[:, j] for j in range(len(OPERATION_IDS))]
+        columns += [result.kpi_bonuses[:, j] for j in range(len(KPI_IDS))]
+        return pa.Table.from_arrays(
+            [column if isinstance(column, pa.Array) else pa.array(column, type=field.type)
+             for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+    
+    def write(self, chunk: PayrollChunk, result: BatchCalculationResult) -> None:
+        """Разложить блок по буферам групп строк"""
+        if not chunk.size:
+            return
+        
+        table = self._table(chunk, result)
+        keys, inverse = np.unique(np.asarray(chunk.keys[self.row_groups], dtype=str), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+        
+        for i, key in enumerate(keys.tolist()):
+            part = table.take(order[bounds[i]:bounds[i + 1]])
+            self._buffers.setdefault(key, []).append(part)
+            self._buffered_rows[key] = self._buffered_rows.get(key, 0) + part.num_rows
+            if self._buffered_rows[key] >= self.row_group_size:
+                self._flush(key)
+        
+        while sum(self._buffered_rows.values()) > self._max_buffered_rows:
+            self._flush(max(self._buffered_rows, key=self._buffered_rows.get))
+        
+        self.rows += chunk.size
+    
+    def _flush(self, key: str) -> None:
+        tables = self._buffers.pop(key)
+        rows = self._buffered_rows.pop(key)
+        table = self._pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+        self._writer.write_table(table, row_group_size=rows)
+    
+    def close(self) -> None:
+        for key in sorted(self._buffers):
+            self._flush(key)
+        self._writer.close()
+    
+    def __enter__(self) -> 'ParquetResultWriter':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def merge_parquet_files(paths: Sequence[str], output_path: str) -> None:
+    """Склейка частей Parquet по группам строк (в памяти - одна группа строк)"""
+    _, pq = _import_pyarrow()
+    writer = None
+    try:
+        for path in paths:
+            part = pq.ParquetFile(path)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, part.schema_arrow, compression='zstd')
+            for i in range(part.num_row_groups):
+                row_group = part.read_row_group(i)
+                writer.write_table(row_group, row_group_size=max(1, row_group.num_rows))
+    finally:
+        if writer is not None:
+            writer.close()
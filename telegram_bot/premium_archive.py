@@ -0,0 +1,326 @@
+"""
+Архив результатов расчета премий по месяцам
+Месяц - файл записей фиксированной длины (numpy.memmap), отсортированных по индексу ОПС,
+и JSON-описание с индексом диапазонов ОПС. Запросы по диапазону ОПС читают только
+страницы файла с нужными записями; суммы хранятся в копейках.
+"""
+
+import json
+import os
+import re
+import uuid
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from calculator_v2 import BatchCalculationResult, OPERATION_IDS, KPI_IDS, to_kopecks_array, tariff_timeline
+from premium_config import POSITIONS_CONFIG
+
+ARCHIVE_FORMAT_VERSION = 1
+
+# Числовые коды должностей (порядок POSITIONS_CONFIG; 0 - неизвестная должность)
+POSITION_CODES: Dict[str, int] = {position: i for i, position in enumerate(POSITIONS_CONFIG, start=1)}
+
+RECORD_DTYPE = np.dtype([
+    ('ops_id', '<u4'),
+    ('employee', '<u4'),                                 # номер в словаре сотрудников месяца
+    ('position', 'u1'),                                  # POSITION_CODES
+    ('kpi_blocked', 'u1'),
+    ('total_premium', '<i8'),                            # копейки
+    ('operation_bonus', '<i8'),
+    ('kpi_bonus', '<i8'),
+    ('efficiency_bonus', '<i8'),
+    ('operation_bonuses', '<i8', (len(OPERATION_IDS),)),  # в порядке OPERATION_IDS
+    ('kpi_bonuses', '<i8', (len(KPI_IDS),))               # в порядке KPI_IDS
+])
+
+MONEY_FIELDS = ('total_premium', 'operation_bonus', 'kpi_bonus', 'efficiency_bonus')
+
+# Месяц архива - часть имени файла, поэтому только вида ГГГГ-ММ
+MONTH_PATTERN = re.compile(r'\d{4}-\d{2}', re.ASCII)
+
+def check_month(month: str) -> str:
+    """Проверка месяца перед использованием в имени файла"""
+    if not isinstance(month, str) or not MONTH_PATTERN.fullmatch(month):
+        raise ValueError(f"Месяц архива должен быть вида ГГГГ-ММ: {month!r}")
+    return month
+
+def _kopecks(values: np.ndarray, money_mode: str) -> np.ndarray:
+    """Суммы результата пакетного расчета → копейки int64"""
+    return np.asarray(values, dtype=np.int64) if money_mode == 'kopeck' else to_kopecks_array(values)
+
+class MonthPart(NamedTuple):
+    """Несортированная часть месяца (от одного процесса): файл записей и словарь сотрудников"""
+    month: str
+    path: str
+    employees: List[str]
+    rows: int
+
+class MonthArchiveWriter:
+    """Запись части месяца: записи дописываются блоками в несортированный файл"""
+    
+    def __init__(self, root: str, month: str, money_mode: str = 'float', part: str = ''):
+        self.month = check_month(month)
+        self.money_mode = money_mode
+        self.rows = 0
+        self._path = os.path.join(root, f"{month}.unsorted{part}")
+        self._file = open(self._path, 'wb')
+        self._employees: Dict[str, int] = {}
+    
+    def write(
+        self,
+        ops_ids: Sequence[str],
+        employee_ids: Sequence[str],
+        positions: Sequence[str],
+        result: BatchCalculationResult,
+        rows: Optional[np.ndarray] = None
+    ) -> None:
+        """Дописать строки блока (rows - индексы строк блока, относящихся к месяцу)"""
+        if rows is None:
+            rows = np.arange(len(positions))
+        
+        records = np.zeros(len(rows), dtype=RECORD_DTYPE)
+        try:
+            records['ops_id'] = [int(ops_ids[i] or 0) for i in rows]
+        except ValueError as e:
+            raise ValueError(f"Индекс ОПС должен быть числом: {e}") from None
+        
+        employees = self._employees
+        records['employee'] = [employees.setdefault(employee_ids[i], len(employees)) for i in rows]
+        records['position'] = [POSITION_CODES.get(positions[i], 0) for i in rows]
+        records['kpi_blocked'] = result.kpi_blocked[rows]
+        for name in MONEY_FIELDS:
+            records[name] = _kopecks(getattr(result, name)[rows], self.money_mode)
+        records['operation_bonuses'] = _kopecks(result.operation_bonuses[rows], self.money_mode)
+        records['kpi_bonuses'] = _kopecks(result.kpi_bonuses[rows], self.money_mode)
+        
+        records.tofile(self._file)
+        self.rows += len(rows)
+    
+    def close(self) -> MonthPart:
+        """Закрыть часть; месяц публикуется через PremiumArchive.publish"""
+        self._file.close()
+        return MonthPart(self.month, self._path, list(self._employees), self.rows)
+
+def _read_records(path: str, rows: int) -> np.ndarray:
+    """Записи файла через memmap (пустой файл memmap не открывает)"""
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r') if rows else np.zeros(0, dtype=RECORD_DTYPE)
+
+class ChunkArchiveWriter:
+    """Раскладка блоков пакетного расчета по месяцам архива (по писателю на месяц)"""
+    
+    def __init__(self, archive: 'PremiumArchive', money_mode: str = 'float', part: str = ''):
+        self.archive = archive
+        self.money_mode = money_mode
+        self.part = part
+        self._writers: Dict[str, MonthArchiveWriter] = {}
+    
+    def write(self, keys: Dict[str, Sequence[str]], positions: Sequence[str], result: BatchCalculationResult) -> None:
+        """Дописать блок; keys - столбцы employee_id, month, ops_id"""
+        months, inverse = np.unique(np.asarray(keys['month'], dtype=str), return_inverse=True)
+        if len(months) and not months[0]:
+            raise ValueError("Для архива нужен месяц (столбец month) в каждой строке")
+        
+        for i, month in enumerate(months.tolist()):
+            writer = self._writers.get(month)
+            if writer is None:
+                writer = self._writers[month] = self.archive.writer(month, self.money_mode, self.part)
+            writer.write(keys['ops_id'], keys['employee_id'], positions, result, np.flatnonzero(inverse == i))
+    
+    def close(self) -> List[MonthPart]:
+        """Закрыть части всех месяцев"""
+        return [writer.close() for writer in self._writers.values()]
+
+class ArchiveMonth:
+    """Открытый месяц архива: записи через memmap и индекс диапазонов ОПС"""
+    
+    def __init__(self, root: str, month: str):
+        check_month(month)
+        with open(os.path.join(root, f"{month}.json"), 'r', encoding='utf-8') as f:
+            self.metadata = json.load(f)
+        if self.metadata['format_version'] != ARCHIVE_FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия архива месяца {month}: {self.metadata['format_version']}")
+        
+        self.month = month
+        self.ops_index = np.asarray(self.metadata['ops_index'], dtype=np.int64)
+        self._starts = np.append(np.asarray(self.metadata['ops_starts'], dtype=np.int64), self.metadata['rows'])
+        self.records = (
+            np.memmap(os.path.join(root, f"{month}.dat"), dtype=RECORD_DTYPE, mode='r')
+            if self.metadata['rows'] else np.zeros(0, dtype=RECORD_DTYPE)
+        )
+    
+    def __len__(self) -> int:
+        return self.metadata['rows']
+    
+    def ops_range(self, ops_from: Optional[int] = None, ops_to: Optional[int] = None) -> np.ndarray:
+        """Записи ОПС с индексами в [ops_from, ops_to] - срез memmap без копирования"""
+        lo = 0 if ops_from is None else int(np.searchsorted(self.ops_index, ops_from, side='left'))
+        hi = len(self.ops_index) if ops_to is None else int(np.searchsorted(self.ops_index, ops_to, side='right'))
+        return self.records[self._starts[lo]:self._starts[hi]]
+    
+    def employee_ids(self, records: np.ndarray) -> List[str]:
+        """Табельные номера для записей"""
+        employees = self.metadata['employees']
+        return [employees[i] for i in records['employee'].tolist()]
+
+class PremiumArchive:
+    """Каталог архива: по паре файлов (.dat + .json) на месяц"""
+    
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._open: Dict[str, ArchiveMonth] = {}
+    
+    def months(self) -> List[str]:
+        """Месяцы архива по возрастанию"""
+        return sorted(
+            name[:-5] for name in os.listdir(self.root)
+            if name.endswith('.json') and MONTH_PATTERN.fullmatch(name[:-5])
+        )
+    
+    def writer(self, month: str, money_mode: str = 'float', part: str = '') -> MonthArchiveWriter:
+        """Запись части месяца (part различает части от разных процессов)"""
+        return MonthArchiveWriter(self.root, month, money_mode, part)
+    
+    def published(self, month: str) -> bool:
+        """Месяц уже опубликован в архиве"""
+        return os.path.exists(os.path.join(self.root, f"{check_month(month)}.json"))
+    
+    def publish(
+        self,
+        month: str,
+        parts: Sequence[MonthPart],
+        chunk_rows: int = 65536,
+        replace: bool = False
+    ) -> None:
+        """Склейка частей, сортировка по ОПС, индекс диапазонов и атомарная замена месяца
+        
+        В память читаются только столбец ОПС и перестановка; записи копируются блоками.
+        Опубликованный месяц заменяется только с replace=True, иначе FileExistsError.
+        """
+        if not replace and self.published(month):
+            raise FileExistsError(f"Месяц {month} уже есть в архиве (для замены нужен replace=True)")
+        data_path = os.path.join(self.root, f"{month}.dat")
+        meta_path = os.path.join(self.root, f"{month}.json")
+        merged_path = os.path.join(self.root, f"{month}.merged")
+        
+        # Склейка частей со сдвигом номеров сотрудников
+        employees: List[str] = []
+        with open(merged_path, 'wb') as out:
+            for part in parts:
+                records = _read_records(part.path, part.rows)
+                for start in range(0, part.rows, chunk_rows):
+                    block = np.array(records[start:start + chunk_rows])
+                    block['employee'] += len(employees)
+                    block.tofile(out)
+                employees.extend(part.employees)
+                del records
+        
+        rows = sum(part.rows for part in parts)
+        merged = _read_records(merged_path, rows)
+        ops_ids = np.asarray(merged['ops_id'])
+        order = np.argsort(ops_ids, kind='stable')
+        with open(data_path + '.tmp', 'wb') as out:
+            for start in range(0, rows, chunk_rows):
+                merged[order[start:start + chunk_rows]].tofile(out)
+        
+        ops_index, starts = np.unique(ops_ids[order], return_index=True)
+        del merged
+        
+        metadata = {
+            'format_version': ARCHIVE_FORMAT_VERSION,
+            'month': month,
+            'rows': rows,
+            'money_unit': 'kopeck',
+            'config_version': tariff_timeline().at(month).version,
+            'published_id': uuid.uuid4().hex,  # новый при каждой публикации (и замене) месяца
+            'record_dtype': RECORD_DTYPE.descr,
+            'positions': list(POSITION_CODES),
+            'operation_ids': list(OPERATION_IDS),
+            'kpi_ids': list(KPI_IDS),
+            'employees': employees,
+            'ops_index': ops_index.tolist(),
+            'ops_starts': starts.tolist()
+        }
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        
+        self._open.pop(month, None)
+        os.replace(data_path + '.tmp', data_path)
+        os.replace(meta_path + '.tmp', meta_path)
+        
+        for path in [merged_path] + [part.path for part in parts]:
+            os.remove(path)
+    
+    def publish_parts(self, parts: Iterable[MonthPart], replace: bool = False) -> List[str]:
+        """Опубликовать части нескольких процессов, сгруппировав по месяцам (в порядке частей)
+        
+        Без replace ни один месяц не публикуется, если хотя бы один уже есть в архиве.
+        """
+        by_month: Dict[str, List[MonthPart]] = {}
+        for part in parts:
+            by_month.setdefault(part.month, []).append(part)
+        
+        existing = [] if replace else [month for month in sorted(by_month) if self.published(month)]
+        if existing:
+            raise FileExistsError(
+                f"Месяцы уже есть в архиве: {', '.join(existing)} (замена: replace=True, в payroll.py - флаг --replace-months)"
+            )
+        
+        for month, month_parts in by_month.items():
+            self.publish(month, month_parts, replace=replace)
+        return sorted(by_month)
+    
+    def month(self, month: str) -> ArchiveMonth:
+        """Открыть месяц (memmap открывается один раз)"""
+        if month not in self._open:
+            self._open[month] = ArchiveMonth(self.root, month)
+        return self._open[month]
+    
+    def _months_between(self, month_from: Optional[str], month_to: Optional[str]) -> Iterable[str]:
+        for month in self.months():
+            if (month_from is None or month >= month_from) and (month_to is None or month <= month_to):
+                yield month
+    
+    def sum(
+        self,
+        field: str = 'total_premium',
+        ops_from: Optional[int] = None,
+        ops_to: Optional[int] = None,
+        month_from: Optional[str] = None,
+        month_to: Optional[str] = None
+    ) -> int:
+        """Сумма поля в копейках по диапазону ОПС и месяцев (например, фонд премий почтамта за год)"""
+        if field not in MONEY_FIELDS:
+            raise ValueError(f"Суммируемые поля: {', '.join(MONEY_FIELDS)}")
+        return sum(
+            int(self.month(month).ops_range(ops_from, ops_to)[field].sum(dtype=np.int64))
+            for month in self._months_between(month_from, month_to)
+        )
+    
+    def totals_by_month(
+        self,
+        ops_from: Optional[int] = None,
+        ops_to: Optional[int] = None,
+        month_from: Optional[str] = None,
+        month_to: Optional[str] = None
+    ) -> List[Tuple[str, int, int]]:
+        """(месяц, число записей, фонд премий в копейках) по диапазону ОПС"""
+        totals = []
+        for month in self._months_between(month_from, month_to):
+            records = self.month(month).ops_range(ops_from, ops_to)
+            totals.append((month, len(records), int(records['total_premium'].sum(dtype=np.int64))))
+        return totals
+    
+    def operation_totals(
+        self,
+        ops_from: Optional[int] = None,
+        ops_to: Optional[int] = None,
+        month_from: Optional[str] = None,
+        month_to: Optional[str] = None
+    ) -> Dict[int, int]:
+        """Бонусы по операциям в копейках по диапазону ОПС и месяцев"""
+        totals = np.zeros(len(OPERATION_IDS), dtype=np.int64)
+        for month in self._months_between(month_from, month_to):
+            totals += self.month(month).ops_range(ops_from, ops_to)['operation_bonuses'].sum(axis=0, dtype=np.int64)
+        return dict(zip(OPERATION_IDS, totals.tolist()))
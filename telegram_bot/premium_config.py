@@ -0,0 +1,152 @@
+"""
+Справочники калькулятора премий: должности, описания операций, КПИ, командные
+коэффициенты и ставки. Модуль без побочных эффектов: не читает файлы, окружение
+и .env, не импортирует telegram - его используют пакетный расчет, сервисы и тесты.
+Тарифы (ставки операций, веса и шкалы КПИ, шкалы коэффициентов, ПВЗ WB, версии)
+хранятся в tariffs.json рядом с модулем и читаются калькулятором при первом расчете;
+другой файл подключает приложение (calculator_v2.configure_tariffs).
+"""
+
+import os
+
+# Файл тарифов по умолчанию
+DEFAULT_TARIFF_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tariffs.json')
+
+# v2.4: Синхронизация с HTML калькулятором премий ОПС
+# Точная копия POSITIONS_CONFIG из HTML
+
+POSITIONS_CONFIG = {
+    "operator": {
+        "name": "Оператор 1-3 класса",
+        "emoji": "👨‍💼",
+        "operations": [1, 3, 4, 5, 6, 7, 10, 11, 12, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24],
+        "kpi": [],  # У обычных операторов НЕТ КПИ
+        "teamCoefficients": ["service", "speed_reception", "speed_delivery", "efficiency"],
+        "hasTeamBonus": False
+    },
+    "nops_operational": {
+        "name": "НОПС без операторов (сам выполняет операции)",
+        "emoji": "👨‍💼",
+        "operations": [1, 3, 4, 5, 6, 7, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 22, 23, 24, 25],
+        "kpi": ["revenue", "csi", "online_rpo", "co1_co2"],
+        "teamCoefficients": [],  # КПИ система вместо коэффициентов
+        "hasTeamBonus": False
+    },
+    "nops_management": {
+        "name": "НОПС с операторами (только руководящие функции)",
+        "emoji": "👨‍✈️",
+        "operations": [10, 11, 12, 13, 14, 25],
+        "kpi": ["revenue", "csi", "online_rpo", "co1_co2"],
+        "teamCoefficients": [],  # КПИ система вместо коэффициентов
+        "hasTeamBonus": True,
+        "isManagementOnly": True
+    },
+    "admin": {
+        "name": "Администратор",
+        "emoji": "👨‍💻",
+        "operations": [3, 11, 16, 19, 20],
+        "kpi": ["revenue", "csi", "online_rpo"],
+        "teamCoefficients": ["service", "speed_reception", "speed_delivery"],
+        "hasTeamBonus": False
+    },
+    "postman": {
+        "name": "Почтальон",
+        "emoji": "🚶‍♂️",
+        "operations": [2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 25],
+        "kpi": [],  # У почтальона НЕТ КПИ
+        "teamCoefficients": ["service", "efficiency"],
+        "hasTeamBonus": False
+    },
+    "chief_specialist": {
+        "name": "Главный специалист по обеспечению почтовой связи",
+        "emoji": "👨‍🔬",
+        "operations": [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25],
+        "kpi": [],  # У главного специалиста НЕТ КПИ
+        "teamCoefficients": ["service", "speed_reception", "speed_delivery", "efficiency"],
+        "hasTeamBonus": False
+    }
+}
+
+# Точная копия OPERATIONS_CONFIG из HTML калькулятора (тарифы rate/type/value/operationType - в файле тарифов)
+OPERATIONS_CONFIG = {
+    1: {"name": "Розница (товары)", "unit": "₽", "emoji": "🛒", "max_reasonable": 10000, "description": "Продажа товаров в розничной торговле"},
+    2: {"name": "Розница 16 ДП", "unit": "₽", "emoji": "🏪", "max_reasonable": 5000, "description": "Продажа товаров по 16 дополнительным позициям"},
+    3: {"name": "Лотерейные билеты", "unit": "₽", "emoji": "🎲", "max_reasonable": 3000, "description": "Продажа лотерейных билетов различных видов"},
+    4: {"name": "Подписка", "unit": "₽", "emoji": "📰", "max_reasonable": 5000, "description": "Оформление подписки на периодические издания"},
+    5: {"name": "Сим-карта тип 1", "unit": "шт", "emoji": "📱", "max_reasonable": 20, "description": "Продажа SIM-карт первого типа"},
+    6: {"name": "Сим-карта тип 2", "unit": "шт", "emoji": "📲", "max_reasonable": 30, "description": "Продажа SIM-карт второго типа"},
+    7: {"name": "Сим-карта тип 3", "unit": "шт", "emoji": "📞", "max_reasonable": 50, "description": "Продажа SIM-карт третьего типа"},
+    8: {"name": "Доставка гиперлока", "unit": "шт", "emoji": "🔒", "max_reasonable": 20, "description": "Доставка посылок через автоматизированные ячейки"},
+    9: {"name": "Платеж с МПКТ", "unit": "шт", "emoji": "💳", "max_reasonable": 100, "description": "Прием платежей с мобильного почтово-кассового терминала"},
+    10: {"name": "Мультиподпись", "unit": "шт", "emoji": "✍️", "max_reasonable": 50, "description": "Оформление услуги множественной подписки"},
+    11: {"name": "Привлечение пенсионера", "unit": "чел", "emoji": "👴", "max_reasonable": 10, "description": "Привлечение пенсионеров для получения пенсии на почте"},
+    12: {"name": "Выдача WB", "unit": "заказ", "emoji": "📦", "max_reasonable": 200, "description": "Выдача заказов Wildberries в ОПС"},
+    13: {"name": "Обеспечение ПВЗ WB", "unit": "услуга", "emoji": "🏢", "max_reasonable": 10, "description": "Организация пункта выдачи заказов Wildberries"},
+    14: {"name": "Возврат клиентов с2с prof", "unit": "клиент", "emoji": "🔄", "max_reasonable": 5, "description": "Возврат клиентов в профессиональные услуги"},
+    15: {"name": "Продажа EMS", "unit": "услуга", "emoji": "📨", "max_reasonable": 50, "description": "Продажа услуг экспресс-доставки EMS"},
+    16: {"name": "Прием EMS предоплач.", "unit": "шт", "emoji": "📮", "max_reasonable": 30, "description": "Прием предоплаченных отправлений EMS"},
+    17: {"name": "Прием РПО посылка", "unit": "шт", "emoji": "📦", "max_reasonable": 100, "description": "Прием регистрируемых почтовых отправлений - посылки"},
+    18: {"name": "Прием РПО письмо", "unit": "шт", "emoji": "✉️", "max_reasonable": 200, "description": "Прием регистрируемых почтовых отправлений - письма"},
+    19: {"name": "Прием предоплач. РПО посылка", "unit": "шт", "emoji": "📮", "max_reasonable": 80, "description": "Прием предоплаченных РПО - посылки"},
+    20: {"name": "Прием предоплач. РПО письмо", "unit": "шт", "emoji": "📧", "max_reasonable": 150, "description": "Прием предоплаченных РПО - письма"},
+    21: {"name": "Вручение РПО посылка", "unit": "шт", "emoji": "📬", "max_reasonable": 100, "description": "Вручение регистрируемых почтовых отправлений - посылки"},
+    22: {"name": "Вручение EКОМ", "unit": "шт", "emoji": "📫", "max_reasonable": 200, "description": "Вручение отправлений электронной коммерции"},
+    23: {"name": "Прием EКОМ", "unit": "шт", "emoji": "📪", "max_reasonable": 200, "description": "Прием отправлений электронной коммерции"},
+    24: {"name": "Прочие транзакции", "unit": "шт", "emoji": "💳", "max_reasonable": 100, "description": "Прочие финансовые транзакции и операции"},
+    25: {"name": "Участие в проектах", "unit": "услуга", "emoji": "🚀", "max_reasonable": 30, "description": "Участие в специальных проектах и инициативах"}
+}
+
+# КПИ конфигурация (синхронизация с HTML)
+KPI_CONFIG = {
+    "revenue": {"name": "КПИ Выручка ОПС", "placeholder": "% выполнения", "description": "80%+ для получения КПИ", "emoji": "💰"},
+    "csi": {"name": "КПИ CSI показатель", "placeholder": "% CSI", "description": "Также влияет на коэффициент операций типа 2", "emoji": "⭐"},
+    "online_rpo": {"name": "КПИ Доля онлайн-РПО", "placeholder": "% выполнения", "emoji": "🌐"},
+    "co1_co2": {"name": "КПИ CO1/CO2", "placeholder": "% выполнения", "emoji": "📊"}
+}
+
+# Командные коэффициенты
+TEAM_COEFFICIENTS_CONFIG = {
+    "service": {
+        "name": "Коэффициент Сервис (CSI)",
+        "placeholder": "Баллы CSI",
+        "description": "Влияет на операции типа 2",
+        "type": "service",
+        "emoji": "⭐"
+    },
+    "speed_reception": {
+        "name": "Коэффициент Скорость приема",
+        "placeholder": "Время в минутах",
+        "description": "Влияет на операции типа 3. Норма: < 4 мин = выполнено, > 4 мин = не выполнено",
+        "type": "speed_reception",
+        "emoji": "⚡"
+    },
+    "speed_delivery": {
+        "name": "Коэффициент Скорость вручения",
+        "placeholder": "Время в минутах",
+        "description": "Влияет на операции типа 4. Норма: < 1:30 мин = выполнено, > 1:30 мин = не выполнено",
+        "type": "speed_delivery",
+        "emoji": "🚚"
+    },
+    "efficiency": {
+        "name": "Коэффициент Эффективности ОПС",
+        "placeholder": "% выручки",
+        "description": "Влияет на итоговую премию",
+        "type": "efficiency",
+        "emoji": "📈"
+    }
+}
+
+# Размеры ставок (новое в v2.4)
+POSITION_RATES = {
+    "0.3": "0.3 ставки",
+    "0.4": "0.4 ставки", 
+    "0.5": "0.5 ставки (полставки)",
+    "0.6": "0.6 ставки",
+    "0.7": "0.7 ставки",
+    "0.8": "0.8 ставки",
+    "0.9": "0.9 ставки",
+    "1.0": "1.0 ставки (полная ставка)",
+    "1.1": "1.1 ставки",
+    "1.2": "1.2 ставки",
+    "1.3": "1.3 ставки"
+}
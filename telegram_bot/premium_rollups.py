@@ -0,0 +1,283 @@
+"""
+Нарастающие итоги премий с начала года (YTD)
+Агрегаты по сотруднику, ОПС и должности (сумма, количество, минимум, максимум,
+бонусы по операциям) обновляются приращением при загрузке очередного месяца.
+Загруженные месяцы запоминаются и повторно не читаются; месяц, замененный в архиве,
+пересобирает итоги своего года. Суммы - в копейках.
+"""
+
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from calculator_v2 import CalculationResult, OPERATION_IDS, to_kopecks
+from premium_archive import PremiumArchive, POSITION_CODES
+
+LEVELS = ('employee', 'ops', 'position')
+
+# Номер столбца операции в подытогах
+_OPERATION_INDEX = {op_id: i for i, op_id in enumerate(OPERATION_IDS)}
+_POSITION_KEYS = np.array([''] + list(POSITION_CODES))
+
+class RollupLevel:
+    """Агрегаты одного уровня: строка на ключ, столбцы - массивы numpy"""
+    
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.int64)
+        self.minimum = np.zeros(0, dtype=np.int64)
+        self.maximum = np.zeros(0, dtype=np.int64)
+        self.operations = np.zeros((0, len(OPERATION_IDS)), dtype=np.int64)
+    
+    def _grow(self, size: int) -> None:
+        """Расширить массивы до size строк (минимум/максимум - нейтральными значениями)"""
+        extra = size - len(self.count)
+        if extra <= 0:
+            return
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        self.total = np.concatenate([self.total, np.zeros(extra, dtype=np.int64)])
+        self.minimum = np.concatenate([self.minimum, np.full(extra, np.iinfo(np.int64).max)])
+        self.maximum = np.concatenate([self.maximum, np.full(extra, np.iinfo(np.int64).min)])
+        self.operations = np.concatenate([self.operations, np.zeros((extra, len(OPERATION_IDS)), dtype=np.int64)])
+    
+    def add(self, keys: np.ndarray, totals: np.ndarray, operations: np.ndarray) -> None:
+        """Добавить строки: ключи, премии и бонусы по операциям (копейки)"""
+        if not len(keys):
+            return
+        
+        # Словарь ключей пополняется только уникальными ключами блока
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        index = self.index
+        slots = np.fromiter(
+            (index.setdefault(key, len(index)) for key in unique_keys.tolist()),
+            dtype=np.int64, count=len(unique_keys)
+        )
+        self._grow(len(index))
+        rows = slots[inverse]
+        
+        size = len(self.count)
+        self.count += np.bincount(rows, minlength=size)
+        np.add.at(self.total, rows, totals)
+        np.minimum.at(self.minimum, rows, totals)
+        np.maximum.at(self.maximum, rows, totals)
+        for j in np.flatnonzero(operations.any(axis=0)):
+            np.add.at(self.operations[:, j], rows, operations[:, j])
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Итоги ключа (суммы в копейках) или None"""
+        i = self.index.get(key)
+        if i is None:
+            return None
+        count = int(self.count[i])
+        return {
+            'count': count,
+            'total': int(self.total[i]),
+            'average': int(self.total[i]) / count if count else 0.0,
+            'minimum': int(self.minimum[i]),
+            'maximum': int(self.maximum[i]),
+            'operations': {
+                op_id: int(value) for op_id, value in zip(OPERATION_IDS, self.operations[i].tolist()) if value
+            }
+        }
+    
+    def save(self, prefix: str) -> Dict[str, np.ndarray]:
+        """Массивы уровня для np.savez"""
+        return {
+            f"{prefix}_keys": np.array(list(self.index), dtype=str),
+            f"{prefix}_count": self.count,
+            f"{prefix}_total": self.total,
+            f"{prefix}_minimum": self.minimum,
+            f"{prefix}_maximum": self.maximum,
+            f"{prefix}_operations": self.operations
+        }
+    
+    @classmethod
+    def load(cls, data, prefix: str) -> 'RollupLevel':
+        """Уровень из массивов np.load"""
+        level = cls()
+        level.index = {key: i for i, key in enumerate(data[f"{prefix}_keys"].tolist())}
+        level.count = data[f"{prefix}_count"]
+        level.total = data[f"{prefix}_total"]
+        level.minimum = data[f"{prefix}_minimum"]
+        level.maximum = data[f"{prefix}_maximum"]
+        level.operations = data[f"{prefix}_operations"]
+        return level
+
+class YearRollups:
+    """Итоги одного года: загруженные месяцы и агрегаты по уровням"""
+    
+    def __init__(self, year: str):
+        self.year = year
+        self.months: List[str] = []
+        self.sources: List[str] = []  # published_id месяца архива ('' - загружен из результатов расчета)
+        self.levels: Dict[str, RollupLevel] = {level: RollupLevel() for level in LEVELS}
+
+class YtdRollups:
+    """Каталог нарастающих итогов: по файлу .npz на год, запись атомарной заменой"""
+    
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._years: Dict[str, YearRollups] = {}
+    
+    def _path(self, year: str) -> str:
+        """Файл итогов года"""
+        return os.path.join(self.root, f"{year}.npz")
+    
+    def year(self, year: str) -> YearRollups:
+        """Итоги года (файл читается один раз)"""
+        if year not in self._years:
+            rollups = YearRollups(year)
+            if os.path.exists(self._path(year)):
+                with np.load(self._path(year)) as data:
+                    rollups.months = data['months'].tolist()
+                    rollups.sources = data['sources'].tolist()
+                    rollups.levels = {level: RollupLevel.load(data, level) for level in LEVELS}
+            self._years[year] = rollups
+        return self._years[year]
+    
+    def ingested(self, month: str) -> bool:
+        """Месяц уже учтен в итогах"""
+        return month in self.year(month[:4]).months
+    
+    def ingest(
+        self,
+        month: str,
+        employee_ids: Sequence[str],
+        ops_ids: Sequence[str],
+        positions: Sequence[str],
+        total_premium: np.ndarray,
+        operation_bonuses: np.ndarray
+    ) -> None:
+        """Загрузить месяц (суммы в копейках, operation_bonuses - n × OPERATION_IDS)
+        
+        Итоги обновляются приращением; месяц, загруженный ранее, отклоняется.
+        """
+        self.add_block(month, employee_ids, ops_ids, positions, total_premium, operation_bonuses)
+        self.commit(month)
+    
+    def add_block(
+        self,
+        month: str,
+        employee_ids: Sequence[str],
+        ops_ids: Sequence[str],
+        positions: Sequence[str],
+        total_premium: np.ndarray,
+        operation_bonuses: np.ndarray
+    ) -> None:
+        """Добавить блок строк месяца без сохранения (месяц фиксируется вызовом commit)"""
+        if self.ingested(month):
+            raise ValueError(f"Месяц {month} уже загружен в нарастающие итоги")
+        
+        levels = self.year(month[:4]).levels
+        totals = np.asarray(total_premium, dtype=np.int64)
+        operations = np.asarray(operation_bonuses, dtype=np.int64).reshape(len(totals), len(OPERATION_IDS))
+        try:
+            for level, keys in zip(LEVELS, (employee_ids, ops_ids, positions)):
+                levels[level].add(np.asarray(keys, dtype=str), totals, operations)
+        except Exception:
+            # Недозагруженный месяц отбрасываем - итоги года перечитаются из файла
+            self._years.pop(month[:4], None)
+            raise
+    
+    def commit(self, month: str, source: str = '') -> None:
+        """Отметить месяц загруженным и сохранить итоги года (source - published_id месяца архива)"""
+        rollups = self.year(month[:4])
+        rollups.months.append(month)
+        rollups.sources.append(source)
+        
+        arrays = {'months': np.array(rollups.months, dtype=str), 'sources': np.array(rollups.sources, dtype=str)}
+        for level in LEVELS:
+            arrays.update(rollups.levels[level].save(level))
+        
+        path = self._path(rollups.year)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(path + '.tmp', path)
+    
+    def ingest_results(
+        self,
+        month: str,
+        entries: Iterable[Tuple[str, str, str, CalculationResult]]
+    ) -> None:
+        """Загрузить месяц из результатов calculate: (табельный номер, ОПС, должность, результат)"""
+        employee_ids, ops_ids, positions, totals, operations = [], [], [], [], []
+        for employee_id, ops_id, position, result in entries:
+            employee_ids.append(employee_id)
+            ops_ids.append(ops_id)
+            positions.append(position)
+            
+            kopecks = int if result.in_kopecks else to_kopecks
+            totals.append(kopecks(result.total_premium))
+            row = [0] * len(OPERATION_IDS)
+            for op_id, bonus in zip(result.operation_ids, result.operation_final_bonuses):
+                row[_OPERATION_INDEX[op_id]] = kopecks(bonus)
+            operations.append(row)
+        
+        self.ingest(
+            month, employee_ids, ops_ids, positions,
+            np.asarray(totals, dtype=np.int64),
+            np.asarray(operations, dtype=np.int64).reshape(len(totals), len(OPERATION_IDS))
+        )
+    
+    def _stale_years(self, published: Dict[str, str]) -> List[str]:
+        """Годы, в которых учтенный месяц архива с тех пор заменен (другой published_id)"""
+        stale = []
+        for year in sorted({month[:4] for month in published}):
+            rollups = self.year(year)
+            if any(
+                source and month in published and source != published[month]
+                for month, source in zip(rollups.months, rollups.sources)
+            ):
+                stale.append(year)
+        return stale
+    
+    def ingest_archive(self, archive: PremiumArchive, chunk_rows: int = 65536) -> List[str]:
+        """Загрузить из архива премий новые и замененные месяцы (блоками по chunk_rows)
+        
+        Замененный месяц нельзя вычесть из итогов - минимум и максимум не обратимы, -
+        поэтому итоги его года собираются из архива заново.
+        """
+        published = {month: archive.month(month).metadata.get('published_id', '') for month in archive.months()}
+        
+        for year in self._stale_years(published):
+            rollups = self.year(year)
+            foreign = [
+                month for month, source in zip(rollups.months, rollups.sources)
+                if not source or month not in published
+            ]
+            if foreign:
+                raise ValueError(
+                    f"Итоги {year} нельзя пересобрать из архива: месяцы {', '.join(foreign)} загружены не из него"
+                )
+            self._years[year] = YearRollups(year)
+        
+        loaded = []
+        for month in published:
+            if self.ingested(month):
+                continue
+            
+            archive_month = archive.month(month)
+            employees = np.asarray(archive_month.metadata['employees'], dtype=str)
+            records = archive_month.records
+            for start in range(0, len(records), chunk_rows):
+                block = records[start:start + chunk_rows]
+                self.add_block(
+                    month,
+                    employees[block['employee']],
+                    block['ops_id'].astype(str),
+                    _POSITION_KEYS[block['position']],
+                    block['total_premium'],
+                    block['operation_bonuses']
+                )
+            self.commit(month, published[month])
+            loaded.append(month)
+        return loaded
+    
+    def get(self, level: str, key: str, year: str) -> Optional[Dict[str, Any]]:
+        """Итоги с начала года по ключу уровня (employee / ops / position)"""
+        if level not in LEVELS:
+            raise ValueError(f"Уровни итогов: {', '.join(LEVELS)}")
+        return self.year(year).levels[level].get(key)
@@ -0,0 +1,329 @@
+"""
+Сессии пользователей бота в SQLite (WAL) через механизм persistence python-telegram-bot
+Хранятся UserState (в user_data пользователя) и шаги ConversationHandler. Приложение
+собирает изменения и передает их раз в update_interval секунд; все изменения прохода
+пишутся одной транзакцией в отдельном потоке - нажатие цифры на клавиатуре не ждет диска.
+"""
+
+import asyncio
+import dataclasses
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict, defaultdict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config_v2 import UserState
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_states (
+    user_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+# Ключ UserState в user_data пользователя (другие ключи user_data не сохраняются)
+STATE_KEY = 'user_state'
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_IDLE_TTL = 6 * 3600     # секунды без обращений до удаления сессии
+DEFAULT_MAX_SESSIONS = 10000
+
+def connect(path: str) -> sqlite3.Connection:
+    """Соединение с базой сессий: WAL и схема"""
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+def dump_user_state(state: UserState) -> str:
+    """UserState в JSON (без накопителя премии)"""
+    fields = state.__getstate__()
+    del fields['premium_accumulator']
+    return json.dumps(fields, ensure_ascii=False, separators=(',', ':'))
+
+def load_user_state(text: str) -> UserState:
+    """UserState из JSON; неизвестные поля (от другой версии бота) отбрасываются"""
+    fields = json.loads(text)
+    known = {field.name for field in dataclasses.fields(UserState)}
+    state = UserState(**{name: value for name, value in fields.items() if name in known})
+    # В JSON ключи словаря операций - строки
+    state.operations = {int(op_id): quantity for op_id, quantity in state.operations.items()}
+    return state
+
+class SqlitePersistence(BasePersistence):
+    """Persistence для Application: user_data (UserState) и состояния разговоров в SQLite"""
+    
+    def __init__(self, path: str, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=flush_interval
+        )
+        self.path = path
+        self.written = 0
+        # Все обращения к соединению - из одного потока
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sessions')
+        self._connection: Optional[sqlite3.Connection] = None
+        # Изменения текущего прохода: последняя версия на ключ, None - удаление
+        self._pending_users: Dict[int, Optional[str]] = {}
+        self._pending_conversations: Dict[Tuple[str, str], Optional[str]] = {}
+        self._write_task: Optional[asyncio.Task] = None
+    
+    async def _run(self, function: Callable, *args) -> Any:
+        """Выполнить функцию в потоке базы (соединение открывается при первом обращении)"""
+        def call():
+            if self._connection is None:
+                self._connection = connect(self.path)
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+    
+    async def get_user_data(self) -> Dict[int, Dict[str, Any]]:
+        rows = await self._run(lambda: self._connection.execute("SELECT user_id, state FROM user_states").fetchall())
+        user_data = {}
+        for user_id, text in rows:
+            try:
+                user_data[user_id] = {STATE_KEY: load_user_state(text)}
+            except (ValueError, TypeError) as e:
+                logger.error(f"Сессия пользователя {user_id} не восстановлена: {e}")
+        logger.info(f"Восстановлено сессий: {len(user_data)}")
+        return user_data
+    
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        rows = await self._run(
+            lambda: self._connection.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        )
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+    
+    async def update_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        state = data.get(STATE_KEY)
+        self._pending_users[user_id] = dump_user_state(state) if state is not None else None
+        self._schedule_write()
+    
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending_users[user_id] = None
+        self._schedule_write()
+    
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        state = json.dumps(new_state) if new_state is not None else None
+        self._pending_conversations[(name, json.dumps(list(key)))] = state
+        self._schedule_write()
+    
+    def _schedule_write(self) -> None:
+        """Одна запись на проход обновления: задача стартует после всех update_* прохода"""
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_pending())
+    
+    async def _write_pending(self) -> None:
+        """Записать накопленные изменения одной транзакцией"""
+        # Приложение запускает update_* прохода одним gather: уступаем цикл, пока они отработают
+        await asyncio.sleep(0)
+        users, self._pending_users = self._pending_users, {}
+        conversations, self._pending_conversations = self._pending_conversations, {}
+        if not users and not conversations:
+            return
+        try:
+            await self._run(self._write_batch, users, conversations)
+            self.written += len(users) + len(conversations)
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи сессий ({len(users)} пользователей): {e}")
+    
+    def _write_batch(
+        self,
+        users: Dict[int, Optional[str]],
+        conversations: Dict[Tuple[str, str], Optional[str]]
+    ) -> None:
+        """Пачка изменений одной транзакцией (поток базы)"""
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO user_states (user_id, state, updated_at) VALUES (?, ?, ?)",
+                [(user_id, state, now) for user_id, state in users.items() if state is not None]
+            )
+            self._connection.executemany(
+                "DELETE FROM user_states WHERE user_id = ?",
+                [(user_id,) for user_id, state in users.items() if state is None]
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                [(name, key, state) for (name, key), state in conversations.items() if state is not None]
+            )
+            self._connection.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [(name, key) for (name, key), state in conversations.items() if state is None]
+            )
+    
+    async def flush(self) -> None:
+        """Дописать изменения и закрыть базу (остановка приложения)"""
+        if self._write_task is not None:
+            await self._write_task
+        await self._write_pending()
+        if self._connection is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
+    
+    # Данные чатов, бота и callback_data не хранятся (store_data)
+    async def get_chat_data(self) -> Dict[int, Dict[str, Any]]:
+        return {}
+    
+    async def get_bot_data(self) -> Dict[str, Any]:
+        return {}
+    
+    async def get_callback_data(self) -> None:
+        return None
+    
+    async def update_chat_data(self, chat_id: int, data: Dict[str, Any]) -> None:
+        pass
+    
+    async def update_bot_data(self, data: Dict[str, Any]) -> None:
+        pass
+    
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+    
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+    
+    async def refresh_user_data(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        pass
+    
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[str, Any]) -> None:
+        pass
+    
+    async def refresh_bot_data(self, bot_data: Dict[str, Any]) -> None:
+        pass
+
+class SessionStates(MutableMapping):
+    """Состояния пользователей по user_id поверх user_data приложения
+    
+    Изменения в обработчике отмечаются приложением и уходят в persistence. После
+    восстановления из базы у состояния нет накопителя премии - его собирает restore.
+    Сессии без обращений дольше idle_ttl удаляет sweep; сверх max_sessions вытесняются
+    давно неактивные (LRU).
+    """
+    
+    def __init__(
+        self,
+        restore: Optional[Callable[[UserState], None]] = None,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        clock: Callable[[], float] = time.time
+    ):
+        self.restore = restore
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        # Источник времени для last_active и sweep (в тестах - подменяемые часы)
+        self.clock = clock
+        self.expired = 0
+        self.evicted = 0
+        # До bind (без приложения) - обычный словарь в памяти
+        self._user_data: MutableMapping = defaultdict(dict)
+        self._drop: Optional[Callable[[int], None]] = None
+        # Порядок обращений: в начале - давно неактивные
+        self._recent: OrderedDict = OrderedDict()
+    
+    def bind(self, application) -> None:
+        """Подключить user_data приложения (после initialize - с восстановленными сессиями)"""
+        self._user_data = application.user_data
+        self._drop = application.drop_user_data
+        restored = [(data[STATE_KEY].last_active, user_id) for user_id, data in self._user_data.items() if STATE_KEY in data]
+        self._recent = OrderedDict((user_id, None) for _, user_id in sorted(restored))
+    
+    def _touch(self, user_id: int, state: UserState) -> None:
+        """Отметить обращение к сессии"""
+        state.last_active = self.clock()
+        self._recent[user_id] = None
+        self._recent.move_to_end(user_id)
+    
+    def _remove(self, user_id: int) -> None:
+        """Удалить сессию из памяти и (через приложение) из базы"""
+        self._recent.pop(user_id, None)
+        if self._drop is not None:
+            self._drop(user_id)
+        else:
+            self._user_data.pop(user_id, None)
+    
+    def _evict_overflow(self) -> None:
+        """Вытеснить давно неактивные сессии сверх max_sessions"""
+        while len(self._recent) > self.max_sessions:
+            self._remove(next(iter(self._recent)))
+            self.evicted += 1
+    
+    def __getitem__(self, user_id: int) -> UserState:
+        data = self._user_data.get(user_id)
+        if not data or STATE_KEY not in data:
+            raise KeyError(user_id)
+        state = data[STATE_KEY]
+        self._touch(user_id, state)
+        if state.premium_accumulator is None and state.position and self.restore is not None:
+            self.restore(state)
+        return state
+    
+    def __setitem__(self, user_id: int, state: UserState) -> None:
+        self._user_data[user_id][STATE_KEY] = state
+        self._touch(user_id, state)
+        self._evict_overflow()
+    
+    def __delitem__(self, user_id: int) -> None:
+        if user_id not in self:
+            raise KeyError(user_id)
+        self._remove(user_id)
+    
+    def __contains__(self, user_id: object) -> bool:
+        data = self._user_data.get(user_id)
+        return bool(data) and STATE_KEY in data
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._recent))
+    
+    def __len__(self) -> int:
+        return len(self._recent)
+    
+    def sweep(self) -> int:
+        """Удалить сессии без обращений дольше idle_ttl и пустые user_data; число удаленных сессий"""
+        deadline = self.clock() - self.idle_ttl
+        expired = 0
+        for user_id in list(self._recent):
+            data = self._user_data.get(user_id)
+            if data and STATE_KEY in data and data[STATE_KEY].last_active > deadline:
+                break  # дальше - только более свежие
+            self._remove(user_id)
+            expired += 1
+        self.expired += expired
+        self._evict_overflow()
+        
+        # Приложение заводит user_data на каждого написавшего; без сессии они не нужны
+        for user_id in [user_id for user_id, data in self._user_data.items() if STATE_KEY not in data]:
+            self._remove(user_id)
+        return expired
+    
+    def stats(self, sample_size: int = 100) -> Dict[str, Any]:
+        """Показатели: число сессий, примерный размер сессии (JSON, по выборке свежих), удаления"""
+        sample = []
+        for user_id in reversed(self._recent):
+            if len(sample) >= sample_size:
+                break
+            data = self._user_data.get(user_id)
+            if data and STATE_KEY in data:
+                sample.append(len(dump_user_state(data[STATE_KEY]).encode('utf-8')))
+        return {
+            'sessions': len(self._recent),
+            'approx_bytes_per_session': sum(sample) // len(sample) if sample else 0,
+            'expired': self.expired,
+            'evicted': self.evicted
+        }
@@ -0,0 +1,204 @@
+"""
+Внешний файл тарифов (tariffs.json): чтение, проверка и отслеживание изменений
+Разделы файла:
+    operations                  - тариф операций по ID: rate (текст), type, value, operationType
+    kpi_weights                 - веса КПИ по должностям
+    kpi_thresholds              - шкалы коэффициентов КПИ: default, steps [[порог, коэффициент], ...]
+    team_coefficient_thresholds - шкалы командных коэффициентов (zero - значение при 0)
+    pvz_wb                      - тариф ПВЗ WB: quantity_bands, schedules, rating_thresholds, wb1, wb2
+    versions                    - версии тарифа с датой вступления в силу (effective_from, ISO "ГГГГ-ММ-ДД",
+                                  по возрастанию): версия действует до следующей и дополняет предыдущую
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Разделы тарифа, которые могут меняться по версиям
+TARIFF_SECTIONS = ('operations', 'kpi_weights', 'kpi_thresholds', 'team_coefficient_thresholds', 'pvz_wb')
+
+OPERATION_TYPES = ('fixed', 'percent', 'formula')
+PVZ_WB_KEYS = ('quantity_bands', 'schedules', 'rating_thresholds', 'wb1', 'wb2')
+
+def _number(value: Any, where: str) -> float:
+    """Проверка числового значения"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{where}: ожидалось число, получено {value!r}")
+    return value
+
+def _parse_operations(raw: Dict[str, Any], where: str, partial: bool = False) -> Dict[int, Dict[str, Any]]:
+    """Операции: ключи → int, проверка типа, тарифа и слота коэффициента"""
+    operations = {}
+    for key, op_tariff in raw.items():
+        try:
+            op_id = int(key)
+        except ValueError:
+            raise ValueError(f"{where}: ID операции должен быть числом: {key!r}") from None
+        if not isinstance(op_tariff, dict):
+            raise ValueError(f"{where}: операция {op_id} должна быть объектом")
+        
+        required = () if partial else ('type', 'value', 'operationType')
+        missing = [name for name in required if name not in op_tariff]
+        if missing:
+            raise ValueError(f"{where}: у операции {op_id} нет полей {', '.join(missing)}")
+        if 'type' in op_tariff and op_tariff['type'] not in OPERATION_TYPES:
+            raise ValueError(f"{where}: неизвестный тип операции {op_id}: {op_tariff['type']!r}")
+        if 'value' in op_tariff and _number(op_tariff['value'], f"{where}: операция {op_id}") < 0:
+            raise ValueError(f"{where}: отрицательный тариф операции {op_id}")
+        if 'operationType' in op_tariff and op_tariff['operationType'] not in (1, 2, 3, 4):
+            raise ValueError(f"{where}: operationType операции {op_id} должен быть 1-4")
+        operations[op_id] = dict(op_tariff)
+    return operations
+
+def _parse_weights(raw: Dict[str, Any], where: str) -> Dict[str, Dict[str, float]]:
+    """Веса КПИ: доли от 0 до 1"""
+    for position, weights in raw.items():
+        for kpi_id, weight in weights.items():
+            if not 0 <= _number(weight, f"{where}: вес {position}.{kpi_id}") <= 1:
+                raise ValueError(f"{where}: вес {position}.{kpi_id} должен быть от 0 до 1")
+    return {position: dict(weights) for position, weights in raw.items()}
+
+def _parse_scales(raw: Dict[str, Any], where: str) -> Dict[str, Dict[str, Any]]:
+    """Шкалы: пары [порог, коэффициент] → кортежи"""
+    scales = {}
+    for scale_id, spec in raw.items():
+        steps = spec.get('steps')
+        if not isinstance(steps, list) or not all(isinstance(step, list) and len(step) == 2 for step in steps):
+            raise ValueError(f"{where}: шкала {scale_id} - steps должен быть списком пар [порог, коэффициент]")
+        for threshold, coeff in steps:
+            _number(threshold, f"{where}: порог шкалы {scale_id}")
+            _number(coeff, f"{where}: коэффициент шкалы {scale_id}")
+        scales[scale_id] = {**spec, 'steps': [tuple(step) for step in steps]}
+    return scales
+
+def _parse_sections(raw: Dict[str, Any], where: str, partial: bool) -> Dict[str, Any]:
+    """Разделы тарифа (в версии - только измененные)"""
+    sections = {}
+    for section in TARIFF_SECTIONS:
+        if section not in raw:
+            if not partial:
+                raise ValueError(f"{where}: нет раздела {section}")
+            continue
+        if not isinstance(raw[section], dict):
+            raise ValueError(f"{where}: раздел {section} должен быть объектом")
+        
+        if section == 'operations':
+            sections[section] = _parse_operations(raw[section], where, partial)
+        elif section == 'kpi_weights':
+            sections[section] = _parse_weights(raw[section], where)
+        elif section == 'pvz_wb':
+            missing = [key for key in PVZ_WB_KEYS if key not in raw[section]]
+            if missing and not partial:
+                raise ValueError(f"{where}: в pvz_wb нет {', '.join(missing)}")
+            sections[section] = dict(raw[section])
+        else:
+            sections[section] = _parse_scales(raw[section], where)
+    return sections
+
+def parse_tariff_data(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверка и приведение данных файла тарифов (ошибки - ValueError)"""
+    if not isinstance(raw, dict):
+        raise ValueError("Файл тарифов должен содержать объект JSON")
+    unknown = set(raw) - set(TARIFF_SECTIONS) - {'versions'}
+    if unknown:
+        raise ValueError(f"Неизвестные разделы файла тарифов: {', '.join(sorted(unknown))}")
+    
+    data = _parse_sections(raw, "Тарифы", partial=False)
+    
+    versions = raw.get('versions', [])
+    if not isinstance(versions, list):
+        raise ValueError("Раздел versions должен быть списком")
+    data['versions'] = []
+    for version in versions:
+        if not isinstance(version, dict) or 'effective_from' not in version:
+            raise ValueError("Каждая версия тарифа должна быть объектом с effective_from")
+        where = f"Версия тарифа {version['effective_from']}"
+        unknown = set(version) - set(TARIFF_SECTIONS) - {'effective_from'}
+        if unknown:
+            raise ValueError(f"{where}: неизвестные разделы {', '.join(sorted(unknown))}")
+        data['versions'].append({
+            'effective_from': version['effective_from'], **_parse_sections(version, where, partial=True)
+        })
+    return data
+
+def read_tariff_file(path: str) -> Dict[str, Any]:
+    """Прочитать и проверить файл тарифов"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    return _decode(content, path)
+
+def _decode(content: bytes, path: str) -> Dict[str, Any]:
+    """Разбор содержимого файла тарифов"""
+    try:
+        raw = json.loads(content.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Файл тарифов {path} не разобран: {e}") from None
+    return parse_tariff_data(raw)
+
+class TariffFileWatcher:
+    """Отслеживание файла тарифов: при изменении содержимого - проверка и установка
+    
+    install получает проверенные данные, компилирует их и подменяет активный тариф;
+    ошибка проверки или компиляции оставляет в работе прежнюю версию.
+    """
+    
+    def __init__(self, path: str, install: Callable[[Dict[str, Any]], Any], digest: Optional[str] = None):
+        self.path = path
+        self.install = install
+        self.digest = digest              # sha256 установленного содержимого
+        self.reloads = 0
+        self.failures = 0
+        self._signature: Optional[Tuple[int, int]] = None  # (mtime, размер) установленного файла
+        self._rejected: Optional[str] = None               # sha256 последнего отклоненного содержимого
+    
+    def check(self) -> bool:
+        """Проверить файл; True - установлена новая версия тарифов"""
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            logger.error(f"Файл тарифов недоступен: {e}")
+            return False
+        
+        # Дешевая проверка по времени изменения и размеру; содержимое читаем только при их смене.
+        # Подпись запоминается только для установленного содержимого: отклоненный или
+        # недочитанный файл проверяется снова при следующем опросе
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return False
+        
+        try:
+            with open(self.path, 'rb') as f:
+                content = f.read()
+        except OSError as e:
+            logger.error(f"Файл тарифов не прочитан: {e}")
+            return False
+        
+        digest = hashlib.sha256(content).hexdigest()
+        if digest == self.digest:
+            self._signature = signature  # файл переписан без изменений - не переустанавливаем
+            return False
+        if digest == self._rejected:
+            return False
+        
+        try:
+            self.install(_decode(content, self.path))
+        except (ValueError, KeyError, TypeError) as e:
+            self.failures += 1
+            self._rejected = digest
+            logger.error(f"Новые тарифы отклонены, в работе прежняя версия: {e}")
+            return False
+        
+        self.digest = digest
+        self._signature = signature
+        self.reloads += 1
+        logger.info(f"Тарифы обновлены из {self.path} ({digest[:12]})")
+        return True
+
+def file_digest(path: str) -> str:
+    """sha256 содержимого файла"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
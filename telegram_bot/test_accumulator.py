@@ -0,0 +1,133 @@
+"""
+Проверка PremiumAccumulator: после каждого шага опросника текущая премия совпадает
+с calculate_premium по тем же данным (для всех должностей)
+Запуск: python test_accumulator.py (или pytest)
+"""
+
+import math
+import os
+import random
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+from calculator_v2 import PremiumAccumulator, PremiumCalculator
+from config_v2 import POSITIONS_CONFIG
+
+RUNS_PER_POSITION = 40
+
+QUANTITIES = (0, 1, 3, 17.5, 50, 51, 100, 101, 166, 167, 1234.56)
+KPI_PERCENTS = (0, 50, 79.9, 80, 85, 90, 95, 100, 105, 110, 120)
+TEAM_VALUES = {
+    'service': (0, 80, 90, 95, 100),
+    'speed_reception': (0.5, 1.0, 1.5),
+    'speed_delivery': (0.5, 1.0, 1.5),
+    'efficiency': (0, 95, 100, 110)
+}
+PVZ_SCHEDULES = ('режим1', 'режим2', 'полный', 'несоответствие')
+PVZ_RATINGS = (0, 0.1, 4.9, 4.95, 5.0)
+
+def close(a: float, b: float) -> bool:
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+class Questionnaire:
+    """Ответы опросника: аккумулятор и те же данные для calculate_premium"""
+    
+    def __init__(self, position: str):
+        self.position = position
+        self.accumulator = PremiumAccumulator(position)
+        self.calculator = PremiumCalculator()
+        self.base_salary = 0.0
+        self.position_rate = 0.0
+        self.operations = {}
+        self.kpi = {}
+        self.team = {}
+        self.subordinates_bonus = 0.0
+        self.steps = 0
+    
+    def check(self, step: str) -> None:
+        result = self.calculator.calculate_premium(
+            self.position, self.base_salary, self.position_rate, self.operations,
+            self.kpi, self.team, self.subordinates_bonus
+        )
+        context = (self.position, step, self.operations, self.kpi, self.team)
+        assert close(self.accumulator.operation_bonus, result.operation_bonus), context
+        assert close(self.accumulator.kpi_bonus, result.kpi_bonus), context
+        assert close(self.accumulator.total_premium, result.total_premium), context
+        self.steps += 1
+    
+    def salary(self, base_salary: float, position_rate: float) -> None:
+        self.base_salary, self.position_rate = base_salary, position_rate
+        self.accumulator.set_salary(base_salary, position_rate)
+        self.check('salary')
+    
+    def quantity(self, op_id: int, quantity: float) -> None:
+        self.operations[op_id] = quantity
+        self.accumulator.set_quantity(op_id, quantity)
+        self.check(f'op {op_id}')
+    
+    def pvz(self, schedule: str, rating: float) -> None:
+        self.calculator.set_pvz_params(schedule, rating)
+        self.accumulator.set_pvz_params(schedule, rating)
+        self.check('pvz')
+    
+    def kpi_value(self, kpi_id: str, percent: float) -> None:
+        self.kpi[kpi_id] = percent
+        self.accumulator.set_kpi(kpi_id, percent)
+        self.check(f'kpi {kpi_id}')
+    
+    def coefficient(self, coeff_id: str, value: float) -> None:
+        self.team[coeff_id] = value
+        self.accumulator.set_team_coefficient(coeff_id, value)
+        self.check(f'coefficient {coeff_id}')
+    
+    def subordinates(self, amount: float) -> None:
+        self.subordinates_bonus = amount
+        self.accumulator.set_subordinates_bonus(amount)
+        self.check('subordinates')
+
+def run_questionnaire(position: str, rng: random.Random) -> int:
+    """Опросник в порядке бота: оклад, операции, ПВЗ WB, КПИ или коэффициенты, бонус за подчиненных"""
+    config = POSITIONS_CONFIG[position]
+    questionnaire = Questionnaire(position)
+    questionnaire.check('start')
+    questionnaire.salary(rng.choice((0, 30000, 45678.5)), rng.choice((0, 0.5, 1.0, 1.3)))
+    
+    for op_id in config['operations']:
+        questionnaire.quantity(op_id, rng.choice(QUANTITIES))
+        if op_id == 13:
+            questionnaire.pvz(rng.choice(PVZ_SCHEDULES), rng.choice(PVZ_RATINGS))
+    
+    for kpi_id in config['kpi']:
+        questionnaire.kpi_value(kpi_id, rng.choice(KPI_PERCENTS))
+    for coeff_id in config['teamCoefficients']:
+        questionnaire.coefficient(coeff_id, rng.choice(TEAM_VALUES[coeff_id]))
+    if config.get('hasTeamBonus'):
+        questionnaire.subordinates(rng.choice((0.0, 1500.0, 2345.67)))
+    
+    # Исправление уже введенных ответов (возврат к шагу)
+    for _ in range(10):
+        questionnaire.quantity(rng.choice(config['operations']), rng.choice(QUANTITIES))
+    for kpi_id in config['kpi']:
+        questionnaire.kpi_value(kpi_id, rng.choice(KPI_PERCENTS))
+    for coeff_id in config['teamCoefficients']:
+        questionnaire.coefficient(coeff_id, rng.choice(TEAM_VALUES[coeff_id]))
+    return questionnaire.steps
+
+def test_running_total_matches_calculate_premium_every_position():
+    rng = random.Random(5)
+    for position in POSITIONS_CONFIG:
+        steps = sum(run_questionnaire(position, rng) for _ in range(RUNS_PER_POSITION))
+        assert steps > RUNS_PER_POSITION * len(POSITIONS_CONFIG[position]['operations'])
+
+def test_unknown_position():
+    try:
+        PremiumAccumulator('cashier')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Неизвестная должность должна вызывать ValueError")
+
+if __name__ == '__main__':
+    test_running_total_matches_calculate_premium_every_position()
+    test_unknown_position()
+    print("✅ Аккумулятор совпадает с calculate_premium после каждого шага")
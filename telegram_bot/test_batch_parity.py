@@ -0,0 +1,188 @@
+"""
+Проверка пакетного расчета: calculate_premium_batch совпадает с calculate_premium построчно
+для всех должностей (операции, ПВЗ WB, КПИ, командные коэффициенты, бонус за подчиненных)
+Запуск: python test_batch_parity.py (или pytest)
+"""
+
+import math
+import os
+import random
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+import numpy as np
+
+from calculator_v2 import KPI_IDS, OPERATION_IDS, PremiumCalculator
+from config_v2 import POSITIONS_CONFIG
+
+ROWS_PER_POSITION = 300
+
+# Значения на границах диапазонов (ПВЗ WB: 50/100/166 заказов, КПИ: пороги шкал)
+QUANTITIES = (0, 1, 3, 17.5, 50, 51, 100, 101, 166, 167, 1234.56)
+KPI_PERCENTS = (0, 50, 79.9, 80, 85, 90, 94.99, 95, 100, 105, 110, 120)
+TEAM_VALUES = {
+    'service': (0, 80, 89.9, 90, 95, 100),
+    'speed_reception': (0, 0.5, 1.0, 1.5),
+    'speed_delivery': (0, 0.5, 1.0, 1.5),
+    'efficiency': (0, 95, 99.99, 100, 110)
+}
+TEAM_DEFAULTS = {'service': 0.0, 'speed_reception': 1.0, 'speed_delivery': 1.0, 'efficiency': 0.0}
+PVZ_SCHEDULES = ('режим1', 'режим2', 'полный', 'несоответствие')
+PVZ_RATINGS = (0, 0.1, 4.89, 4.9, 4.95, 5.0)
+SALARIES = (0, 30000, 45678.5)
+RATES = (0, 0.5, 1.0, 1.3)
+
+def make_rows(position: str, count: int, rng: random.Random) -> list:
+    """Случайные строки должности: операции в произвольном порядке, КПИ и коэффициенты должности"""
+    config = POSITIONS_CONFIG[position]
+    rows = []
+    for _ in range(count):
+        operations = [op_id for op_id in config['operations'] if rng.random() < 0.6]
+        rng.shuffle(operations)
+        rows.append({
+            'operations': {op_id: rng.choice(QUANTITIES) for op_id in operations},
+            'kpi': {kpi_id: rng.choice(KPI_PERCENTS) for kpi_id in config['kpi']},
+            'team': {name: rng.choice(TEAM_VALUES[name]) for name in config['teamCoefficients']},
+            'base_salary': rng.choice(SALARIES),
+            'position_rate': rng.choice(RATES),
+            'subordinates_bonus': rng.choice((0.0, 1500.0, 2345.67)) if config.get('hasTeamBonus') else 0.0,
+            'pvz_work_schedule': rng.choice(PVZ_SCHEDULES),
+            'pvz_rating': rng.choice(PVZ_RATINGS)
+        })
+    return rows
+
+def batch_inputs(position: str, rows: list) -> dict:
+    """Столбцовые входные данные calculate_premium_batch для строк одной должности"""
+    quantities = np.zeros((len(rows), len(OPERATION_IDS)))
+    kpi_values = np.zeros((len(rows), len(KPI_IDS)))
+    for i, row in enumerate(rows):
+        for op_id, quantity in row['operations'].items():
+            quantities[i, OPERATION_IDS.index(op_id)] = quantity
+        for kpi_id, percent in row['kpi'].items():
+            kpi_values[i, KPI_IDS.index(kpi_id)] = percent
+    return {
+        'positions': [position] * len(rows),
+        'base_salary': np.array([row['base_salary'] for row in rows]),
+        'position_rate': np.array([row['position_rate'] for row in rows]),
+        'quantities': quantities,
+        'kpi_values': kpi_values,
+        'team_coefficients': {
+            name: np.array([row['team'].get(name, default) for row in rows])
+            for name, default in TEAM_DEFAULTS.items()
+        },
+        'subordinates_bonus': np.array([row['subordinates_bonus'] for row in rows]),
+        'pvz_work_schedule': [row['pvz_work_schedule'] for row in rows],
+        'pvz_rating': np.array([row['pvz_rating'] for row in rows])
+    }
+
+def scalar(calculator: PremiumCalculator, position: str, row: dict, operations: dict):
+    """Скалярный расчет строки"""
+    calculator.set_pvz_params(row['pvz_work_schedule'], row['pvz_rating'])
+    return calculator.calculate_premium(
+        position, row['base_salary'], row['position_rate'], operations,
+        row['kpi'], row['team'], row['subordinates_bonus']
+    )
+
+def column_order(operations: dict) -> dict:
+    """Операции в порядке столбцов пакета (OPERATION_IDS)"""
+    return {op_id: operations[op_id] for op_id in sorted(operations, key=OPERATION_IDS.index)}
+
+def close(a: float, b: float) -> bool:
+    return math.isclose(a, b, rel_tol=1e-12, abs_tol=1e-9)
+
+def test_float_parity_all_positions():
+    rng = random.Random(1)
+    calculator = PremiumCalculator()
+    for position in POSITIONS_CONFIG:
+        rows = make_rows(position, ROWS_PER_POSITION, rng)
+        batch = calculator.calculate_premium_batch(**batch_inputs(position, rows))
+        for i, row in enumerate(rows):
+            result = scalar(calculator, position, row, row['operations'])
+            context = (position, row)
+            assert close(batch.total_premium[i], result.total_premium), context
+            assert close(batch.operation_bonus[i], result.operation_bonus), context
+            assert close(batch.kpi_bonus[i], result.kpi_bonus), context
+            assert batch.real_salary[i] == result.real_salary, context
+            
+            # По операциям: итоговый бонус каждой заполненной операции
+            entered = [op_id for op_id, quantity in row['operations'].items() if quantity > 0]
+            details = [d for d in result.operation_details if d['operation_type'] not in ('efficiency', 'management')]
+            assert len(details) == len(entered), context
+            for op_id, detail in zip(entered, details):
+                assert batch.operation_bonuses[i, OPERATION_IDS.index(op_id)] == detail['final_bonus'], context
+            assert np.count_nonzero(batch.operation_bonuses[i]) <= len(entered)
+            
+            # КПИ: блокировка при выручке < 80% и бонусы по показателям
+            if row['kpi']:
+                assert bool(batch.kpi_blocked[i]) == (row['kpi']['revenue'] < 80), context
+            paid = [d for d in result.kpi_details if d['bonus']]
+            assert np.count_nonzero(batch.kpi_bonuses[i]) == len(paid), context
+
+def test_float_exact_in_column_order():
+    # Операции в порядке OPERATION_IDS - суммирование в том же порядке, совпадение побитовое
+    rng = random.Random(2)
+    calculator = PremiumCalculator()
+    for position in POSITIONS_CONFIG:
+        rows = make_rows(position, ROWS_PER_POSITION, rng)
+        batch = calculator.calculate_premium_batch(**batch_inputs(position, rows))
+        for i, row in enumerate(rows):
+            result = scalar(calculator, position, row, column_order(row['operations']))
+            assert batch.total_premium[i] == result.total_premium, (position, row)
+            assert batch.operation_bonus[i] == result.operation_bonus, (position, row)
+            assert batch.kpi_bonus[i] == result.kpi_bonus, (position, row)
+
+def test_kopeck_exact_any_order():
+    # Целые копейки: совпадение точное при любом порядке операций, включая детализацию
+    rng = random.Random(4)
+    calculator = PremiumCalculator(money_mode='kopeck')
+    for position in POSITIONS_CONFIG:
+        rows = make_rows(position, ROWS_PER_POSITION, rng)
+        batch = calculator.calculate_premium_batch(**batch_inputs(position, rows))
+        assert batch.total_premium.dtype == np.int64
+        for i, row in enumerate(rows):
+            result = scalar(calculator, position, row, row['operations'])
+            context = (position, row)
+            assert batch.total_premium[i] == result.total_premium, context
+            assert batch.operation_bonus[i] == result.operation_bonus, context
+            assert batch.efficiency_bonus[i] == result.efficiency_bonus, context
+            assert batch.kpi_bonus[i] == result.kpi_bonus, context
+            assert batch.real_salary[i] == result.real_salary, context
+            for op_id, final_bonus in zip(result.operation_ids, result.operation_final_bonuses):
+                assert batch.operation_bonuses[i, OPERATION_IDS.index(op_id)] == final_bonus, context
+            for kpi_id, bonus in zip(result.kpi_ids, result.kpi_bonuses):
+                assert batch.kpi_bonuses[i, KPI_IDS.index(kpi_id)] == bonus, context
+
+def test_pvz_wb_rows():
+    # Все сочетания диапазона заказов, режима и рейтинга ПВЗ WB
+    calculator = PremiumCalculator()
+    rows = [
+        {
+            'operations': {13: quantity}, 'kpi': {}, 'team': {}, 'base_salary': 30000, 'position_rate': 1.0,
+            'subordinates_bonus': 0.0, 'pvz_work_schedule': schedule, 'pvz_rating': rating
+        }
+        for quantity in QUANTITIES for schedule in PVZ_SCHEDULES for rating in PVZ_RATINGS
+    ]
+    batch = calculator.calculate_premium_batch(**batch_inputs('chief_specialist', rows))
+    for i, row in enumerate(rows):
+        result = scalar(calculator, 'chief_specialist', row, row['operations'])
+        assert batch.operation_bonus[i] == result.operation_bonus, row
+    assert batch.operation_bonus.max() == 7500.0
+
+def test_unknown_position():
+    calculator = PremiumCalculator()
+    inputs = batch_inputs('operator', make_rows('operator', 1, random.Random(3)))
+    inputs['positions'] = ['cashier']
+    try:
+        calculator.calculate_premium_batch(**inputs)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Неизвестная должность должна вызывать ValueError")
+
+if __name__ == '__main__':
+    test_float_parity_all_positions()
+    test_float_exact_in_column_order()
+    test_kopeck_exact_any_order()
+    test_pvz_wb_rows()
+    test_unknown_position()
+    print("✅ Пакетный расчет совпадает со скалярным")
@@ -0,0 +1,76 @@
+"""
+Проверка истории расчетов: месяц строки - расчетный период от вызывающего кода,
+а не дата записи; запись пачками и выборки по индексам
+Запуск: python test_calculation_history.py (или pytest)
+"""
+
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+from calculation_history import CalculationHistory, history_row
+from calculator_v2 import CalculationRequest, PremiumCalculator
+
+def request(position: str = 'operator', quantity: float = 10.0) -> CalculationRequest:
+    return CalculationRequest(position, 30000.0, 1.0, {5: quantity}, {}, {'service': 100})
+
+def test_month_is_the_calculation_period():
+    calculator = PremiumCalculator()
+    calculation = request()
+    result = calculator.calculate(calculation)
+    
+    # Расчет за март, записанный 2 апреля, остается в марте
+    created_at = datetime(2024, 4, 2, 0, 30).timestamp()
+    row = history_row(7, calculation, result, '2024-03', created_at)
+    assert row[:4] == (7, '2024-03', created_at, 'operator')
+    assert row[7] == result.total_premium
+    assert row[-1] == calculator.tariff.version
+    assert history_row(7, calculation, result, '2024-03', created_at, config_version='v2')[-1] == 'v2'
+    
+    for month in ('2024-3', '03.2024', '', '../x'):
+        try:
+            history_row(7, calculation, result, month, created_at)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Месяц {month!r} должен вызывать ValueError")
+
+def test_record_and_queries():
+    async def scenario(path: str):
+        calculator = PremiumCalculator()
+        history = CalculationHistory(path, batch_size=3, flush_interval=0.01)
+        await history.start()
+        for month, quantity in (('2024-01', 1), ('2024-03', 3), ('2024-02', 2), ('2024-03', 4)):
+            calculation = request(quantity=quantity)
+            history.record(1, calculation, calculator.calculate(calculation), month)
+        history.record(2, request('postman'), calculator.calculate(request('postman')), '2024-03')
+        await history.stop()
+        assert history.written == 5
+        
+        # База переживает перезапуск; последние расчеты - по расчетному периоду
+        history = CalculationHistory(path)
+        await history.start()
+        try:
+            last = await history.last_results(1, limit=3)
+            stats = await history.position_stats('operator', '2024-02', '2024-03')
+            assert await history.last_results(3) == []
+        finally:
+            await history.stop()
+        return last, stats
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        last, stats = asyncio.run(scenario(os.path.join(tmp, 'history.db')))
+    
+    bonus = PremiumCalculator().calculate(request(quantity=1)).total_premium
+    assert [(row['month'], row['total_premium']) for row in last] == [
+        ('2024-03', 4 * bonus), ('2024-03', 3 * bonus), ('2024-02', 2 * bonus)
+    ]
+    assert stats['count'] == 3 and stats['minimum'] == 2 * bonus and stats['maximum'] == 4 * bonus
+
+if __name__ == '__main__':
+    test_month_is_the_calculation_period()
+    test_record_and_queries()
+    print("✅ История расчетов: месяц - расчетный период, выборки по индексам")
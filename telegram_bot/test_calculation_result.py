@@ -0,0 +1,113 @@
+"""
+Проверка CalculationResult: компактное хранение и прежний вид детализации
+(operation_details / kpi_details - списки словарей, новые при каждом обращении)
+Запуск: python test_calculation_result.py (или pytest)
+"""
+
+import os
+import random
+from dataclasses import FrozenInstanceError
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+from calculator_v2 import PremiumCalculator
+from config_v2 import OPERATIONS_CONFIG, POSITIONS_CONFIG
+
+def management_result():
+    """НОПС с операторами: две операции, КПИ и бонус за подчиненных"""
+    return PremiumCalculator().calculate_premium(
+        'nops_management', 30000.0, 1.0, {11: 2, 12: 10}, {'revenue': 100, 'csi': 95}, {}, 1500.0
+    )
+
+def test_operation_details_are_dict_rows():
+    details = management_result().operation_details
+    assert type(details) is list and all(type(detail) is dict for detail in details)
+    assert details == [
+        {
+            'name': 'Привлечение пенсионера', 'quantity': 2, 'rate': '300₽/чел', 'base_bonus': 600,
+            'coefficient': 1.0, 'final_bonus': 600.0, 'operation_type': 1, 'emoji': '👴'
+        },
+        {
+            'name': 'Выдача WB', 'quantity': 10, 'rate': '5₽/заказ', 'base_bonus': 50,
+            'coefficient': 1.0, 'final_bonus': 50.0, 'operation_type': 1, 'emoji': '📦'
+        },
+        {
+            'name': 'Бонус за подчиненных', 'quantity': 1, 'rate': '1500.0₽', 'base_bonus': 1500.0,
+            'coefficient': 1.0, 'final_bonus': 1500.0, 'operation_type': 'management', 'emoji': '👥'
+        }
+    ]
+
+def test_kpi_details_are_dict_rows():
+    details = management_result().kpi_details
+    assert type(details) is list and all(type(detail) is dict for detail in details)
+    assert [(d['name'], d['percent'], d['weight'], d['coefficient'], d['bonus']) for d in details] == [
+        ('КПИ Выручка ОПС', 100, 0.3, 0.6, 6000.0 * 0.3 * 0.6),
+        ('КПИ CSI показатель', 95, 0.4, 1.0, 6000.0 * 0.4 * 1.0)
+    ]
+    assert all(
+        (d['base_kpi_amount'], d['base_salary'], d['position_rate'], d['real_salary']) == (6000.0, 30000.0, 1.0, 30000.0)
+        for d in details
+    )
+
+def test_details_can_be_changed_by_caller():
+    # Каждое обращение строит новые строки: изменения вызывающего кода не видны в результате
+    result = management_result()
+    details = result.operation_details
+    details.append({'name': 'Добавлено вызывающим кодом'})
+    details[0]['final_bonus'] = 0
+    result.kpi_details.clear()
+    
+    assert len(result.operation_details) == 3
+    assert result.operation_details[0]['final_bonus'] == 600.0
+    assert len(result.kpi_details) == 2
+
+def test_result_is_frozen_and_slotted():
+    result = management_result()
+    try:
+        result.total_premium = 0
+    except FrozenInstanceError:
+        pass
+    else:
+        raise AssertionError("CalculationResult должен быть неизменяемым")
+    assert not hasattr(result, '__dict__')
+    assert result.total_premium == 600.0 + 50.0 + 1500.0 + 6000.0 * 0.3 * 0.6 + 6000.0 * 0.4
+
+def test_warnings_are_a_tuple():
+    result = PremiumCalculator().calculate_premium('admin', 30000.0, 1.0, {}, {'revenue': 70}, {})
+    assert type(result.warnings) is tuple and len(result.warnings) == 1
+    assert result.kpi_bonus == 0 and result.kpi_details == []
+
+def test_detail_order_is_input_order_every_position():
+    # Строки детализации идут в порядке ввода операций, а не в порядке набора должности
+    rng = random.Random(8)
+    calculator = PremiumCalculator()
+    for position, config in POSITIONS_CONFIG.items():
+        for _ in range(50):
+            op_ids = list(config['operations'])
+            rng.shuffle(op_ids)
+            operations = {op_id: rng.choice((0, 1, 7, 60, 250.5)) for op_id in op_ids}
+            calculator.set_pvz_params('режим1', 5.0)
+            result = calculator.calculate_premium(position, 30000.0, 1.0, operations, {}, {})
+            
+            entered = [op_id for op_id, quantity in operations.items() if quantity > 0]
+            names = [
+                d['name'] for d in result.operation_details
+                if d['operation_type'] not in ('efficiency', 'management')
+            ]
+            assert list(result.operation_ids) == entered, (position, operations)
+            assert names == [OPERATIONS_CONFIG[op_id]['name'] for op_id in entered], (position, operations)
+            
+            # Сумма считается в том же порядке, что и строки детализации
+            total = 0
+            for final_bonus in result.operation_final_bonuses:
+                total += final_bonus
+            assert result.operation_bonus == total + result.efficiency_bonus, (position, operations)
+
+if __name__ == '__main__':
+    test_operation_details_are_dict_rows()
+    test_kpi_details_are_dict_rows()
+    test_details_can_be_changed_by_caller()
+    test_result_is_frozen_and_slotted()
+    test_warnings_are_a_tuple()
+    test_detail_order_is_input_order_every_position()
+    print("✅ CalculationResult: компактное хранение, детализация - списки словарей")
@@ -0,0 +1,131 @@
+"""
+Проверка денежной арифметики в копейках: округление половины вверх, границы x.005 ₽,
+процентные операции, отрицательные веса КПИ и согласие с режимом 'float'
+Запуск: python test_kopeck_money.py (или pytest)
+"""
+
+import os
+import random
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+import numpy as np
+
+from calculator_v2 import (
+    PremiumCalculator, base_tariff_sources, round_div, to_basis_points, to_basis_points_array, to_kopecks,
+    to_kopecks_array
+)
+from config_v2 import POSITIONS_CONFIG
+from test_batch_parity import batch_inputs, make_rows, scalar
+
+def kopeck_and_float(*args):
+    """Один и тот же расчет в режимах 'kopeck' и 'float'"""
+    return (
+        PremiumCalculator(money_mode='kopeck').calculate_premium(*args),
+        PremiumCalculator().calculate_premium(*args)
+    )
+
+def test_round_div_half_up():
+    assert [round_div(n, 10) for n in (14, 15, 16, 25, 35)] == [1, 2, 2, 3, 4]
+    assert [round_div(n, 10) for n in (-14, -15, -16, -25)] == [-1, -1, -2, -2]
+    assert round_div(10000500, 10000) == 1000 and round_div(10005000, 10000) == 1001
+    
+    # Массивы int64 округляются так же, как int
+    numerators = np.arange(-2000, 2001, dtype=np.int64)
+    assert round_div(numerators, 40).tolist() == [round_div(int(n), 40) for n in numerators]
+
+def test_basis_points():
+    assert [to_basis_points(value) for value in (0, 0.03, 0.6, 1.0, 1.5, 1.00005, 1.00004)] == [
+        0, 300, 6000, 10000, 15000, 10001, 10000
+    ]
+    assert to_basis_points(-0.15) == -1500
+    values = np.array([0.03, 0.6, 1.5, 1.00005, -0.15])
+    assert to_basis_points_array(values).tolist() == [to_basis_points(value) for value in values]
+
+def test_half_kopeck_boundaries():
+    # 1.005 и 2.675 в float чуть меньше половины копейки, округление все равно вверх
+    assert [to_kopecks(amount) for amount in (1.005, 2.675, 0.015, 10.005, 1234.565)] == [
+        101, 268, 2, 1001, 123457
+    ]
+    assert [to_kopecks(amount) for amount in (1.004, 1.0049, 0.0, -1.005)] == [100, 100, 0, -100]
+    
+    amounts = np.array([rubles + kopecks / 100 + 0.005 for rubles in range(0, 3000, 7) for kopecks in range(100)])
+    expected = [round(amount * 100 - 0.5) + 1 for amount in amounts]
+    assert to_kopecks_array(amounts).tolist() == expected
+    assert [to_kopecks(amount) for amount in amounts] == expected
+    
+    # Бонус за подчиненных с половиной копейки
+    kopeck, _ = kopeck_and_float('nops_management', 30000.0, 1.0, {}, {}, {}, 1500.005)
+    assert kopeck.subordinates_bonus == 150001 and kopeck.operation_bonus == 150001
+
+def test_percent_operations():
+    # Розница 3%: 16.50 ₽ → 49.5 коп. → 50 коп.; 333.35 ₽ → 1000.05 коп. → 1000 коп.
+    for amount, expected in ((16.5, 50), (333.35, 1000), (100.0, 300), (0.17, 1)):
+        kopeck, float_result = kopeck_and_float('operator', 30000.0, 1.0, {1: amount}, {}, {'service': 100})
+        assert kopeck.operation_base_bonuses == (expected,), amount
+        assert abs(expected / 100 - float_result.operation_base_bonuses[0]) <= 0.005 + 1e-9
+    
+    # Подписка 2% с коэффициентом обслуживания: два округления, каждое не больше полкопейки
+    kopeck, float_result = kopeck_and_float('postman', 0.0, 0.0, {4: 1234.57}, {}, {'service': 90})
+    assert kopeck.operation_base_bonuses == (2469,)
+    assert abs(kopeck.total_premium / 100 - float_result.total_premium) <= 0.01
+
+def test_negative_kpi_weight():
+    weights = base_tariff_sources()['kpi_weights']['admin']
+    saved = dict(weights)
+    try:
+        weights['online_rpo'] = -0.15
+        args = ('admin', 33333.33, 1.0, {}, {'revenue': 100, 'csi': 95, 'online_rpo': 105}, {})
+        kopeck, float_result = kopeck_and_float(*args)
+        
+        # База КПИ: 20% от 33 333.33 ₽ = 666 666.6 коп. → 666 667 коп.
+        assert kopeck.base_kpi_amount == 666667
+        assert min(kopeck.kpi_bonuses) < 0
+        assert kopeck.kpi_bonuses[kopeck.kpi_ids.index('online_rpo')] == round_div(
+            666667 * -1500 * to_basis_points(kopeck.kpi_coefficients[2]), 10 ** 8
+        )
+        assert abs(kopeck.kpi_bonus / 100 - float_result.kpi_bonus) <= 0.005 * len(kopeck.kpi_ids) + 1e-9
+        
+        # Пакетный расчет в копейках с отрицательным весом совпадает со скалярным
+        rows = make_rows('admin', 200, random.Random(71))
+        calculator = PremiumCalculator(money_mode='kopeck')
+        batch = calculator.calculate_premium_batch(**batch_inputs('admin', rows))
+        for i, row in enumerate(rows):
+            result = scalar(calculator, 'admin', row, row['operations'])
+            assert batch.kpi_bonus[i] == result.kpi_bonus, row
+            assert batch.total_premium[i] == result.total_premium, row
+    finally:
+        weights.clear()
+        weights.update(saved)
+
+def test_kopeck_agrees_with_float():
+    # Каждая точка округления дает не больше полкопейки (с учетом коэффициентов до 1.5 - копейка)
+    rng = random.Random(7)
+    for position in POSITIONS_CONFIG:
+        for row in make_rows(position, 200, rng):
+            # Штучные операции - целые количества, процентные - суммы в копейках
+            operations = {
+                op_id: 123.45 if op_id in (1, 2, 3, 4) and quantity else round(quantity)
+                for op_id, quantity in row['operations'].items()
+            }
+            args = (
+                position, row['base_salary'], row['position_rate'], operations,
+                row['kpi'], row['team'], row['subordinates_bonus']
+            )
+            kopeck, float_result = kopeck_and_float(*args)
+            assert kopeck.in_kopecks and not float_result.in_kopecks
+            
+            tolerance = 0.01 * (len(kopeck.operation_ids) + len(kopeck.kpi_ids) + 2)
+            assert abs(kopeck.operation_bonus / 100 - float_result.operation_bonus) <= tolerance, args
+            assert abs(kopeck.kpi_bonus / 100 - float_result.kpi_bonus) <= tolerance, args
+            assert abs(kopeck.total_premium / 100 - float_result.total_premium) <= tolerance, args
+            assert all(isinstance(value, int) for value in kopeck.operation_final_bonuses + kopeck.kpi_bonuses)
+
+if __name__ == '__main__':
+    test_round_div_half_up()
+    test_basis_points()
+    test_half_kopeck_boundaries()
+    test_percent_operations()
+    test_negative_kpi_weight()
+    test_kopeck_agrees_with_float()
+    print("✅ Расчет в копейках: округление половины вверх, согласие с режимом 'float'")
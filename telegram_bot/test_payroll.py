@@ -0,0 +1,182 @@
+"""
+Проверка пакетного расчета по файлу: разбиение на шарды по границам записей
+(включая поля в кавычках с переносами строк), файл без строк, -j1 и -jN дают одинаковый результат,
+потоковое чтение блоками (iter_csv_chunks)
+Запуск: python test_payroll.py (или pytest)
+"""
+
+import csv
+import io
+import os
+import random
+import tempfile
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+import payroll
+from calculator_v2 import OPERATION_IDS
+from config_v2 import POSITIONS_CONFIG
+from payroll_io import iter_csv_chunks
+
+HEADER = (
+    'employee_id', 'month', 'ops_id', 'position', 'base_salary', 'position_rate',
+    'op_1', 'op_5', 'op_12', 'op_13', 'kpi_revenue', 'kpi_csi', 'service', 'efficiency',
+    'subordinates_bonus', 'pvz_work_schedule', 'pvz_rating'
+)
+
+def employee_rows(count: int, rng: random.Random, quoted_newlines: bool = False) -> list:
+    """Строки сотрудников; при quoted_newlines часть идентификаторов содержит перенос строки"""
+    positions = sorted(POSITIONS_CONFIG)
+    rows = []
+    for i in range(count):
+        employee_id = f"E{i:05d}"
+        if quoted_newlines and i % 3 == 0:
+            employee_id = f'E{i:05d}\n"доп." {i}\r\nстрока'
+        rows.append((
+            employee_id, '2024-03', str(101000 + i % 40), rng.choice(positions),
+            rng.choice(('30000', '45678.5', '')), rng.choice(('1', '0.5', '')),
+            rng.choice(('', '0', '1234.56')), str(rng.randint(0, 9)), str(rng.randint(0, 200)),
+            str(rng.choice((0, 60, 120, 170))), str(rng.choice((70, 85, 100, 110))), str(rng.choice((90, 95, 100))),
+            str(rng.choice((0, 90, 100))), str(rng.choice((0, 100, 110))),
+            rng.choice(('', '1500')), rng.choice(('', 'режим1', 'полный')), rng.choice(('', '4.9', '5'))
+        ))
+    return rows
+
+def write_csv(path: str, rows: list) -> None:
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+
+def read_records(path: str, start: int, end: int) -> list:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return list(csv.reader(io.StringIO(f.read(end - start).decode('utf-8'), newline='')))
+
+def check_shards(path: str, rows: list, jobs: int) -> list:
+    """Шарды непрерывно покрывают данные, начинаются с новой записи и вместе дают все строки"""
+    header, shards = payroll.plan_shards(path, jobs)
+    assert header == list(HEADER)
+    
+    with open(path, 'rb') as f:
+        data = f.read()
+    data_start = data.index(b'\n') + 1
+    assert shards[0][0] == data_start and shards[-1][1] == len(data)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(shards, shards[1:]))
+    assert all(data[start - 1:start] == b'\n' for start, _ in shards)
+    assert len(shards) <= jobs
+    
+    records = []
+    for start, end in shards:
+        records.extend(read_records(path, start, end))
+    assert records == [list(row) for row in rows]
+    return shards
+
+def test_shards_at_line_boundaries():
+    rng = random.Random(10)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'employees.csv')
+        for count in (1, 2, 7, 500):
+            rows = employee_rows(count, rng)
+            write_csv(path, rows)
+            for jobs in (1, 2, 3, 8, 64):
+                check_shards(path, rows, jobs)
+
+def test_quoted_fields_with_newlines():
+    # Перенос строки внутри кавычек не становится границей шарда
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'employees.csv')
+        rows = employee_rows(300, rng, quoted_newlines=True)
+        write_csv(path, rows)
+        for jobs in range(1, 40):
+            check_shards(path, rows, jobs)
+        
+        output = os.path.join(tmp, 'premiums.csv')
+        total_rows, _ = payroll.run(path, output, 7)
+        with open(output, newline='', encoding='utf-8') as f:
+            result = list(csv.reader(f))
+        assert total_rows == len(rows) == len(result) - 1
+        assert [row[0] for row in result[1:]] == [row[0] for row in rows]
+
+def test_header_only_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'employees.csv')
+        output = os.path.join(tmp, 'premiums.csv')
+        write_csv(path, [])
+        header, shards = payroll.plan_shards(path, 4)
+        assert header == list(HEADER) and shards == []
+        
+        assert payroll.run(path, output, 4) == (0, {})
+        with open(output, newline='', encoding='utf-8') as f:
+            assert list(csv.reader(f)) == [list(payroll.OUTPUT_COLUMNS)]
+
+def test_one_and_many_jobs_give_identical_output():
+    rng = random.Random(12)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'employees.csv')
+        write_csv(path, employee_rows(2000, rng))
+        for money_mode in ('float', 'kopeck'):
+            outputs, all_totals = [], []
+            for jobs in (1, 3, 8):
+                output = os.path.join(tmp, f'premiums_{money_mode}_{jobs}.csv')
+                total_rows, totals = payroll.run(path, output, jobs, money_mode)
+                assert total_rows == 2000
+                with open(output, 'rb') as f:
+                    outputs.append(f.read())
+                all_totals.append(totals)
+            
+            assert outputs[0] == outputs[1] == outputs[2], money_mode
+            for totals in all_totals[1:]:
+                assert totals.keys() == all_totals[0].keys()
+                for position, values in totals.items():
+                    assert values[0] == all_totals[0][position][0]
+                    assert all(abs(a - b) < 1e-6 for a, b in zip(values[1:], all_totals[0][position][1:]))
+
+def test_iter_csv_chunks():
+    rng = random.Random(13)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'employees.csv')
+        rows = employee_rows(1005, rng, quoted_newlines=True)
+        write_csv(path, rows)
+        
+        # Блоки по chunk_size строк, последний - остаток; значения в столбцах по строкам
+        chunks = list(iter_csv_chunks(path, chunk_size=100))
+        assert [chunk.size for chunk in chunks] == [100] * 10 + [5]
+        employee_ids = [employee_id for chunk in chunks for employee_id in chunk.keys['employee_id']]
+        assert employee_ids == [row[0] for row in rows]
+        assert [position for chunk in chunks for position in chunk.positions] == [row[3] for row in rows]
+        first = chunks[0]
+        assert first.quantities.shape == (100, len(OPERATION_IDS))
+        assert first.base_salary.tolist() == [float(row[4]) if row[4] else 0.0 for row in rows[:100]]
+        assert first.pvz_rating.tolist() == [float(row[16]) if row[16] else 5.0 for row in rows[:100]]
+        assert first.pvz_work_schedule == [row[15] or 'режим1' for row in rows[:100]]
+        
+        # Диапазоны байт шардов читаются без потерь и повторов
+        header, shards = payroll.plan_shards(path, 6)
+        employee_ids = [
+            employee_id
+            for start, end in shards
+            for chunk in iter_csv_chunks(path, 64, header, start, end)
+            for employee_id in chunk.keys['employee_id']
+        ]
+        assert employee_ids == [row[0] for row in rows]
+        
+        # Короткие строки дополняются пустыми ячейками (значения по умолчанию)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            f.write(','.join(HEADER) + '\nE1,2024-03,101000,operator\n\nE2,2024-03,101000,admin,30000,1\n')
+        chunk, = iter_csv_chunks(path)
+        assert chunk.positions == ['operator', 'admin']
+        assert chunk.base_salary.tolist() == [0.0, 30000.0] and chunk.position_rate.tolist() == [0.0, 1.0]
+        assert chunk.team_coefficients['speed_reception'].tolist() == [1.0, 1.0]
+        
+        write_csv(path, [])
+        assert list(iter_csv_chunks(path)) == []
+
+if __name__ == '__main__':
+    test_shards_at_line_boundaries()
+    test_quoted_fields_with_newlines()
+    test_header_only_file()
+    test_one_and_many_jobs_give_identical_output()
+    test_iter_csv_chunks()
+    print("✅ Пакетный расчет по файлу: шарды по границам записей, -j1 и -jN совпадают")
@@ -0,0 +1,109 @@
+"""
+Проверка архива премий по месяцам: суммы совпадают с ведомостью, запросы по диапазону ОПС,
+проверка месяца и отказ перезаписывать опубликованный месяц без явного флага
+Запуск: python test_premium_archive.py (или pytest)
+"""
+
+import csv
+import os
+import random
+import tempfile
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+import payroll
+from premium_archive import PremiumArchive, check_month
+from test_payroll import employee_rows, write_csv
+
+MONTHS = ('2024-01', '2024-02', '2024-03')
+
+def monthly_rows(count: int, seed: int) -> list:
+    """Строки сотрудников за несколько месяцев"""
+    rng = random.Random(seed)
+    return [(row[0], MONTHS[i % len(MONTHS)]) + row[2:] for i, row in enumerate(employee_rows(count, rng))]
+
+def output_kopecks(path: str) -> list:
+    """(месяц, ОПС, премия в копейках) из файла результатов режима 'kopeck'"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return [
+            (row['month'], int(row['ops_id']), int(row['total_premium'].replace('.', '')))
+            for row in csv.DictReader(f)
+        ]
+
+def test_archive_matches_payroll_output():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, output, root = (os.path.join(tmp, name) for name in ('employees.csv', 'premiums.csv', 'archive'))
+        write_csv(path, monthly_rows(900, 14))
+        payroll.run(path, output, 3, 'kopeck', archive_root=root)
+        
+        results = output_kopecks(output)
+        archive = PremiumArchive(root)
+        assert archive.months() == list(MONTHS)
+        assert archive.sum() == sum(total for _, _, total in results)
+        assert archive.sum(ops_from=101010, ops_to=101019, month_from='2024-02') == sum(
+            total for month, ops_id, total in results if 101010 <= ops_id <= 101019 and month >= '2024-02'
+        )
+        assert [(month, rows) for month, rows, _ in archive.totals_by_month()] == [(month, 300) for month in MONTHS]
+        assert not [name for name in os.listdir(root) if not name.endswith(('.dat', '.json'))]
+
+def test_month_must_be_yyyy_mm():
+    for month in ('2024-03', '1999-12'):
+        assert check_month(month) == month
+    for month in ('../x', '2024-3', '2024-03/..', '２０２４-03', '', None):
+        try:
+            check_month(month)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Месяц {month!r} должен вызывать ValueError")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path, output, root = (os.path.join(tmp, name) for name in ('employees.csv', 'premiums.csv', 'archive'))
+        rows = monthly_rows(10, 15)
+        write_csv(path, [(row[0], '../escaped') + row[2:] for row in rows])
+        try:
+            payroll.run(path, output, 2, archive_root=root)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Месяц вне вида ГГГГ-ММ должен вызывать ValueError")
+        assert sorted(os.listdir(tmp)) == ['archive', 'employees.csv'] and os.listdir(root) == []
+        
+        # Посторонние файлы в каталоге архива не считаются месяцами
+        with open(os.path.join(root, 'notes.json'), 'w') as f:
+            f.write('{}')
+        assert PremiumArchive(root).months() == []
+
+def test_published_month_is_not_overwritten():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, output, root = (os.path.join(tmp, name) for name in ('employees.csv', 'premiums.csv', 'archive'))
+        write_csv(path, monthly_rows(600, 16))
+        payroll.run(path, output, 2, 'kopeck', archive_root=root)
+        published = {name: os.path.getmtime(os.path.join(root, name)) for name in os.listdir(root)}
+        fund = PremiumArchive(root).sum()
+        
+        # Повторный расчет с другими данными: ни один месяц не заменяется, части удаляются
+        write_csv(path, monthly_rows(300, 17))
+        for jobs in (1, 3):
+            try:
+                payroll.run(path, output, jobs, 'kopeck', archive_root=root)
+            except FileExistsError as e:
+                assert '2024-01' in str(e)
+            else:
+                raise AssertionError("Опубликованный месяц не должен перезаписываться без флага")
+            assert {name: os.path.getmtime(os.path.join(root, name)) for name in os.listdir(root)} == published
+            assert PremiumArchive(root).sum() == fund
+        assert payroll.main(['run', path, '-o', output, '-j', '2', '--archive', root]) == 1
+        
+        # С явной заменой месяцы пересобираются из новых данных
+        payroll.run(path, output, 3, 'kopeck', archive_root=root, replace_months=True)
+        archive = PremiumArchive(root)
+        assert archive.sum() == sum(total for _, _, total in output_kopecks(output))
+        assert [rows for _, rows, _ in archive.totals_by_month()] == [100, 100, 100]
+        assert sorted(os.listdir(root)) == sorted(published)
+
+if __name__ == '__main__':
+    test_archive_matches_payroll_output()
+    test_month_must_be_yyyy_mm()
+    test_published_month_is_not_overwritten()
+    print("✅ Архив премий: суммы, проверка месяца, защита от перезаписи")
@@ -0,0 +1,58 @@
+"""
+Проверка расчетного ядра без окружения бота: импорт premium_config и calculator_v2 не читает
+файлов, .env и токена, тарифы загружаются при первом обращении и не меняют справочник операций
+Запуск: python test_premium_config.py (или pytest)
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+import premium_config
+from calculator_v2 import PremiumCalculator, active_tariff
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Чистый процесс без токена: открытые файлы, кроме модулей Python, записывает аудит-хук
+IMPORT_PROBE = """
+import json, sys
+opened = []
+def audit(event, args):
+    if event == 'open' and isinstance(args[0], str) and not args[0].endswith(('.py', '.pyc', '.so')):
+        opened.append(args[0])
+sys.addaudithook(audit)
+import calculator_v2
+loaded = [name for name in ('dotenv', 'telegram', 'config_v2') if name in sys.modules]
+after_import = list(opened), calculator_v2._ACTIVE_TIMELINE is not None
+calculator_v2.tariff_timeline()
+print(json.dumps([after_import, opened, loaded]))
+"""
+
+def test_import_reads_no_files():
+    env = {name: value for name, value in os.environ.items() if name != 'TELEGRAM_BOT_TOKEN'}
+    output = subprocess.run(
+        [sys.executable, '-c', IMPORT_PROBE], cwd=MODULE_DIR, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    (opened_on_import, compiled_on_import), opened, loaded = json.loads(output)
+    assert opened_on_import == [] and not compiled_on_import
+    assert loaded == []
+    
+    # Файл тарифов читается при первом обращении к тарифу
+    assert [os.path.basename(path) for path in opened] == ['tariffs.json']
+
+def test_operations_config_is_not_mutated():
+    # Справочник операций - только описания; ставки - в скомпилированном тарифе
+    for op_id, op_config in premium_config.OPERATIONS_CONFIG.items():
+        assert not {'rate', 'type', 'value', 'operationType'} & set(op_config), op_id
+    
+    result = PremiumCalculator().calculate_premium('operator', 30000.0, 1.0, {5: 2.0}, {}, {'service': 100})
+    assert result.operation_details[0]['rate'] == active_tariff().operations[5].display_rate == '50₽/шт'
+    assert 'rate' not in premium_config.OPERATIONS_CONFIG[5]
+
+if __name__ == '__main__':
+    test_import_reads_no_files()
+    test_operations_config_is_not_mutated()
+    print("✅ Ядро: импорт без файлов и окружения, справочник операций не меняется")
@@ -0,0 +1,106 @@
+"""
+Проверка нарастающих итогов с начала года: приращение по месяцам, повторная загрузка
+отклоняется, месяц, замененный в архиве, пересобирает итоги своего года
+Запуск: python test_premium_rollups.py (или pytest)
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+import payroll
+from calculator_v2 import CalculationRequest, PremiumCalculator
+from premium_archive import PremiumArchive
+from premium_rollups import YtdRollups
+from test_payroll import write_csv
+from test_premium_archive import monthly_rows
+
+def ops_totals(archive: PremiumArchive, ops_id: int, year: str) -> int:
+    return archive.sum(ops_from=ops_id, ops_to=ops_id, month_from=f"{year}-01", month_to=f"{year}-12")
+
+def test_ingest_results():
+    calculator = PremiumCalculator(money_mode='kopeck')
+    
+    def entries(quantities):
+        return [
+            (f"E{i}", '101000', 'operator', calculator.calculate(
+                CalculationRequest('operator', 30000.0, 1.0, {5: quantity, 12: 10}, {}, {})
+            ))
+            for i, quantity in enumerate(quantities)
+        ]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        rollups = YtdRollups(tmp)
+        rollups.ingest_results('2024-01', entries((1, 2)))
+        rollups.ingest_results('2024-02', entries((4,)))
+        try:
+            rollups.ingest_results('2024-02', entries((4,)))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Повторная загрузка месяца должна вызывать ValueError")
+        
+        # Итоги переживают перезапуск; суммы в копейках
+        totals = YtdRollups(tmp).get('ops', '101000', '2024')
+        assert totals['count'] == 3
+        assert totals['total'] == (50 * 7 + 50 * 3) * 100
+        assert (totals['minimum'], totals['maximum']) == (100 * 100, 250 * 100)
+        assert totals['operations'] == {5: 350 * 100, 12: 150 * 100}
+        assert YtdRollups(tmp).get('employee', 'E0', '2024')['count'] == 2
+        assert YtdRollups(tmp).get('ops', '101000', '2023') is None
+
+def test_ingest_archive_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, output, root = (os.path.join(tmp, name) for name in ('employees.csv', 'premiums.csv', 'archive'))
+        write_csv(path, monthly_rows(600, 18))
+        payroll.run(path, output, 2, 'kopeck', archive_root=root)
+        archive = PremiumArchive(root)
+        
+        rollups = YtdRollups(os.path.join(tmp, 'rollups'))
+        assert rollups.ingest_archive(archive) == ['2024-01', '2024-02', '2024-03']
+        assert rollups.ingest_archive(archive) == []
+        for ops_id in (101000, 101007, 101039):
+            assert rollups.get('ops', str(ops_id), '2024')['total'] == ops_totals(archive, ops_id, '2024')
+        assert sum(rollups.get('position', position, '2024')['count'] for position in
+                   rollups.year('2024').levels['position'].index) == 600
+
+def test_republished_month_rebuilds_year():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, output, root = (os.path.join(tmp, name) for name in ('employees.csv', 'premiums.csv', 'archive'))
+        rollups_root = os.path.join(tmp, 'rollups')
+        write_csv(path, monthly_rows(600, 19))
+        payroll.run(path, output, 2, 'kopeck', archive_root=root)
+        YtdRollups(rollups_root).ingest_archive(PremiumArchive(root))
+        
+        # Месяцы пересчитаны с другими данными и заменены в архиве
+        write_csv(path, monthly_rows(300, 20))
+        payroll.run(path, output, 2, 'kopeck', archive_root=root, replace_months=True)
+        archive = PremiumArchive(root)
+        
+        rollups = YtdRollups(rollups_root)
+        assert rollups.ingest_archive(archive) == ['2024-01', '2024-02', '2024-03']
+        assert rollups.ingest_archive(archive) == []
+        fresh = YtdRollups(os.path.join(tmp, 'fresh'))
+        fresh.ingest_archive(archive)
+        for ops_id in map(str, range(101000, 101040)):
+            assert YtdRollups(rollups_root).get('ops', ops_id, '2024') == fresh.get('ops', ops_id, '2024')
+        assert rollups.get('ops', '101000', '2024')['total'] == ops_totals(archive, 101000, '2024')
+        
+        # Месяц, загруженный не из архива, при пересборке потерялся бы - пересборка отклоняется
+        calculator = PremiumCalculator(money_mode='kopeck')
+        result = calculator.calculate(CalculationRequest('operator', 30000.0, 1.0, {5: 1}, {}, {}))
+        rollups.ingest_results('2024-04', [('E1', '101000', 'operator', result)])
+        payroll.run(path, output, 2, 'kopeck', archive_root=root, replace_months=True)
+        try:
+            rollups.ingest_archive(PremiumArchive(root))
+        except ValueError as e:
+            assert '2024-04' in str(e)
+        else:
+            raise AssertionError("Пересборка года с месяцем не из архива должна вызывать ValueError")
+
+if __name__ == '__main__':
+    test_ingest_results()
+    test_ingest_archive_once()
+    test_republished_month_rebuilds_year()
+    print("✅ Нарастающие итоги: приращение, повторная загрузка, замена месяца в архиве")
@@ -0,0 +1,162 @@
+"""
+Проверка кэша результатов: вытеснение LRU, срок жизни, счетчики и ключ расчета
+Запуск: python test_result_cache.py (или pytest)
+"""
+
+import os
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+from calculator_v2 import (
+    CalculationResult, PremiumCalculator, ResultCache, base_tariff_sources, calculation_fingerprint,
+    compute_config_version, refresh_compiled_tariff
+)
+
+class FakeClock:
+    """Управляемые часы для проверки срока жизни"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+def result(total: float) -> CalculationResult:
+    return CalculationResult(
+        total_premium=total, operation_bonus=total, kpi_bonus=0.0, base_salary=0.0, position_rate=0.0,
+        real_salary=0.0, warnings=(), position_name='test'
+    )
+
+def fingerprint(**changes) -> str:
+    params = dict(
+        position='operator', base_salary=30000.0, position_rate=1.0, operations={5: 2.0, 1: 100.0},
+        kpi_values={}, team_coefficients={'service': 95}, pvz_work_schedule='режим1', pvz_rating=5.0,
+        subordinates_bonus=0.0
+    )
+    params.update(changes)
+    return calculation_fingerprint(**params)
+
+def test_lru_eviction_order():
+    cache = ResultCache(max_size=3)
+    for key in 'abc':
+        cache.put(key, result(1.0))
+    
+    # Обращение к 'a' делает ее самой свежей: вытесняется 'b', затем 'c'
+    assert cache.get('a') is not None
+    cache.put('d', result(1.0))
+    assert cache.get('b') is None
+    cache.put('e', result(1.0))
+    assert cache.get('c') is None
+    assert [key for key in 'ade' if cache.get(key) is not None] == ['a', 'd', 'e']
+    assert len(cache) == 3
+    
+    stats = cache.stats()
+    assert stats['evictions'] == 2
+    assert stats['hits'] == 4 and stats['misses'] == 2
+
+def test_put_existing_key_refreshes_position():
+    cache = ResultCache(max_size=2)
+    cache.put('a', result(1.0))
+    cache.put('b', result(1.0))
+    cache.put('a', result(2.0))
+    cache.put('c', result(1.0))
+    assert cache.get('b') is None
+    assert cache.get('a').total_premium == 2.0
+    assert cache.stats()['evictions'] == 1
+
+def test_ttl_expiry_with_injected_clock():
+    clock = FakeClock()
+    cache = ResultCache(max_size=10, ttl=60, clock=clock)
+    cache.put('a', result(1.0))
+    
+    clock.now += 60
+    assert cache.get('a') is not None  # ровно на границе срока запись еще действует
+    clock.now += 0.001
+    assert cache.get('a') is None
+    assert len(cache) == 0
+    
+    stats = cache.stats()
+    assert stats['expirations'] == 1
+    assert stats['hits'] == 1 and stats['misses'] == 1
+    
+    # Без ttl записи не устаревают
+    cache = ResultCache(max_size=10, clock=clock)
+    cache.put('a', result(1.0))
+    clock.now += 10 ** 9
+    assert cache.get('a') is not None
+
+def test_invalid_size():
+    try:
+        ResultCache(max_size=0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Кэш нулевого размера должен вызывать ValueError")
+
+def test_fingerprint_is_canonical():
+    # Порядок ключей и нулевые операции не влияют на ключ
+    assert fingerprint() == fingerprint(operations={1: 100.0, 5: 2.0, 7: 0})
+    assert fingerprint() != fingerprint(operations={1: 100.0, 5: 3.0})
+    
+    # Параметры ПВЗ WB входят в ключ только при заполненной операции #13
+    assert fingerprint() == fingerprint(pvz_work_schedule='полный', pvz_rating=4.9)
+    assert fingerprint(operations={13: 60}) != fingerprint(operations={13: 60}, pvz_rating=4.9)
+
+def test_fingerprint_changes_with_tariff_version():
+    assert fingerprint(config_version='v1') != fingerprint(config_version='v2')
+    
+    # Версия тарифа - отпечаток конфигурации: изменение ставки дает новую версию
+    version = compute_config_version()
+    sim_card = base_tariff_sources()['operations'][5]
+    value = sim_card['value']
+    try:
+        sim_card['value'] = value + 1
+        assert compute_config_version() != version
+    finally:
+        sim_card['value'] = value
+    assert compute_config_version() == version
+
+def test_calculator_cache_returns_independent_details():
+    calculator = PremiumCalculator(cache_size=16)
+    args = ('operator', 30000.0, 1.0, {5: 2.0, 11: 1.0}, {}, {'service': 95})
+    first = calculator.calculate_premium(*args)
+    first.operation_details.append({'name': 'изменено вызывающим кодом'})
+    first.operation_details[0]['final_bonus'] = -1
+    
+    second = calculator.calculate_premium(*args)
+    assert calculator.cache.stats()['hits'] == 1
+    assert len(second.operation_details) == 2
+    assert second.operation_details[0]['final_bonus'] == 120.0
+    assert second.total_premium == first.total_premium
+
+def test_tariff_change_is_not_served_from_cache():
+    # Ключ содержит версию скомпилированного тарифа: после пересборки старый результат не отдается
+    calculator = PremiumCalculator(cache_size=16)
+    args = ('operator', 30000.0, 1.0, {5: 2.0}, {}, {'service': 100})
+    before = calculator.calculate_premium(*args)
+    sim_card = base_tariff_sources()['operations'][5]
+    value = sim_card['value']
+    try:
+        sim_card['value'] = value * 2
+        refresh_compiled_tariff()
+        after = calculator.calculate_premium(*args)
+        assert after.total_premium == 2 * before.total_premium
+        assert calculator.cache.stats()['hits'] == 0
+    finally:
+        sim_card['value'] = value
+        refresh_compiled_tariff()
+    
+    # Возврат к прежнему тарифу - прежняя версия, результат снова из кэша
+    assert calculator.calculate_premium(*args).total_premium == before.total_premium
+    assert calculator.cache.stats()['hits'] == 1
+
+if __name__ == '__main__':
+    test_lru_eviction_order()
+    test_put_existing_key_refreshes_position()
+    test_ttl_expiry_with_injected_clock()
+    test_invalid_size()
+    test_fingerprint_is_canonical()
+    test_fingerprint_changes_with_tariff_version()
+    test_calculator_cache_returns_independent_details()
+    test_tariff_change_is_not_served_from_cache()
+    print("✅ Кэш результатов: LRU, срок жизни, ключ расчета")
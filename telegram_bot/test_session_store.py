@@ -0,0 +1,302 @@
+"""
+Проверка сохранения сессий: UserState и шаг разговора переживают перезапуск приложения,
+накопитель премии собирается заново по тарифу даты расчета, изменения прохода пишутся
+одной транзакцией, при остановке приложения несохраненное дописывается
+Запуск: python test_session_store.py (или pytest)
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+from telegram import Update, User
+from telegram.ext import Application, CommandHandler, ConversationHandler, ExtBot, MessageHandler, filters
+
+from clean_bot import ASKING_COEFFICIENTS, ASKING_OPERATION_QUANTITY, CleanPremiumBot
+from config_v2 import UserState
+from session_store import STATE_KEY, SessionStates, SqlitePersistence, dump_user_state, load_user_state
+from test_tariff_timeline import VERSIONS, dated_versions
+
+CONVERSATION = 'premium_calculation'
+
+class OfflineBot(ExtBot):
+    """Бот без обращений к Telegram API (initialize не запрашивает getMe)"""
+    
+    async def initialize(self) -> None:
+        self._bot_user = User(id=1, first_name='Премии', is_bot=True, username='premium_test_bot')
+    
+    async def shutdown(self) -> None:
+        pass
+
+def coefficient_step_state() -> UserState:
+    """Состояние администратора посреди опросника командных коэффициентов (второй из трех)"""
+    return UserState(
+        position='admin',
+        base_salary=30000.0,
+        position_rate=1.0,
+        operations={3: 1000.0, 11: 2.0},
+        kpi={'revenue': 100.0},
+        available_coefficients=['service', 'speed_reception', 'speed_delivery'],
+        current_coefficient_index=1,
+        team_coefficients={'service': 95.0},
+        calculation_date='2024-01-15'
+    )
+
+def make_update(user_id: int, text: str, update_id: int, bot: ExtBot) -> Update:
+    """Сообщение пользователя в личном чате (команда - с сущностью bot_command)"""
+    message = {
+        'message_id': update_id, 'date': 1700000000, 'text': text,
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Тест'}
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return Update.de_json({'update_id': update_id, 'message': message}, bot)
+
+class FakeClock:
+    """Подменяемые часы для SessionStates"""
+    
+    def __init__(self, now: float = 1700000000.0):
+        self.now = now
+    
+    def __call__(self) -> float:
+        return self.now
+
+def build_application(path: str, premium_bot: CleanPremiumBot, **session_options) -> Application:
+    """Приложение с разговором как в clean_bot.main: /start выбирает операцию, цифры набирают количество"""
+    user_states = SessionStates(restore=premium_bot.restore_accumulator, **session_options)
+    
+    async def start(update: Update, context) -> int:
+        user_states[update.effective_user.id] = UserState(
+            position='operator', base_salary=30000.0, position_rate=1.0, calculation_date='2024-01-15',
+            available_operations=[1, 5], current_operation_index=1
+        )
+        return ASKING_OPERATION_QUANTITY
+    
+    async def digit(update: Update, context) -> int:
+        state = user_states[update.effective_user.id]
+        state.current_input += update.message.text
+        op_id = state.available_operations[state.current_operation_index]
+        state.operations[op_id] = float(state.current_input)
+        state.premium_accumulator.set_quantity(op_id, state.operations[op_id])
+        return ASKING_OPERATION_QUANTITY
+    
+    async def show_help(update: Update, context) -> None:
+        pass
+    
+    application = (
+        Application.builder().bot(OfflineBot('0:test')).updater(None)
+        .persistence(SqlitePersistence(path, flush_interval=3600))
+        .build()
+    )
+    application.bot_data['user_states'] = user_states
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler('start', start)],
+        states={
+            ASKING_OPERATION_QUANTITY: [MessageHandler(filters.Regex('^[0-9]$'), digit)],
+            ASKING_COEFFICIENTS: []
+        },
+        fallbacks=[],
+        name=CONVERSATION,
+        persistent=True
+    ))
+    application.add_handler(CommandHandler('help', show_help))
+    return application
+
+async def start_application(application: Application) -> SessionStates:
+    """initialize и подключение сессий, как в CleanPremiumBot.post_init"""
+    await application.initialize()
+    user_states = application.bot_data['user_states']
+    user_states.bind(application)
+    return user_states
+
+def stored_rows(path: str, table: str) -> list:
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(f"SELECT * FROM {table}").fetchall()
+    finally:
+        connection.close()
+
+def test_dump_load_keeps_coefficient_step():
+    state = coefficient_step_state()
+    restored = load_user_state(dump_user_state(state))
+    assert restored.available_coefficients == ['service', 'speed_reception', 'speed_delivery']
+    assert restored.current_coefficient_index == 1
+    assert restored.operations == {3: 1000.0, 11: 2.0}
+    assert restored == state
+
+def test_persistence_round_trip_keeps_coefficient_step():
+    async def round_trip(path: str) -> UserState:
+        persistence = SqlitePersistence(path)
+        await persistence.get_user_data()
+        await persistence.update_user_data(42, {STATE_KEY: coefficient_step_state()})
+        await persistence.update_conversation(CONVERSATION, (42, 42), ASKING_COEFFICIENTS)
+        await persistence.flush()
+        
+        # Новый экземпляр - как после перезапуска бота
+        restarted = SqlitePersistence(path)
+        user_data = await restarted.get_user_data()
+        conversations = await restarted.get_conversations(CONVERSATION)
+        await restarted.flush()
+        assert conversations == {(42, 42): ASKING_COEFFICIENTS}
+        return user_data[42][STATE_KEY]
+    
+    with tempfile.TemporaryDirectory() as root:
+        restored = asyncio.run(round_trip(os.path.join(root, 'sessions.db')))
+    assert restored.available_coefficients[restored.current_coefficient_index] == 'speed_reception'
+    assert restored.calculation_date == '2024-01-15'
+    assert restored == coefficient_step_state()
+
+def test_conversation_survives_restart():
+    async def session(path: str, premium_bot: CleanPremiumBot, texts: list) -> UserState:
+        application = build_application(path, premium_bot)
+        await start_application(application)
+        for update_id, text in enumerate(texts, 1):
+            await application.process_update(make_update(42, text, update_id, application.bot))
+        state = application.bot_data['user_states'][42]
+        # Остановка без явного update_persistence: несохраненное дописывает shutdown
+        await application.shutdown()
+        return state
+    
+    with tempfile.TemporaryDirectory() as root, dated_versions(VERSIONS):
+        path = os.path.join(root, 'sessions.db')
+        premium_bot = CleanPremiumBot()
+        before = asyncio.run(session(path, premium_bot, ['/start', '1']))
+        assert before.current_input == '1'
+        
+        # После перезапуска разговор продолжается с того же шага: цифра дописывается к набранной
+        after = asyncio.run(session(path, premium_bot, ['2']))
+        assert after.current_input == '12' and after.operations == {5: 12.0}
+        assert after.current_operation_index == 1 and after.calculation_date == '2024-01-15'
+        
+        # Накопитель собран заново по тарифу даты расчета (до версии 2024-02-01: 50₽ за сим-карту)
+        assert after.premium_accumulator.operation_bonus == 600.0
+        assert after.premium_accumulator.calculator.tariff is premium_bot.current_calculator(after).tariff
+
+def test_pass_is_written_in_one_transaction():
+    async def typing(path: str) -> tuple:
+        application = build_application(path, CleanPremiumBot())
+        persistence = application.persistence
+        batches = []
+        write_batch = persistence._write_batch
+        persistence._write_batch = lambda users, conversations: (
+            batches.append((dict(users), dict(conversations))), write_batch(users, conversations)
+        )
+        await start_application(application)
+        
+        # Три пользователя набирают количества: до прохода persistence база не трогается
+        update_id = 0
+        for user_id in (1, 2, 3):
+            for text in ('/start', '1', '2', '3'):
+                update_id += 1
+                await application.process_update(make_update(user_id, text, update_id, application.bot))
+        assert batches == [] and persistence.written == 0
+        
+        await application.update_persistence()
+        await persistence._write_task
+        rows = stored_rows(path, 'user_states')
+        await application.shutdown()
+        return batches, rows
+    
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'sessions.db')
+        batches, rows = asyncio.run(typing(path))
+    
+    # Один проход - одна транзакция: последние версии трех состояний и трех разговоров
+    assert len(batches) == 1
+    users, conversations = batches[0]
+    assert sorted(users) == [1, 2, 3] and len(conversations) == 3
+    assert {user_id: load_user_state(state).current_input for user_id, state, _ in rows} == {1: '123', 2: '123', 3: '123'}
+
+def test_shutdown_flushes_pending_changes():
+    async def stop_before_interval(path: str) -> None:
+        application = build_application(path, CleanPremiumBot())
+        await start_application(application)
+        await application.process_update(make_update(7, '/start', 1, application.bot))
+        await application.process_update(make_update(7, '5', 2, application.bot))
+        assert stored_rows(path, 'user_states') == []
+        await application.shutdown()
+    
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'sessions.db')
+        asyncio.run(stop_before_interval(path))
+        (user_id, state, _), = stored_rows(path, 'user_states')
+        assert user_id == 7 and load_user_state(state).operations == {5: 5.0}
+        assert stored_rows(path, 'conversations') == [(CONVERSATION, '[7, 7]', str(ASKING_OPERATION_QUANTITY))]
+
+def test_sweep_expires_idle_sessions():
+    clock = FakeClock(0.0)
+    user_states = SessionStates(idle_ttl=100.0, max_sessions=10, clock=clock)
+    for user_id, now in ((1, 0.0), (2, 10.0), (3, 20.0)):
+        clock.now = now
+        user_states[user_id] = UserState(position='operator')
+    clock.now = 50.0
+    assert user_states[1].last_active == 50.0
+    
+    # Граница: сессия, не тронутая ровно idle_ttl секунд, удаляется; свежее - остаются
+    clock.now = 110.0
+    assert user_states.sweep() == 1 and list(user_states) == [3, 1]
+    clock.now = 119.9
+    assert user_states.sweep() == 0
+    clock.now = 150.0
+    assert user_states.sweep() == 2 and len(user_states) == 0 and 1 not in user_states
+    assert user_states.stats() == {'sessions': 0, 'approx_bytes_per_session': 0, 'expired': 3, 'evicted': 0}
+
+def test_overflow_evicts_least_recently_active():
+    clock = FakeClock()
+    user_states = SessionStates(max_sessions=2, clock=clock)
+    user_states[1] = UserState(position='operator')
+    clock.now += 1
+    user_states[2] = UserState(position='admin')
+    clock.now += 1
+    user_states[1].current_input = '5'  # обращение поднимает сессию
+    clock.now += 1
+    user_states[3] = UserState(position='postman')
+    assert list(user_states) == [1, 3] and 2 not in user_states
+    
+    stats = user_states.stats()
+    assert stats['sessions'] == 2 and stats['evicted'] == 1 and stats['expired'] == 0
+    assert stats['approx_bytes_per_session'] > 0
+
+def test_sweep_removes_sessions_from_database():
+    async def sweep_and_restart(path: str, clock: FakeClock) -> list:
+        premium_bot = CleanPremiumBot()
+        application = build_application(path, premium_bot, idle_ttl=100.0, clock=clock)
+        user_states = await start_application(application)
+        for update_id, user_id in enumerate((1, 2), 1):
+            await application.process_update(make_update(user_id, '/start', update_id, application.bot))
+            clock.now += 60
+        await application.shutdown()
+        assert sorted(user_id for user_id, _, _ in stored_rows(path, 'user_states')) == [1, 2]
+        
+        # После перезапуска порядок вытеснения - по last_active из базы
+        application = build_application(path, premium_bot, idle_ttl=100.0, clock=clock)
+        user_states = await start_application(application)
+        assert list(user_states) == [1, 2]
+        
+        # Команда вне расчета: приложение заводит пустые user_data, сессии у пользователя нет
+        await application.process_update(make_update(3, '/help', 3, application.bot))
+        await application.update_persistence()
+        assert application.user_data[3] == {} and 3 not in user_states
+        clock.now += 50  # user 1: 170 с без действий, user 2: 110 с
+        assert user_states.sweep() == 2 and 3 not in application.user_data
+        await application.shutdown()
+        return stored_rows(path, 'user_states')
+    
+    with tempfile.TemporaryDirectory() as root:
+        assert asyncio.run(sweep_and_restart(os.path.join(root, 'sessions.db'), FakeClock())) == []
+
+if __name__ == '__main__':
+    test_dump_load_keeps_coefficient_step()
+    test_persistence_round_trip_keeps_coefficient_step()
+    test_conversation_survives_restart()
+    test_pass_is_written_in_one_transaction()
+    test_shutdown_flushes_pending_changes()
+    test_sweep_expires_idle_sessions()
+    test_overflow_evicts_least_recently_active()
+    test_sweep_removes_sessions_from_database()
+    print("✅ Сессии: перезапуск с шага разговора, одна транзакция на проход, запись при остановке,")
+    print("✅ удаление брошенных сессий, вытеснение сверх лимита и удаление из базы")
@@ -0,0 +1,109 @@
+"""
+Проверка перечитывания файла тарифов: отклоненный файл оставляет прежний тариф и
+проверяется снова, файл без изменений содержимого не переустанавливается, после
+подмены тарифа кэш не отдает старый результат, а начатая сессия досчитывается по своему тарифу
+Запуск: python test_tariff_store.py (или pytest)
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+import calculator_v2
+from calculator_v2 import CalculationRequest, PremiumAccumulator, PremiumCalculator, active_tariff, install_tariffs
+from config_v2 import TARIFF_FILE
+from tariff_store import TariffFileWatcher, file_digest
+
+with open(TARIFF_FILE, encoding='utf-8') as _f:
+    TARIFFS_TEXT = _f.read()
+
+def with_sim_rate(value: str) -> str:
+    """Текст файла тарифов с другим тарифом операции 5 (сим-карта, 50₽/шт)"""
+    line = next(line for line in TARIFFS_TEXT.splitlines() if line.strip().startswith('"5":'))
+    return TARIFFS_TEXT.replace(line, line.replace('"value": 50,', f'"value": {value},'))
+
+def write(path: str, text: str, mtime_ns: int) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+@contextmanager
+def restored_tariffs():
+    """Вернуть действующие тарифы после теста, который их подменяет"""
+    saved = calculator_v2._TARIFF_SOURCES, calculator_v2._TARIFF_VERSIONS, calculator_v2._ACTIVE_TIMELINE
+    try:
+        yield
+    finally:
+        calculator_v2._TARIFF_SOURCES, calculator_v2._TARIFF_VERSIONS, calculator_v2._ACTIVE_TIMELINE = saved
+
+def sim_bonus(calculator: PremiumCalculator) -> float:
+    return calculator.calculate(CalculationRequest('operator', 30000.0, 1.0, {5: 1}, {}, {})).operation_bonus
+
+def test_rejected_file_keeps_previous_tariff():
+    with tempfile.TemporaryDirectory() as tmp, restored_tariffs():
+        path = os.path.join(tmp, 'tariffs.json')
+        write(path, TARIFFS_TEXT, 1_000_000_000_000_000_000)
+        watcher = TariffFileWatcher(path, install_tariffs, digest=file_digest(path))
+        
+        write(path, with_sim_rate('60'), 2_000_000_000_000_000_000)
+        assert watcher.check() and active_tariff().operations[5].rate == 60.0
+        
+        # Отрицательный тариф отклоняется; повторный опрос не устанавливает и не считает его снова
+        write(path, with_sim_rate('-5'), 3_000_000_000_000_000_000)
+        assert not watcher.check() and not watcher.check()
+        assert watcher.failures == 1 and active_tariff().operations[5].rate == 60.0
+        
+        # Исправленный файл того же размера с тем же временем изменения (грубая точность mtime)
+        # все равно устанавливается: подпись отклоненного файла не запоминалась
+        write(path, with_sim_rate('70'), 3_000_000_000_000_000_000)
+        assert watcher.check() and active_tariff().operations[5].rate == 70.0
+        assert watcher.reloads == 2
+        
+        # Файл недоступен - тариф прежний, после восстановления изменения подхватываются
+        os.remove(path)
+        assert not watcher.check() and active_tariff().operations[5].rate == 70.0
+        write(path, with_sim_rate('80'), 4_000_000_000_000_000_000)
+        assert watcher.check() and active_tariff().operations[5].rate == 80.0
+
+def test_unchanged_content_is_not_reinstalled():
+    installed = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tariffs.json')
+        write(path, TARIFFS_TEXT, 1_000_000_000_000_000_000)
+        watcher = TariffFileWatcher(path, installed.append, digest=file_digest(path))
+        
+        # Файл переписан с тем же содержимым: новое время изменения, установки нет
+        write(path, TARIFFS_TEXT, 2_000_000_000_000_000_000)
+        assert not watcher.check() and not watcher.check()
+        assert installed == [] and watcher.reloads == 0 and watcher.failures == 0
+        
+        write(path, with_sim_rate('60'), 3_000_000_000_000_000_000)
+        assert watcher.check() and not watcher.check()
+        assert len(installed) == 1 and installed[0]['operations'][5]['value'] == 60
+
+def test_reload_is_not_served_from_cache():
+    with tempfile.TemporaryDirectory() as tmp, restored_tariffs():
+        path = os.path.join(tmp, 'tariffs.json')
+        write(path, TARIFFS_TEXT, 1_000_000_000_000_000_000)
+        watcher = TariffFileWatcher(path, install_tariffs, digest=file_digest(path))
+        calculator = PremiumCalculator(cache_size=16)
+        session = PremiumAccumulator('operator', calculator.for_date('2024-01-01'))
+        session.set_quantity(5, 1)
+        assert sim_bonus(calculator) == 50.0 and session.operation_bonus == 50.0
+        
+        write(path, with_sim_rate('60'), 2_000_000_000_000_000_000)
+        assert watcher.check()
+        assert sim_bonus(calculator) == 60.0
+        
+        # Сессия, начатая до подмены, досчитывается по тарифу, с которым начата
+        session.set_quantity(5, 2)
+        assert session.operation_bonus == 100.0
+        assert sim_bonus(session.calculator) == 50.0
+
+if __name__ == '__main__':
+    test_rejected_file_keeps_previous_tariff()
+    test_unchanged_content_is_not_reinstalled()
+    test_reload_is_not_served_from_cache()
+    print("✅ Файл тарифов: отклонение, файл без изменений, кэш и сессии после подмены")
@@ -0,0 +1,161 @@
+"""
+Проверка версий тарифа по датам: границы интервалов (до первой версии, в день вступления
+в силу, между версиями), наложение частичных разделов на базовый тариф, пакетный расчет
+с датами строк и версия тарифа месяца в архиве
+Запуск: python test_tariff_timeline.py (или pytest)
+"""
+
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import date
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+import payroll
+from calculator_v2 import (
+    CalculationRequest, PremiumCalculator, active_tariff, apply_tariff_version, base_tariff_sources,
+    refresh_compiled_tariff, tariff_date, tariff_timeline, tariff_versions
+)
+from premium_archive import PremiumArchive
+from test_batch_parity import batch_inputs, column_order, make_rows, scalar
+from test_payroll import write_csv
+from test_premium_archive import monthly_rows
+
+VERSIONS = [
+    {'effective_from': '2024-02-01', 'operations': {5: {'value': 60}}},
+    {'effective_from': '2024-03-15', 'operations': {12: {'value': 7}}, 'kpi_weights': {
+        'admin': {'revenue': 0.5, 'csi': 0.3, 'online_rpo': 0.2}
+    }}
+]
+
+@contextmanager
+def dated_versions(versions: list):
+    """Временно задать версии действующего тарифа (список меняется на месте)"""
+    active = tariff_versions()
+    saved = list(active)
+    active[:] = versions
+    try:
+        refresh_compiled_tariff()
+        yield tariff_timeline()
+    finally:
+        active[:] = saved
+        refresh_compiled_tariff()
+
+def operation_bonus(calculator: PremiumCalculator, operations: dict) -> float:
+    return calculator.calculate(CalculationRequest('operator', 30000.0, 1.0, operations, {}, {})).operation_bonus
+
+def test_interval_boundaries():
+    with dated_versions(VERSIONS) as timeline:
+        assert timeline.starts == ('2024-02-01', '2024-03-15')
+        assert timeline.tariffs[0] is active_tariff()
+        cases = (
+            ('2023-12-31', 0), ('2024-01-31', 0),            # до первой версии - базовый тариф
+            ('2024-02-01', 1), ('01.02.2024', 1),             # в день вступления в силу - новая версия
+            ('2024-02', 1), ('2024-03-14', 1), ('2024-03', 1),  # между версиями
+            ('2024-03-15', 2), (date(2030, 1, 1), 2)          # после последней
+        )
+        for when, index in cases:
+            assert timeline.index(when) == index, when
+            assert timeline.at(when) is timeline.tariffs[index], when
+        assert timeline.index_array(['2024-01', '', '2024-03-15', '2024-01']).tolist() == [0, -1, 2, 0]
+        
+        calculator = PremiumCalculator()
+        bonuses = [operation_bonus(calculator.for_date(when), {5: 1, 12: 1}) for when in
+                   ('2024-01-31', '2024-02-01', '2024-03-14', '2024-03-15')]
+        assert bonuses == [55.0, 65.0, 65.0, 67.0]
+    
+    # Без версий - один тариф на любую дату
+    assert tariff_timeline().starts == () and tariff_timeline().at('1990-01-01') is active_tariff()
+
+def test_partial_version_merges_over_base():
+    base = base_tariff_sources()
+    merged = apply_tariff_version(base, {'effective_from': '2024-02-01', 'operations': {5: {'value': 60}},
+                                         'pvz_wb': {'rating_thresholds': [4.8, 5.0]}})
+    
+    # Изменено только указанное поле одной операции, остальные поля и операции - из базы
+    assert merged['operations'][5] == {**base['operations'][5], 'value': 60}
+    assert all(merged['operations'][op_id] == config for op_id, config in base['operations'].items() if op_id != 5)
+    assert merged['pvz_wb'] == {**base['pvz_wb'], 'rating_thresholds': [4.8, 5.0]}
+    for section in ('kpi_weights', 'kpi_thresholds', 'team_coefficient_thresholds'):
+        assert merged[section] is base[section], section
+    assert base['operations'][5]['value'] == 50  # база не меняется
+    
+    # Следующая версия накладывается на предыдущую, а не на базу
+    with dated_versions(VERSIONS) as timeline:
+        latest = timeline.tariffs[2]
+        assert latest.operations[5].rate == 60.0 and latest.operations[12].rate == 7.0
+        assert latest.operations[5].slot == active_tariff().operations[5].slot
+        assert latest.kpi_weights['admin'] == {'revenue': 0.5, 'csi': 0.3, 'online_rpo': 0.2}
+        assert latest.kpi_weights['nops_operational'] == active_tariff().kpi_weights['nops_operational']
+
+def test_invalid_versions():
+    for versions in (
+        [{'effective_from': '2024-02-01', 'rates': {}}],
+        [{'effective_from': '2024-02-01', 'operations': {999: {'value': 1}}}],
+        [{'effective_from': '2024-03-01'}, {'effective_from': '2024-02-01'}],
+        [{'effective_from': '2024-03-01'}, {'effective_from': '2024-03-01'}]
+    ):
+        try:
+            with dated_versions(versions):
+                pass
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Версии {versions!r} должны вызывать ValueError")
+    assert tariff_timeline().starts == ()
+    
+    for value in ('2024-13', '31.02.2024', 'март'):
+        try:
+            tariff_date(value)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Дата {value!r} должна вызывать ValueError")
+
+def test_batch_dates_match_for_date():
+    # Строки разных версий в одном пакете совпадают со скалярным расчетом по тарифу своей даты
+    rng = random.Random(21)
+    dates = ('2024-01-10', '2024-02', '2024-03-15', '')
+    with dated_versions(VERSIONS):
+        for money_mode in ('float', 'kopeck'):
+            calculator = PremiumCalculator(money_mode=money_mode)
+            for position in ('operator', 'admin'):
+                rows = make_rows(position, 200, rng)
+                row_dates = [rng.choice(dates) for _ in rows]
+                batch = calculator.calculate_premium_batch(**batch_inputs(position, rows), dates=row_dates)
+                for i, (row, when) in enumerate(zip(rows, row_dates)):
+                    dated = calculator.for_date(when) if when else calculator
+                    result = scalar(dated, position, row, column_order(row['operations']))
+                    assert batch.total_premium[i] == result.total_premium, (position, when, row)
+                    assert batch.kpi_bonus[i] == result.kpi_bonus, (position, when, row)
+                
+                try:
+                    calculator.calculate_premium_batch(**batch_inputs(position, rows), dates=row_dates[1:])
+                except ValueError:
+                    pass
+                else:
+                    raise AssertionError("Столбец дат другой длины должен вызывать ValueError")
+
+def test_archive_version_per_month():
+    with tempfile.TemporaryDirectory() as tmp, dated_versions(VERSIONS) as timeline:
+        path, output, root = (os.path.join(tmp, name) for name in ('employees.csv', 'premiums.csv', 'archive'))
+        write_csv(path, monthly_rows(300, 22))
+        payroll.run(path, output, 2, 'kopeck', archive_root=root)
+        archive = PremiumArchive(root)
+        versions = {month: archive.month(month).metadata['config_version'] for month in archive.months()}
+        assert versions == {
+            '2024-01': timeline.tariffs[0].version,
+            '2024-02': timeline.tariffs[1].version,
+            '2024-03': timeline.tariffs[1].version
+        }
+        assert len(set(tariff.version for tariff in timeline.tariffs)) == 3
+
+if __name__ == '__main__':
+    test_interval_boundaries()
+    test_partial_version_merges_over_base()
+    test_invalid_versions()
+    test_batch_dates_match_for_date()
+    test_archive_version_per_month()
+    print("✅ Версии тарифа: границы дат, частичные версии, пакет с датами, версия месяца в архиве")
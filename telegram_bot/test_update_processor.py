@@ -0,0 +1,130 @@
+"""
+Проверка параллельной обработки обновлений: обновления одного пользователя идут строго по
+очереди в порядке поступления, разных пользователей - одновременно, число работающих
+обработчиков не превышает лимит, глубина очередей считается и очищается
+Запуск: python test_update_processor.py (или pytest)
+"""
+
+import asyncio
+import random
+
+from telegram import Update
+
+from update_processor import PerUserUpdateProcessor
+
+def make_update(user_id: int, update_id: int) -> Update:
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 1700000000, 'text': str(update_id),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Тест'}
+    }}, None)
+
+def submit(processor: PerUserUpdateProcessor, user_id: int, update_id: int, coroutine) -> asyncio.Task:
+    """Обновление в обработку, как из Application.process_update"""
+    return asyncio.create_task(processor.process_update(make_update(user_id, update_id), coroutine))
+
+def test_per_user_order():
+    async def run() -> dict:
+        processor = PerUserUpdateProcessor(max_concurrent=4)
+        rng = random.Random(25)
+        log = {user_id: [] for user_id in (1, 2, 3)}
+        
+        async def handler(user_id: int, update_id: int) -> None:
+            log[user_id].append(('start', update_id))
+            await asyncio.sleep(rng.uniform(0, 0.005))
+            log[user_id].append(('end', update_id))
+        
+        tasks = []
+        for update_id in range(60):
+            user_id = rng.choice(list(log))
+            tasks.append(submit(processor, user_id, update_id, handler(user_id, update_id)))
+        await asyncio.gather(*tasks)
+        return log
+    
+    for user_id, events in asyncio.run(run()).items():
+        # Следующее обновление пользователя начинается только после окончания предыдущего
+        update_ids = [update_id for kind, update_id in events[::2]]
+        assert events == [(kind, update_id) for update_id in update_ids for kind in ('start', 'end')], user_id
+        assert update_ids == sorted(update_ids), user_id
+
+def test_users_overlap():
+    async def run() -> None:
+        processor = PerUserUpdateProcessor(max_concurrent=2)
+        answered = asyncio.Event()
+        
+        async def slow() -> None:
+            # Ждет ответа другому пользователю: без параллельной обработки - тайм-аут
+            await asyncio.wait_for(answered.wait(), timeout=1.0)
+        
+        async def fast() -> None:
+            answered.set()
+        
+        # Очередь пользователя 1 не занимает второй слот: пользователь 2 обслуживается сразу
+        backlog = [submit(processor, 1, update_id, slow()) for update_id in range(3)]
+        await asyncio.sleep(0)
+        await submit(processor, 2, 3, fast())
+        await asyncio.gather(*backlog)
+    
+    asyncio.run(run())
+
+def test_concurrency_bound():
+    async def run() -> tuple:
+        processor = PerUserUpdateProcessor(max_concurrent=3)
+        running = peak = 0
+        
+        async def handler() -> None:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            assert processor.running == running <= processor.max_concurrent
+            await asyncio.sleep(0.002)
+            running -= 1
+        
+        await asyncio.gather(*(submit(processor, user_id, user_id, handler()) for user_id in range(20)))
+        return peak, processor.stats()
+    
+    peak, stats = asyncio.run(run())
+    assert peak == 3
+    assert stats['processed'] == 20 and stats['peak_pending'] == 20
+    assert stats['running'] == stats['pending'] == stats['users'] == 0
+    
+    for max_concurrent, max_pending in ((0, 10), (11, 10)):
+        try:
+            PerUserUpdateProcessor(max_concurrent, max_pending)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Лимиты {max_concurrent}/{max_pending} должны вызывать ValueError")
+
+def test_queue_depth():
+    async def run() -> None:
+        processor = PerUserUpdateProcessor(max_concurrent=4)
+        release = asyncio.Event()
+        
+        async def blocked() -> None:
+            await release.wait()
+        
+        tasks = [submit(processor, 1, update_id, blocked()) for update_id in range(3)]
+        tasks.append(submit(processor, 2, 3, blocked()))
+        await asyncio.sleep(0.01)
+        
+        # Пользователь 1: одно обновление в работе и два в очереди
+        assert processor.depth(1) == 3 and processor.depth(2) == 1 and processor.depth(3) == 0
+        assert processor.stats() == {
+            'pending': 4, 'running': 2, 'users': 2, 'max_user_depth': 3, 'peak_pending': 4, 'processed': 0
+        }
+        
+        release.set()
+        await asyncio.gather(*tasks)
+        assert processor.depth(1) == 0 and processor.stats()['users'] == 0
+        # Опустевшие очереди забываются
+        assert processor._locks == {}
+    
+    asyncio.run(run())
+
+if __name__ == '__main__':
+    test_per_user_order()
+    test_users_overlap()
+    test_concurrency_bound()
+    test_queue_depth()
+    print("✅ Обновления: порядок на пользователя, параллельность, лимит обработчиков, глубина очередей")
@@ -0,0 +1,66 @@
+"""
+Проверка запуска clean_bot.main: режим webhook передает в Application.run_webhook адрес,
+порт, путь, публичный URL и секретный токен; без адреса webhook - long polling.
+Приложение собирается с SQLite-сессиями, AIORateLimiter и очередями обновлений на пользователя
+Запуск: python test_webhook.py (или pytest)
+"""
+
+import os
+import re
+from contextlib import contextmanager
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+
+from telegram import Update
+from telegram.ext import AIORateLimiter, Application
+
+import clean_bot
+from session_store import SqlitePersistence
+from update_processor import PerUserUpdateProcessor
+
+@contextmanager
+def captured_runs():
+    """Подменить run_webhook и run_polling: записать приложение и аргументы вместо запуска"""
+    runs = []
+    saved = Application.run_webhook, Application.run_polling
+    Application.run_webhook = lambda application, **kwargs: runs.append(('webhook', application, kwargs))
+    Application.run_polling = lambda application, **kwargs: runs.append(('polling', application, kwargs))
+    try:
+        yield runs
+    finally:
+        Application.run_webhook, Application.run_polling = saved
+
+def test_webhook_wiring():
+    with captured_runs() as runs:
+        clean_bot.main(['--webhook', 'https://bot.example.com/tg/hook', '--listen', '0.0.0.0', '--port', '8443'])
+        clean_bot.main(['--webhook', 'https://bot.example.com/tg/hook'])
+    (mode, application, kwargs), (_, _, defaults) = runs
+    assert mode == 'webhook'
+    assert {name: kwargs[name] for name in ('listen', 'port', 'url_path', 'webhook_url', 'allowed_updates')} == {
+        'listen': '0.0.0.0',
+        'port': 8443,
+        'url_path': 'tg/hook',
+        'webhook_url': 'https://bot.example.com/tg/hook',
+        'allowed_updates': Update.ALL_TYPES
+    }
+    assert (defaults['listen'], defaults['port']) == (clean_bot.WEBHOOK_LISTEN, clean_bot.WEBHOOK_PORT)
+    
+    # Без WEBHOOK_SECRET - случайный токен на каждый запуск (символы, допустимые Telegram)
+    assert re.fullmatch(r'[A-Za-z0-9_-]{32,256}', kwargs['secret_token'])
+    assert kwargs['secret_token'] != defaults['secret_token']
+    
+    assert isinstance(application.persistence, SqlitePersistence)
+    assert isinstance(application.bot.rate_limiter, AIORateLimiter)
+    assert isinstance(application.update_processor, PerUserUpdateProcessor)
+    assert application.update_processor.max_concurrent == clean_bot.UPDATE_CONCURRENCY
+    assert application.post_init is not None and application.post_shutdown is not None
+
+def test_polling_without_webhook_url():
+    with captured_runs() as runs:
+        clean_bot.main(['--webhook', ''])
+    assert [mode for mode, _, _ in runs] == ['polling']
+
+if __name__ == '__main__':
+    test_webhook_wiring()
+    test_polling_without_webhook_url()
+    print("✅ Запуск: webhook через Application.run_webhook, без адреса - long polling")
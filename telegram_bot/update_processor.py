@@ -0,0 +1,103 @@
+"""
+Параллельная обработка обновлений с сохранением порядка для каждого пользователя
+(BaseUpdateProcessor python-telegram-bot). Обновления разных пользователей обрабатываются
+одновременно, обновления одного пользователя - строго по очереди, в порядке поступления:
+шаги опросника и ConversationHandler не перемешиваются.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+DEFAULT_MAX_CONCURRENT = 16
+DEFAULT_MAX_PENDING = 1024
+
+def update_key(update: object) -> Optional[int]:
+    """Ключ очереди: пользователь, без него - чат (None - обновление вне очередей)"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Очередь на пользователя (asyncio.Lock отдает очередь в порядке ожидания) и общий лимит обработчиков
+    
+    Лимит PTB (max_pending) ограничивает все принятые обновления, включая ждущие своей очереди;
+    слот из max_concurrent занимается только после очереди пользователя - поток сообщений
+    одного пользователя не занимает слоты остальных.
+    """
+    
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT, max_pending: int = DEFAULT_MAX_PENDING):
+        if not 1 <= max_concurrent <= max_pending:
+            raise ValueError("Нужно 1 <= max_concurrent <= max_pending")
+        super().__init__(max_pending)
+        self.max_concurrent = max_concurrent
+        self._slots = asyncio.BoundedSemaphore(max_concurrent)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # Глубина очереди по ключам: ждущие и обрабатываемые обновления
+        self._depth: Dict[int, int] = {}
+        self.pending = 0
+        self.running = 0
+        self.peak_pending = 0
+        self.processed = 0
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_key(update)
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            if key is None:
+                await self._run(coroutine)
+                return
+            
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = asyncio.Lock()
+            self._depth[key] = self._depth.get(key, 0) + 1
+            try:
+                async with lock:
+                    await self._run(coroutine)
+            finally:
+                self._depth[key] -= 1
+                if not self._depth[key]:
+                    # Очередь пуста - забываем пользователя
+                    del self._depth[key]
+                    del self._locks[key]
+        finally:
+            self.pending -= 1
+    
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        """Обработка в одном из max_concurrent слотов"""
+        async with self._slots:
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.processed += 1
+    
+    def depth(self, key: int) -> int:
+        """Глубина очереди пользователя (ждущие и обрабатываемое обновления)"""
+        return self._depth.get(key, 0)
+    
+    def stats(self) -> Dict[str, int]:
+        """Показатели очередей: всего в обработке и ожидании, работает, пользователей в очереди"""
+        return {
+            'pending': self.pending,
+            'running': self.running,
+            'users': len(self._depth),
+            'max_user_depth': max(self._depth.values(), default=0),
+            'peak_pending': self.peak_pending,
+            'processed': self.processed
+        }